@@ -1,16 +1,14 @@
-from fastapi import APIRouter, Depends, Response, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, Header, Response, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import List, Dict, Any
-import json
-import os
 from pathlib import Path
 
 from ...schemas.auth import User
 from ...services.auth import get_current_user
+from ...services import file_sd, http_cache
 
 router = APIRouter()
 
-FILE_SD_DIR = "/etc/prometheus/file_sd"  # mounted into Prometheus container
 # In container, this file lives at /app/app/api/v1/routes_agents.py, so resources are at parents[2]/resources/agent
 ASSETS_DIR = Path(__file__).resolve().parents[2] / "resources" / "agent"
 VERSIONS_DIR = ASSETS_DIR / "versions"
@@ -26,63 +24,52 @@ class AgentRegisterReq(BaseModel):
 
 @router.post('/register')
 async def register_agent(req: AgentRegisterReq, current: User = Depends(get_current_user)):
-    # Merge endpoints per tenant so multiple agents/services can coexist
-    os.makedirs(FILE_SD_DIR, exist_ok=True)
-    path = os.path.join(FILE_SD_DIR, f"{req.tenant}.json")
-    existing: list[dict] = []
-    if os.path.exists(path):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                existing = json.load(f) or []
-        except Exception:
-            existing = []
-    def key_of(item: dict) -> tuple:
-        labels = item.get('labels', {}) or {}
-        # Stable key: tuple of sorted label items
-        return tuple(sorted(labels.items()))
-
-    merged: dict[tuple, dict] = {key_of(it): it for it in existing if isinstance(it, dict)}
-    for t in req.endpoints:
-        item = {
-            "labels": {"job": t.job, **(t.labels or {})},
-            "targets": t.targets,
-        }
-        merged[key_of(item)] = item
-    payload = list(merged.values())
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(payload, f)
-    return {"ok": True, "file": path, "count": len(payload)}
+    # Merge endpoints per tenant so multiple agents/services can coexist; the
+    # tenant's file_sd file is rewritten shortly after, in the background
+    items = [{"labels": {"job": t.job, **(t.labels or {})}, "targets": t.targets} for t in req.endpoints]
+    count = await file_sd.register(req.tenant, items)
+    return {"ok": True, "file": file_sd.path_of(req.tenant), "count": count}
+
+
+def _asset(p: Path, media_type: str, if_none_match: str | None) -> Response:
+    # Validator from the file's identity (path, mtime, size): a fleet polling for
+    # updates gets a 304 without the file being read
+    st = p.stat()
+    tag = http_cache.etag(str(p), st.st_mtime_ns, st.st_size)
+    if http_cache.matches(if_none_match, tag):
+        return http_cache.not_modified(tag)
+    return http_cache.tagged(Response(p.read_bytes(), media_type=media_type), tag)
 
 
 @router.get('/assets/agent.py')
-async def get_agent_py():
+async def get_agent_py(if_none_match: str | None = Header(None)):
     # Serve the default version if configured; fallback to embedded agent.py
     default_ver = (VERSIONS_DIR / 'default.txt').read_text(encoding='utf-8').strip() if (VERSIONS_DIR / 'default.txt').exists() else ''
     if default_ver:
         vp = VERSIONS_DIR / default_ver / 'agent.py'
         if vp.exists():
-            return Response(vp.read_text(encoding='utf-8'), media_type='text/x-python')
+            return _asset(vp, 'text/x-python', if_none_match)
     p = ASSETS_DIR / 'agent.py'
     if not p.exists():
         raise HTTPException(status_code=404, detail="agent.py not found")
-    return Response(p.read_text(encoding='utf-8'), media_type='text/x-python')
+    return _asset(p, 'text/x-python', if_none_match)
 
 
 @router.get('/assets/agent.yaml')
-async def get_agent_yaml():
+async def get_agent_yaml(if_none_match: str | None = Header(None)):
     p = ASSETS_DIR / 'agent.yaml'
     if not p.exists():
         raise HTTPException(status_code=404, detail="agent.yaml not found")
-    return Response(p.read_text(encoding='utf-8'), media_type='text/yaml')
+    return _asset(p, 'text/yaml', if_none_match)
 
 
 @router.get('/install.sh')
-async def get_install_script():
+async def get_install_script(if_none_match: str | None = Header(None)):
     p = ASSETS_DIR / 'bootstrap.sh'
     if not p.exists():
         raise HTTPException(status_code=404, detail="bootstrap not found")
     # Render as shell script with executable content
-    return Response(p.read_text(encoding='utf-8'), media_type='text/x-sh')
+    return _asset(p, 'text/x-sh', if_none_match)
 
 
 # ----- Version management -----
@@ -160,13 +147,13 @@ async def set_default_version(req: SetDefaultReq, current: User = Depends(get_cu
 
 
 @router.get('/assets/{version}/agent.py')
-async def get_versioned_agent(version: str):
+async def get_versioned_agent(version: str, if_none_match: str | None = Header(None)):
     if version != 'v1':
         raise HTTPException(status_code=404, detail='only v1 is available')
     p = VERSIONS_DIR / version / 'agent.py'
     if not p.exists():
         raise HTTPException(status_code=404, detail='agent.py not found for version')
-    return Response(p.read_text(encoding='utf-8'), media_type='text/x-python')
+    return _asset(p, 'text/x-python', if_none_match)
 
 
 @router.post('/versions/upload')
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from ...schemas.auth import Token, User
-from ...services.auth import login_service, get_current_user
+from ...schemas.auth import ApiTokenReq, RefreshReq, Token, User
+from ...services.auth import api_token_service, get_current_user, get_session_user, login_service, refresh_service
 
 router = APIRouter()
 
@@ -11,6 +11,17 @@ async def login(form: OAuth2PasswordRequestForm = Depends()):
     return await login_service(form)
 
 
+@router.post("/token/refresh", response_model=Token)
+async def refresh(body: RefreshReq):
+    return await refresh_service(body.refresh_token)
+
+
+@router.post("/api-token", response_model=Token)
+async def api_token(body: ApiTokenReq | None = None, current: User = Depends(get_session_user)):
+    # Long-lived token for SDKs and agents
+    return api_token_service(current, body.ttl_days if body else None)
+
+
 @router.get("/me", response_model=User)
 async def me(current: User = Depends(get_current_user)):
     return current
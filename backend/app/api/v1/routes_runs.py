@@ -1,29 +1,228 @@
-from fastapi import APIRouter, Depends, HTTPException
+from functools import partial
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from ...schemas.auth import User
+from ...schemas.runs import ReplayReq
 from ...services.auth import get_current_user
+from ...services import artifacts, encoding, http_cache
 from ...services import runs as run_svc
 
 router = APIRouter()
 
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_interval(text: str) -> float:
+    # "10s", "500ms", "5m", "1h", "1d" or plain seconds
+    num = text.rstrip("abcdefghijklmnopqrstuvwxyz")
+    try:
+        seconds = float(num) * _UNITS[text[len(num):] or "s"]
+    except (KeyError, ValueError):
+        seconds = 0
+    if not seconds > 0:
+        raise HTTPException(422, detail=f"invalid interval: {text!r}")
+    return seconds
+
+
+async def _conditional(request: Request, run_id: int, name: str | None, fmt: str, accept_encoding: str | None,
+                       if_none_match: str | None, produce) -> Response:
+    # ETag from the data version (series point count, or log end for name=None)
+    # and the request; 304 on a match, and finished runs are served from the
+    # response cache. produce() returns the body to render.
+    version, finished = await run_svc.data_version(run_id, name)
+    tag = http_cache.etag(request.url.path, version, str(request.query_params), fmt, accept_encoding)
+    if http_cache.matches(if_none_match, tag):
+        return http_cache.not_modified(tag)
+    cached = http_cache.responses.get(tag) if finished else None
+    if cached is not None:
+        return http_cache.tagged(cached, tag)
+    response = http_cache.tagged(await encoding.render(await produce(), fmt, accept_encoding), tag)
+    if finished:
+        http_cache.responses.put(tag, response)
+    return response
+
 
 @router.get("")
-async def list_runs(current: User = Depends(get_current_user)):
-    return run_svc.list_runs_for_tenant(current.tenant)
+async def list_runs(
+    request: Request,
+    response: Response,
+    status: str | None = None,
+    framework: str | None = None,
+    cursor: int | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    order: Literal["asc", "desc"] = "asc",
+    summary: str | None = Query(None, description="metric names (comma separated) or * to attach summaries for"),
+    current: User = Depends(get_current_user),
+):
+    # Filters: status, framework and any number of tag.<key>=<value> (or =* for
+    # "has key"). The body stays a plain list; the next page cursor is returned
+    # in the X-Next-Cursor header when limit is set.
+    filters = {k: v for k, v in request.query_params.items() if k.startswith("tag.")}
+    if status:
+        filters["status"] = status
+    if framework:
+        filters["framework"] = framework
+    names = [n for n in summary.split(",") if n] if summary else None
+    runs, next_cursor = await run_svc.page_runs_for_tenant(current.tenant, filters, cursor, limit, order == "desc", names)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return runs
+
+
+@router.get("/stream")
+async def stream_metrics(series: List[str] = Query(..., description="run_id:metric_name, repeatable"),
+                         current: User = Depends(get_current_user)):
+    # Live metric points over SSE for several (run, metric) pairs at once
+    pairs = []
+    for item in series:
+        rid, _, name = item.partition(":")
+        if not rid.isdigit() or not name:
+            raise HTTPException(400, detail=f"bad series '{item}', expected run_id:name")
+        if not await run_svc.get_run_for_tenant(int(rid), current.tenant):
+            raise HTTPException(404, detail=f"Run {rid} not found")
+        pairs.append((int(rid), name))
+    return StreamingResponse(
+        run_svc.follow_metrics(pairs),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/compare")
+async def compare_runs(
+    ids: List[str] = Query(..., description="run ids, comma separated or repeated"),
+    name: str = "loss",
+    by: Literal["step", "epoch", "time"] = "step",
+    points: int = Query(500, ge=2, le=10000),
+    x_from: float | None = Query(None, alias="from"),
+    x_to: float | None = Query(None, alias="to"),
+    smooth: float = Query(0.0, ge=0.0, lt=1.0, description="EMA weight, 0 disables"),
+    current: User = Depends(get_current_user),
+):
+    run_ids = []
+    for part in ",".join(ids).split(","):
+        if not part.strip().isdigit():
+            raise HTTPException(400, detail=f"bad run id '{part}'")
+        rid = int(part)
+        if not await run_svc.get_run_for_tenant(rid, current.tenant):
+            raise HTTPException(404, detail=f"Run {rid} not found")
+        run_ids.append(rid)
+    return await run_svc.compare_runs(run_ids, name, by, points, x_from, x_to, smooth)
 
 
 @router.get("/{run_id}")
 async def get_run(run_id: int, current: User = Depends(get_current_user)):
-    r = run_svc.get_run_for_tenant(run_id, current.tenant)
+    r = await run_svc.get_run_for_tenant(run_id, current.tenant)
     if not r:
         raise HTTPException(404, detail="Run not found")
     return r
 
 
+@router.post("/{run_id}/replay")
+async def run_replay(run_id: int, body: ReplayReq | None = None, current: User = Depends(get_current_user)):
+    # Metrics, logs and run events of a time window as one NDJSON stream in ts order
+    run = await run_svc.get_run_for_tenant(run_id, current.tenant)
+    if not run:
+        raise HTTPException(404, detail="Run not found")
+    body = body or ReplayReq()
+    return StreamingResponse(
+        run_svc.replay_run(run, body.ts_from, body.ts_to, body.metrics, body.logs, body.level),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/{run_id}/summary")
+async def run_summary(run_id: int, name: List[str] | None = Query(None), current: User = Depends(get_current_user)):
+    # count, last, min/max (with their steps), mean, var/std and EMA per metric
+    if not await run_svc.get_run_for_tenant(run_id, current.tenant):
+        raise HTTPException(404, detail="Run not found")
+    return await run_svc.get_run_summary(run_id, name)
+
+
+@router.get("/{run_id}/artifacts")
+async def run_artifacts(run_id: int, current: User = Depends(get_current_user)):
+    # filename -> sha256, size, type and blob key of the run's artifacts
+    if not await run_svc.get_run_for_tenant(run_id, current.tenant):
+        raise HTTPException(404, detail="Run not found")
+    return await run_svc.artifact_index(run_id)
+
+
+@router.get("/{run_id}/artifacts/{name:path}")
+async def run_artifact(run_id: int, name: str, range: str | None = Header(None),
+                       if_none_match: str | None = Header(None), current: User = Depends(get_current_user)):
+    # The file's bytes, streamed, with single-range reads (206) and its sha256 as ETag
+    if not await run_svc.get_run_for_tenant(run_id, current.tenant):
+        raise HTTPException(404, detail="Run not found")
+    artifact = (await run_svc.artifact_index(run_id))["artifacts"].get(name)
+    if artifact is None:
+        raise HTTPException(404, detail="Artifact not found")
+    return await artifacts.download(artifact, range, if_none_match)
+
+
 @router.get("/{run_id}/metrics")
-async def run_metrics(run_id: int, name: str = "loss", by: str = "step", current: User = Depends(get_current_user)):
-    return run_svc.get_run_metrics(run_id, name, by)
+async def run_metrics(
+    request: Request,
+    run_id: int,
+    name: str = "loss",
+    by: str = "step",
+    max_points: int | None = Query(None, ge=3, le=100000),
+    x_from: float | None = Query(None, alias="from"),
+    x_to: float | None = Query(None, alias="to"),
+    method: Literal["lttb", "minmax"] = "lttb",
+    since_step: int | None = None,
+    since_ts: float | None = None,
+    interval: str | None = Query(None, description="bucket width for by=time, e.g. 500ms, 10s, 5m, 1h"),
+    agg: Literal["last", "mean", "max", "count"] = "last",
+    accept: str | None = Header(None),
+    accept_encoding: str | None = Header(None),
+    if_none_match: str | None = Header(None),
+    current: User = Depends(get_current_user),
+):
+    # Accept selects the row (default), columnar JSON or msgpack encoding. The
+    # tenant check comes before the validators, so a cached body never answers
+    # another tenant.
+    if not await run_svc.get_run_for_tenant(run_id, current.tenant):
+        raise HTTPException(404, detail="Run not found")
+    seconds = None
+    if interval is not None:
+        seconds = _parse_interval(interval)
+        if by != "time":
+            raise HTTPException(422, detail="interval requires by=time")
+    fmt = encoding.negotiate(accept)
+    produce = partial(run_svc.get_run_metrics, run_id, name, by, max_points, x_from, x_to, method, since_step, since_ts,
+                      seconds, agg, columns=fmt != encoding.JSON)
+    return await _conditional(request, run_id, name, fmt, accept_encoding, if_none_match, produce)
 
 
 @router.get("/{run_id}/logs")
-async def run_logs(run_id: int, query: str | None = None, follow: bool = False, current: User = Depends(get_current_user)):
-    return run_svc.get_run_logs(run_id, query, follow)
+async def run_logs(
+    request: Request,
+    run_id: int,
+    query: str | None = None,
+    follow: bool = False,
+    level: str | None = None,
+    ts_from: int | None = Query(None, alias="from"),
+    ts_to: int | None = Query(None, alias="to"),
+    cursor: int | None = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    last_event_id: int | None = Header(None),
+    accept: str | None = Header(None),
+    accept_encoding: str | None = Header(None),
+    if_none_match: str | None = Header(None),
+    current: User = Depends(get_current_user),
+):
+    if not await run_svc.get_run_for_tenant(run_id, current.tenant):
+        raise HTTPException(404, detail="Run not found")
+    if follow:
+        # Server-Sent Events; a reconnecting EventSource resumes from Last-Event-ID
+        start = cursor if cursor is not None else last_event_id
+        return StreamingResponse(
+            run_svc.follow_logs(run_id, query, level, start),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    fmt = encoding.negotiate(accept)
+    produce = partial(run_svc.get_run_logs, run_id, query, follow, level, ts_from, ts_to, cursor or 0, limit,
+                      columns=fmt != encoding.JSON)
+    return await _conditional(request, run_id, None, fmt, accept_encoding, if_none_match, produce)
@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, UploadFile, File
+import base64
+import hashlib
+import hmac
+import json
+import re
+from typing import AsyncIterator, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, Request, HTTPException
+from multipart.multipart import MultipartParser, parse_options_header
+from pydantic import TypeAdapter, ValidationError
 from ...schemas.auth import User
-from ...schemas.sdk import SDKStartReq, SDKMetricReq, SDKLogReq, SDKTraceReq, SDKFinishReq
+from ...schemas.sdk import SDKStartReq, SDKMetricReq, SDKLogReq, SDKTraceReq, SDKFinishReq, SDKArtifactRefReq
 from ...services.auth import get_current_user
 from ...services import runs as run_svc
 from ...services import storage as storage_svc
+from ...services import ratelimit, telemetry
+from ... import repositories
 from ...core.config import settings
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(ratelimit.sdk_limit)])
+
+MetricBatch = TypeAdapter(List[SDKMetricReq])
+LogBatch = TypeAdapter(List[SDKLogReq])
 
 
 @router.post("/start")
@@ -14,49 +27,397 @@ async def sdk_start(body: SDKStartReq, current: User = Depends(get_current_user)
     if current.tenant != body.tenant:
         from fastapi import HTTPException
         raise HTTPException(403, detail="Tenant mismatch")
-    run_id = run_svc.create_run(current.tenant, body.run_name, body.framework or "unknown", body.tags or {})
+    run_id = await run_svc.create_run(current.tenant, body.run_name, body.framework or "unknown", body.tags or {})
+    await repositories.repo.commit()
     return {"run_id": run_id}
 
 
 @router.post("/metric")
 async def sdk_metric(body: SDKMetricReq, current: User = Depends(get_current_user)):
-    rid = body.run_id or (run_svc.RUNS[-1]["id"] if run_svc.RUNS else None)
+    rid = body.run_id or await run_svc.latest_run_id()
     if rid is None:
         return {"ok": True}
-    run_svc.add_metric(rid, body.model_dump())
+    ratelimit.charge_points(current.tenant, 1)
+    await run_svc.add_metric(rid, body.model_dump())
+    await repositories.repo.commit()
+    telemetry.points_ingested(current.tenant, 1)
     return {"ok": True}
 
 
 @router.post("/log")
 async def sdk_log(body: SDKLogReq, current: User = Depends(get_current_user)):
-    rid = body.run_id or (run_svc.RUNS[-1]["id"] if run_svc.RUNS else None)
+    rid = body.run_id or await run_svc.latest_run_id()
     if rid is None:
         return {"ok": True}
-    run_svc.add_log(rid, body.level, body.msg, body.ts)
+    ratelimit.charge_points(current.tenant, 1)
+    await run_svc.add_log(rid, body.level, body.msg, body.ts)
+    await repositories.repo.commit()
+    telemetry.lines_ingested(current.tenant, 1)
     return {"ok": True}
 
 
+def _validate_bulk(adapter: TypeAdapter, items: list, index: list):
+    # Validate the whole batch in one pydantic call; if some items fail, report
+    # them by original index and validate the remainder again in bulk.
+    try:
+        return list(zip(index, adapter.validate_python(items))), []
+    except ValidationError as e:
+        bad: dict[int, str] = {}
+        for err in e.errors(include_url=False):
+            loc = err["loc"]
+            field = ".".join(str(x) for x in loc[1:]) or "item"
+            bad.setdefault(loc[0], f"{field}: {err['msg']}")
+    keep = [i for i in range(len(items)) if i not in bad]
+    models = adapter.validate_python([items[i] for i in keep])
+    rejected = [{"index": index[i], "error": msg} for i, msg in sorted(bad.items())]
+    return list(zip([index[i] for i in keep], models)), rejected
+
+
+async def _read_batch(request: Request, adapter: TypeAdapter):
+    # Parse a batch body (JSON array, or NDJSON read as it streams in) into
+    # ([(index, model)], rejected)
+    limit = settings.SDK_BATCH_MAX_POINTS
+    ctype = request.headers.get("content-type", "")
+    if "ndjson" in ctype or "jsonl" in ctype:
+        items, index, rejected = [], [], []
+        buf = b""
+        n = 0
+
+        def take(line: bytes):
+            nonlocal n
+            line = line.strip()
+            if not line:
+                return
+            try:
+                items.append(json.loads(line))
+                index.append(n)
+            except ValueError:
+                rejected.append({"index": n, "error": "invalid json"})
+            n += 1
+            if n > limit:
+                raise HTTPException(413, detail=f"batch exceeds {limit} points")
+
+        async for chunk in request.stream():
+            buf += chunk
+            if b"\n" in buf:
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    take(line)
+        take(buf)
+        ok, bad = _validate_bulk(adapter, items, index)
+        return ok, sorted(rejected + bad, key=lambda x: x["index"])
+
+    body = await request.body()
+    try:
+        models = adapter.validate_json(body)
+        if len(models) > limit:
+            raise HTTPException(413, detail=f"batch exceeds {limit} points")
+        return list(enumerate(models)), []
+    except ValidationError:
+        pass
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(400, detail="body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(400, detail="body must be a JSON array or NDJSON")
+    if len(items) > limit:
+        raise HTTPException(413, detail=f"batch exceeds {limit} points")
+    return _validate_bulk(adapter, items, list(range(len(items))))
+
+
+async def _owned_runs(tenant: str, run_ids: Set[Optional[int]]) -> Set[int]:
+    # The ids among run_ids of runs that belong to the tenant, one lookup per run
+    return {rid for rid in run_ids if rid is not None and await run_svc.get_run_for_tenant(rid, tenant)}
+
+
+@router.post("/metrics:batch")
+async def sdk_metrics_batch(request: Request, run_id: int | None = None, current: User = Depends(get_current_user)):
+    ok, rejected = await _read_batch(request, MetricBatch)
+    default_rid = run_id or await run_svc.run_id_for_tenant(None, current.tenant)
+    owned = await _owned_runs(current.tenant, {m.run_id or default_rid for _, m in ok})
+    points = []
+    for i, m in ok:
+        rid = m.run_id or default_rid
+        if rid not in owned:
+            rejected.append({"index": i, "error": "run_id: no run to attach to"})
+            continue
+        points.append((rid, m.name, m.value, m.step, m.epoch, m.ts))
+    ratelimit.charge_points(current.tenant, len(points))
+    accepted = await run_svc.add_metrics(points)
+    await repositories.repo.commit()
+    telemetry.points_ingested(current.tenant, accepted)
+    return {"ok": not rejected, "accepted": accepted, "rejected": rejected}
+
+
+@router.post("/logs:batch")
+async def sdk_logs_batch(request: Request, run_id: int | None = None, current: User = Depends(get_current_user)):
+    ok, rejected = await _read_batch(request, LogBatch)
+    default_rid = run_id or await run_svc.run_id_for_tenant(None, current.tenant)
+    owned = await _owned_runs(current.tenant, {m.run_id or default_rid for _, m in ok})
+    lines = []
+    for i, m in ok:
+        rid = m.run_id or default_rid
+        if rid not in owned:
+            rejected.append({"index": i, "error": "run_id: no run to attach to"})
+            continue
+        lines.append((rid, m.level, m.msg, m.ts))
+    ratelimit.charge_points(current.tenant, len(lines))
+    accepted = await run_svc.add_logs(lines)
+    await repositories.repo.commit()
+    telemetry.lines_ingested(current.tenant, accepted)
+    return {"ok": not rejected, "accepted": accepted, "rejected": rejected}
+
+
 @router.post("/trace")
 async def sdk_trace(body: SDKTraceReq, current: User = Depends(get_current_user)):
     # acknowledged; OTel traces are sent out-of-band to Jaeger
     return {"ok": True}
 
 
+async def _file_stream(request: Request, name: Optional[str]) -> Tuple[str, AsyncIterator[bytes]]:
+    # (filename, chunks) of an upload without buffering it: the first file field
+    # of a multipart/form-data body, fed through a push parser as it arrives, or
+    # else the raw body, named by the ?name= query parameter.
+    ctype, params = parse_options_header(request.headers.get("content-type", ""))
+    if ctype != b"multipart/form-data":
+        if not name:
+            raise HTTPException(400, detail="name is required for a raw upload")
+        return name, request.stream()
+    out: List[bytes] = []
+    part = {"field": b"", "value": b"", "headers": {}}
+    state = {"filename": None, "active": False, "done": False}
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"], part["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disp = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["headers"] = {}
+        if b"filename" in disp and state["filename"] is None:
+            state["filename"] = disp[b"filename"].decode("utf-8", "replace")
+            state["active"] = True
+
+    def on_part_data(data, start, end):
+        if state["active"]:
+            out.append(bytes(data[start:end]))
+
+    def on_part_end():
+        if state["active"]:
+            state["active"], state["done"] = False, True
+
+    parser = MultipartParser(params.get(b"boundary", b""), {
+        "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end})
+    body = request.stream()
+
+    async def pull() -> bool:
+        async for chunk in body:
+            parser.write(chunk)
+            if out or state["done"]:
+                return True
+        return False
+
+    while state["filename"] is None:
+        if not await pull() and state["filename"] is None:
+            raise HTTPException(400, detail="no file in the form")
+
+    async def chunks():
+        while True:
+            while out:
+                yield out.pop(0)
+            if state["done"] or not await pull():
+                break
+        async for _ in body:  # drain the rest of the form
+            pass
+
+    return name or state["filename"], chunks()
+
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def _check_sha256(value: Optional[str]) -> Optional[str]:
+    if value is not None and not _SHA256.fullmatch(value):
+        raise HTTPException(400, detail="sha256 must be 64 lowercase hex digits")
+    return value
+
+
+async def _require_storage():
+    if not await storage_svc.get_minio_client():
+        raise HTTPException(503, detail="Artifact storage unavailable")
+
+
+def _artifact(name: str, blob: dict) -> dict:
+    return {"ok": True, "bucket": settings.MINIO_BUCKET, "name": name, **blob}
+
+
 @router.post("/artifact")
-async def sdk_artifact(run_id: int | None = None, file: UploadFile = File(...), current: User = Depends(get_current_user)):
-    rid = run_id or (run_svc.RUNS[-1]["id"] if run_svc.RUNS else None)
+async def sdk_artifact(request: Request, run_id: int | None = None, name: str | None = None,
+                       sha256: str | None = None, current: User = Depends(get_current_user)):
+    # Streams the upload (multipart form or raw body) straight into the object
+    # store; memory per upload is bounded by the part size, not the file size.
+    # Stored content-addressed, so a file some run already uploaded only adds a
+    # reference; a declared ?sha256= the tenant already references is not read.
+    rid = await run_svc.run_id_for_tenant(run_id, current.tenant)
     if rid is None:
+        raise HTTPException(404, detail="No run to attach to")
+    _check_sha256(sha256)
+    skip = bool(sha256) and await run_svc.blob_referenced(current.tenant, sha256)
+    filename, chunks = await _file_stream(request, name)
+    try:
+        blob = await storage_svc.store_blob(chunks, sha256, skip_stored=skip)
+    except storage_svc.ChecksumMismatch as e:
+        raise HTTPException(400, detail=str(e))
+    if blob is None:
         return {"ok": True, "stored": False}
-    data = await file.read()
-    key = f"runs/{rid}/{file.filename}"
-    client = storage_svc.get_minio_client()
-    stored = storage_svc.put_artifact(client, key, data)
-    if stored:
-        return {"ok": True, "bucket": settings.MINIO_BUCKET, "key": key}
-    return {"ok": True, "stored": False}
+    return await _attach(current.tenant, rid, filename, blob)
+
+
+async def _attach(tenant: str, rid: int, name: str, blob: dict) -> dict:
+    # Storage dedupes across tenants, but "deduplicated" only reports a copy the
+    # tenant already references; another tenant's identical file stays hidden.
+    if blob["deduplicated"] and not await run_svc.blob_referenced(tenant, blob["sha256"]):
+        blob = dict(blob, deduplicated=False)
+    await run_svc.add_artifact(rid, name, blob)
+    return _artifact(name, blob)
+
+
+async def _tenant_blob_size(tenant: str, sha256: str) -> int:
+    size = await storage_svc.blob_size(sha256) if await run_svc.blob_referenced(tenant, sha256) else None
+    if size is None:
+        raise HTTPException(404, detail="Blob not found")
+    return size
+
+
+@router.api_route("/artifact/blobs/{sha256}", methods=["GET", "HEAD"])
+async def sdk_blob(sha256: str, current: User = Depends(get_current_user)):
+    # Precheck: 200 if a blob with this digest is stored and referenced by one of
+    # the tenant's runs (then POST /artifact/refs instead of uploading), else 404.
+    # Other tenants' blobs are not disclosed: they have to upload the bytes once.
+    _check_sha256(sha256)
+    await _require_storage()
+    return {"sha256": sha256, "size": await _tenant_blob_size(current.tenant, sha256)}
+
+
+@router.post("/artifact/refs")
+async def sdk_artifact_ref(body: SDKArtifactRefReq, current: User = Depends(get_current_user)):
+    # Adds a blob the tenant already references to a run's artifacts without
+    # uploading it
+    rid = await run_svc.run_id_for_tenant(body.run_id, current.tenant)
+    if rid is None:
+        raise HTTPException(404, detail="No run to attach to")
+    _check_sha256(body.sha256)
+    await _require_storage()
+    size = await _tenant_blob_size(current.tenant, body.sha256)
+    blob = {"sha256": body.sha256, "size": size, "key": storage_svc.blob_key(body.sha256), "deduplicated": True}
+    await run_svc.add_artifact(rid, body.name, blob)
+    return _artifact(body.name, blob)
+
+
+# Resumable uploads. The upload ID handed out is a handle naming the tenant,
+# the run, the file, the staging key and the object store's multipart upload,
+# signed with AUTH_SECRET, so nothing is kept in-process, any replica can
+# continue an upload, and a client can neither forge one (to abort or complete
+# uploads of other objects) nor use another tenant's.
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _sign(payload: str) -> str:
+    return _b64(hmac.new(settings.AUTH_SECRET.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def _upload_handle(tenant: str, *fields) -> str:
+    payload = _b64(json.dumps([tenant, *fields]).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def _open_handle(handle: str, tenant: str) -> Tuple[int, str, str, str, Optional[str]]:
+    payload, _, sig = handle.partition(".")
+    if not hmac.compare_digest(sig, _sign(payload)):
+        raise HTTPException(404, detail="Unknown upload")
+    owner, rid, name, upload_id, key, sha256 = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    if owner != tenant:
+        raise HTTPException(403, detail="Tenant mismatch")
+    return rid, name, upload_id, key, sha256
+
+
+@router.post("/artifact/uploads")
+async def sdk_upload_create(name: str, run_id: int | None = None, sha256: str | None = None,
+                            current: User = Depends(get_current_user)):
+    rid = await run_svc.run_id_for_tenant(run_id, current.tenant)
+    if rid is None:
+        raise HTTPException(404, detail="No run to attach to")
+    _check_sha256(sha256)
+    await _require_storage()
+    if sha256 and await run_svc.blob_referenced(current.tenant, sha256):
+        size = await storage_svc.blob_size(sha256)
+        if size is not None:
+            blob = {"sha256": sha256, "size": size, "key": storage_svc.blob_key(sha256), "deduplicated": True}
+            await run_svc.add_artifact(rid, name, blob)
+            return {"exists": True, **_artifact(name, blob)}
+    key = storage_svc.staging_key()
+    upload_id = await storage_svc.create_upload(key)
+    return {"exists": False, "upload_id": _upload_handle(current.tenant, rid, name, upload_id, key, sha256),
+            "part_size": storage_svc.part_size()}
+
+
+@router.get("/artifact/uploads/{upload_id}")
+async def sdk_upload_status(upload_id: str, current: User = Depends(get_current_user)):
+    rid, name, uid, key, _ = _open_handle(upload_id, current.tenant)
+    await _require_storage()
+    parts = await storage_svc.list_parts(key, uid)
+    return {"upload_id": upload_id, "part_size": storage_svc.part_size(),
+            "parts": [{"part": p.part_number, "etag": p.etag, "size": p.size} for p in parts]}
+
+
+@router.put("/artifact/uploads/{upload_id}/{part}")
+async def sdk_upload_part(upload_id: str, part: int, request: Request, current: User = Depends(get_current_user)):
+    rid, name, uid, key, _ = _open_handle(upload_id, current.tenant)
+    if not 1 <= part <= 10000:
+        raise HTTPException(400, detail="part must be between 1 and 10000")
+    await _require_storage()
+    limit = storage_svc.part_size()
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > limit:
+            raise HTTPException(413, detail=f"part exceeds {limit} bytes")
+    etag = await storage_svc.upload_part(key, uid, part, bytes(data))
+    return {"part": part, "etag": etag, "size": len(data)}
+
+
+@router.post("/artifact/uploads/{upload_id}/complete")
+async def sdk_upload_complete(upload_id: str, current: User = Depends(get_current_user)):
+    rid, name, uid, key, sha256 = _open_handle(upload_id, current.tenant)
+    await _require_storage()
+    try:
+        blob = await storage_svc.complete_blob_upload(key, uid, sha256)
+    except storage_svc.ChecksumMismatch as e:
+        raise HTTPException(400, detail=str(e))
+    return await _attach(current.tenant, rid, name, blob)
+
+
+@router.delete("/artifact/uploads/{upload_id}")
+async def sdk_upload_abort(upload_id: str, current: User = Depends(get_current_user)):
+    rid, name, uid, key, _ = _open_handle(upload_id, current.tenant)
+    await _require_storage()
+    await storage_svc.abort_upload(key, uid)
+    return {"ok": True}
 
 
 @router.post("/finish")
 async def sdk_finish(body: SDKFinishReq, current: User = Depends(get_current_user)):
-    run_svc.finish_run(body.run_id, body.status, body.ts)
+    await run_svc.finish_run(body.run_id, body.status, body.ts)
+    await repositories.repo.commit()
     return {"ok": True}
@@ -1,4 +1,6 @@
 import os
+import secrets
+import tempfile
 
 
 class Settings:
@@ -7,7 +9,83 @@ class Settings:
     MINIO_ACCESS_KEY: str = os.environ.get("MINIO_ACCESS_KEY", "minio")
     MINIO_SECRET_KEY: str = os.environ.get("MINIO_SECRET_KEY", "minio123")
     MINIO_BUCKET: str = os.environ.get("MINIO_BUCKET", "artifacts")
+    # Artifact storage I/O: worker threads (= pooled connections), timeouts, and
+    # how long an unreachable endpoint is skipped before reconnecting
+    STORAGE_THREADS: int = int(os.environ.get("STORAGE_THREADS", "8"))
+    STORAGE_CONNECT_TIMEOUT_S: float = float(os.environ.get("STORAGE_CONNECT_TIMEOUT_S", "5"))
+    STORAGE_READ_TIMEOUT_S: float = float(os.environ.get("STORAGE_READ_TIMEOUT_S", "60"))
+    STORAGE_RETRY_S: float = float(os.environ.get("STORAGE_RETRY_S", "30"))
+    # Prometheus file_sd directory for agent targets, and how long changes are
+    # coalesced before the files are rewritten
+    FILE_SD_DIR: str = os.environ.get("FILE_SD_DIR", "/etc/prometheus/file_sd")
+    FILE_SD_DEBOUNCE_S: float = float(os.environ.get("FILE_SD_DEBOUNCE_S", "1"))
+    # Empty stores artifacts in MinIO; a directory stores them on the local
+    # filesystem instead (single node, or a shared volume)
+    STORAGE_DIR: str = os.environ.get("STORAGE_DIR", "")
+    # On-disk LRU of recently read artifacts in front of the store; 0 disables it
+    ARTIFACT_CACHE_DIR: str = os.environ.get("ARTIFACT_CACHE_DIR",
+                                             os.path.join(tempfile.gettempdir(), "oneservice-artifacts"))
+    ARTIFACT_CACHE_MB: int = int(os.environ.get("ARTIFACT_CACHE_MB", "2048"))
+    # Large uploads go to the store as multipart uploads of STORAGE_PART_MB parts
+    # (S3 needs at least 5), at most STORAGE_PART_CONCURRENCY in flight each, so
+    # one upload holds about (concurrency + 1) parts in memory whatever its size
+    STORAGE_PART_MB: float = float(os.environ.get("STORAGE_PART_MB", "16"))
+    STORAGE_PART_CONCURRENCY: int = int(os.environ.get("STORAGE_PART_CONCURRENCY", "4"))
     DEMO_TENANT: str = "demo"
+    # HMAC key for access/refresh/API tokens. Set the same value on every replica;
+    # the random default means tokens do not survive a restart.
+    AUTH_SECRET: str = os.environ.get("AUTH_SECRET") or secrets.token_urlsafe(32)
+    ACCESS_TOKEN_TTL_S: int = int(os.environ.get("ACCESS_TOKEN_TTL_S", "3600"))
+    REFRESH_TOKEN_TTL_S: int = int(os.environ.get("REFRESH_TOKEN_TTL_S", str(14 * 86400)))
+    API_TOKEN_TTL_S: int = int(os.environ.get("API_TOKEN_TTL_S", str(365 * 86400)))
+    # Verified tokens -> users, so hot routes skip signature checks
+    AUTH_CACHE_SIZE: int = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+    AUTH_CACHE_TTL_S: int = int(os.environ.get("AUTH_CACHE_TTL_S", "300"))
+    # Run repository: empty keeps runs, metrics and logs in process memory;
+    # otherwise an async SQLAlchemy URL, e.g. postgresql+asyncpg://u:p@db/oneservice
+    # or sqlite+aiosqlite:///./oneservice.db
+    DATABASE_URL: str = os.environ.get("DATABASE_URL", "")
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+    # Metric/log inserts are grouped into one transaction per flush
+    DB_FLUSH_MS: int = int(os.environ.get("DB_FLUSH_MS", "20"))
+    DB_BATCH_ROWS: int = int(os.environ.get("DB_BATCH_ROWS", "5000"))
+    # How often live streams re-check the database for other replicas' writes
+    DB_POLL_S: float = float(os.environ.get("DB_POLL_S", "1"))
+    # Node number (0-7) mixed into run ids; must differ between backend replicas
+    RUN_ID_NODE: int = int(os.environ.get("RUN_ID_NODE", "0"))
+    # Write-ahead log + snapshots for the run store; empty WAL_DIR keeps it in memory only
+    WAL_DIR: str = os.environ.get("WAL_DIR", "")
+    WAL_FSYNC: str = os.environ.get("WAL_FSYNC", "interval")  # always | interval | never
+    WAL_FLUSH_MS: int = int(os.environ.get("WAL_FLUSH_MS", "50"))
+    WAL_SEGMENT_MB: int = int(os.environ.get("WAL_SEGMENT_MB", "64"))
+    WAL_SNAPSHOT_INTERVAL_S: int = int(os.environ.get("WAL_SNAPSHOT_INTERVAL_S", "300"))
+    # Memory budget for run metrics/logs; above it the oldest points and lines of
+    # the largest (finished first) runs spill to memory-mapped files in TIER_DIR.
+    # Empty TIER_DIR disables spilling. Budgets are in MiB, 0 means unlimited.
+    TIER_DIR: str = os.environ.get("TIER_DIR", "")
+    TIER_GLOBAL_MB: int = int(os.environ.get("TIER_GLOBAL_MB", "1024"))
+    TIER_TENANT_MB: int = int(os.environ.get("TIER_TENANT_MB", "0"))
+    TIER_HOT_POINTS: int = int(os.environ.get("TIER_HOT_POINTS", "10000"))  # per series kept in RAM
+    TIER_HOT_LINES: int = int(os.environ.get("TIER_HOT_LINES", "20000"))  # per run kept in RAM
+    TIER_CHECK_S: float = float(os.environ.get("TIER_CHECK_S", "5"))
+    # EMA weight of the per-series running summary (/runs/{id}/summary)
+    SUMMARY_EMA_WEIGHT: float = float(os.environ.get("SUMMARY_EMA_WEIGHT", "0.9"))
+    # Metric/log responses at least this large are gzip/zstd compressed when the
+    # client accepts it (0 disables)
+    RESPONSE_COMPRESS_MIN_BYTES: int = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "16384"))
+    # Rendered metric/log responses of finished runs kept for repeat queries
+    RESPONSE_CACHE_MB: int = int(os.environ.get("RESPONSE_CACHE_MB", "64"))
+    # Token buckets on /api/sdk (rate per second, burst = bucket size; 0 disables):
+    # requests per tenant and per bearer token, and points/lines per tenant
+    SDK_TENANT_RPS: float = float(os.environ.get("SDK_TENANT_RPS", "500"))
+    SDK_TENANT_BURST: float = float(os.environ.get("SDK_TENANT_BURST", "1000"))
+    SDK_TOKEN_RPS: float = float(os.environ.get("SDK_TOKEN_RPS", "200"))
+    SDK_TOKEN_BURST: float = float(os.environ.get("SDK_TOKEN_BURST", "400"))
+    SDK_TENANT_POINTS_PER_S: float = float(os.environ.get("SDK_TENANT_POINTS_PER_S", "200000"))
+    SDK_TENANT_POINTS_BURST: float = float(os.environ.get("SDK_TENANT_POINTS_BURST", "1000000"))
+    # Upper bound on points/lines accepted by one /sdk/*:batch request
+    SDK_BATCH_MAX_POINTS: int = int(os.environ.get("SDK_BATCH_MAX_POINTS", "100000"))
 
 
 settings = Settings()
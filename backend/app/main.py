@@ -1,9 +1,28 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .api.v1.router import api_router
+from . import repositories
+from .services import file_sd, persistence, storage, telemetry, tiering
 
 
-app = FastAPI(title="OneService Backend", openapi_url="/api/openapi.json", docs_url="/api/docs")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect the SQL repository (DATABASE_URL) or restore the in-memory run store
+    # from snapshot + WAL (WAL_DIR); neither is required
+    await repositories.start()
+    persistence.start()
+    tiering.start()
+    file_sd.start()
+    yield
+    await file_sd.stop()
+    await storage.stop()
+    await tiering.stop()
+    await persistence.stop()
+    await repositories.stop()
+
+
+app = FastAPI(title="OneService Backend", openapi_url="/api/openapi.json", docs_url="/api/docs", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +31,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(telemetry.RequestTimer)
 
 
 # Mount versioned API under /api to keep existing paths working
@@ -21,3 +41,9 @@ app.include_router(api_router, prefix="/api")
 @app.get("/")
 async def root():
     return {"name": "OneService Backend", "docs": "/api/docs"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus scrape target for the backend itself
+    return Response(telemetry.exposition(), media_type=telemetry.CONTENT_TYPE)
@@ -0,0 +1,133 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+IndexKey = Tuple
+
+
+class RunCatalog:
+    # Run records indexed by id, plus sorted id lists per tenant and per
+    # (tenant, field, value) for status, framework and tags. Records must be
+    # mutated through this class so the secondary indexes stay in sync.
+
+    def __init__(self, runs: Iterable[dict] = ()):
+        self._by_id: Dict[int, dict] = {}
+        self._index: Dict[IndexKey, List[int]] = {}
+        self._last_id: Optional[int] = None
+        for r in runs:
+            self.add(r)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, run_id: int) -> bool:
+        return run_id in self._by_id
+
+    @staticmethod
+    def _keys(r: dict) -> List[IndexKey]:
+        t = r["tenant_id"]
+        keys: List[IndexKey] = [("tenant", t), ("status", t, r["status"]), ("framework", t, r["framework"])]
+        for k, v in (r.get("tags_json") or {}).items():
+            keys.append(("tagkey", t, k))
+            keys.append(("tag", t, k, str(v)))
+        return keys
+
+    def _link(self, key: IndexKey, run_id: int):
+        ids = self._index.get(key)
+        if ids is None:
+            self._index[key] = [run_id]
+        elif ids[-1] < run_id:
+            ids.append(run_id)
+        else:
+            insort(ids, run_id)
+
+    def _unlink(self, key: IndexKey, run_id: int):
+        ids = self._index.get(key)
+        if not ids:
+            return
+        i = bisect_left(ids, run_id)
+        if i < len(ids) and ids[i] == run_id:
+            del ids[i]
+        if not ids:
+            del self._index[key]
+
+    def add(self, r: dict):
+        if r["id"] in self._by_id:
+            self.remove(r["id"])
+        self._by_id[r["id"]] = r
+        for key in self._keys(r):
+            self._link(key, r["id"])
+        self._last_id = r["id"]
+
+    def remove(self, run_id: int):
+        r = self._by_id.pop(run_id, None)
+        if r is None:
+            return
+        for key in self._keys(r):
+            self._unlink(key, run_id)
+
+    def get(self, run_id: int) -> Optional[dict]:
+        return self._by_id.get(run_id)
+
+    def last(self) -> Optional[dict]:
+        return self._by_id.get(self._last_id) if self._last_id is not None else None
+
+    def update(self, run_id: int, **fields) -> Optional[dict]:
+        r = self._by_id.get(run_id)
+        if r is None:
+            return None
+        old = self._keys(r)
+        r.update(fields)
+        new = self._keys(r)
+        for key in set(old) - set(new):
+            self._unlink(key, run_id)
+        for key in set(new) - set(old):
+            self._link(key, run_id)
+        return r
+
+    def query(self, tenant: str, filters: Dict[str, str], cursor: Optional[int] = None,
+              limit: Optional[int] = None, descending: bool = False) -> Tuple[List[dict], Optional[int]]:
+        # filters: {"status": v, "framework": v, "tag.<key>": v}; a tag value of "*"
+        # only requires the key. Walks the shortest matching id list from the
+        # cursor, so cost is proportional to the page rather than the catalog.
+        keys: List[IndexKey] = [("tenant", tenant)]
+        checks: List[Tuple[str, Optional[str], str]] = []
+        for field, value in filters.items():
+            if field.startswith("tag."):
+                tag = field[4:]
+                if value == "*":
+                    keys.append(("tagkey", tenant, tag))
+                else:
+                    keys.append(("tag", tenant, tag, value))
+                checks.append(("tags_json", tag, value))
+            else:
+                keys.append((field, tenant, value))
+                checks.append((field, None, value))
+        lists = [self._index.get(k, []) for k in keys]
+        ids = min(lists, key=len)
+        if descending:
+            end = len(ids) if cursor is None else bisect_left(ids, cursor)
+            order = range(end - 1, -1, -1)
+        else:
+            start = 0 if cursor is None else bisect_right(ids, cursor)
+            order = range(start, len(ids))
+        page: List[dict] = []
+        for i in order:
+            r = self._by_id[ids[i]]
+            if all(self._matches(r, f, tag, v) for f, tag, v in checks):
+                if limit is not None and len(page) == limit:
+                    return page, page[-1]["id"]
+                page.append(r)
+        return page, None
+
+    @staticmethod
+    def _matches(r: dict, field: str, tag: Optional[str], value: str) -> bool:
+        if tag is None:
+            return str(r.get(field)) == value
+        tags = r.get("tags_json") or {}
+        if value == "*":
+            return tag in tags
+        return tag in tags and str(tags[tag]) == value
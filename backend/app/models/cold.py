@@ -0,0 +1,159 @@
+import json
+import os
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# On-disk tier for run data that no longer fits the memory budget. Files are
+# written by a worker thread and only ever read through read-only memory maps,
+# so the data lives in the OS page cache instead of the Python heap.
+
+POINT = np.dtype([("step", "<i8"), ("epoch", "<i8"), ("ts", "<f8"), ("value", "<f8")])
+
+
+class ColdSeries:
+    # The spilled prefix of a MetricSeries: one file of fixed-size point records.
+    # Only the first `count` records are valid; opening truncates anything past
+    # them (left over from a spill that a snapshot did not cover).
+
+    def __init__(self, path: str, count: int = 0):
+        self.path = path
+        self.count = count
+        self._map = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.truncate(count * POINT.itemsize)
+        self._remap()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _remap(self):
+        self._map = np.memmap(self.path, POINT, "r", shape=(self.count,)) if self.count else np.empty(0, POINT)
+
+    def write(self, steps, epochs, ts, values):
+        # Worker thread: the arguments are private copies of the hot columns
+        rec = np.empty(len(values), POINT)
+        rec["step"] = np.frombuffer(steps, np.int64)
+        rec["epoch"] = np.frombuffer(epochs, np.int64)
+        rec["ts"] = np.frombuffer(ts, np.float64)
+        rec["value"] = np.frombuffer(values, np.float64)
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, rec.tobytes(), self.count * POINT.itemsize)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def commit(self, n: int):
+        # Loop thread: make the n records written by write() visible
+        self.count += n
+        self._remap()
+
+    def point(self, i: int) -> Tuple[int, int, float, float]:
+        r = self._map[i]
+        return int(r["step"]), int(r["epoch"]), float(r["ts"]), float(r["value"])
+
+    def columns(self):
+        m = self._map
+        return m["step"], m["epoch"], m["ts"], m["value"]
+
+
+class ColdLogChunk:
+    # An immutable range of log lines [base, base + n) with its slice of the
+    # trigram index, stored as .npy files and opened with mmap_mode="r".
+    # Trigram keys are sorted so a lookup is a binary search in the mapped keys.
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.base: int = meta["base"]
+        self.n: int = meta["n"]
+        self.vocab: List[str] = meta["levels"]
+
+        def load(name):
+            return np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+
+        self.ts = load("ts")
+        self.lvl = load("lvl")
+        self.moff = load("moff")
+        self.msg = load("msg")
+        self.gkeys = load("gkeys")
+        self.goff = load("goff")
+        self.post = load("post")
+
+    @staticmethod
+    def write(directory: str, base: int, ts: Sequence[int], levels: Sequence[str], msgs: Sequence[str],
+              grams: Iterable[Tuple[str, Sequence[int]]]):
+        # Worker thread. grams yields (trigram, global positions) for this range.
+        os.makedirs(directory, exist_ok=True)
+        vocab: List[str] = []
+        codes = {}
+        lvl = np.empty(len(levels), np.uint16)
+        for i, level in enumerate(levels):
+            c = codes.get(level)
+            if c is None:
+                c = codes[level] = len(vocab)
+                vocab.append(level)
+            lvl[i] = c
+        blobs = [m.encode() for m in msgs]
+        moff = np.zeros(len(blobs) + 1, np.int64)
+        np.cumsum([len(b) for b in blobs], out=moff[1:])
+        items = sorted(grams)
+        goff = np.zeros(len(items) + 1, np.int64)
+        np.cumsum([len(ids) for _, ids in items], out=goff[1:])
+        post = np.empty(int(goff[-1]), np.uint32)
+        for (_, ids), a, b in zip(items, goff[:-1], goff[1:]):
+            post[a:b] = np.asarray(ids, np.int64) - base
+
+        def save(name, arr):
+            with open(os.path.join(directory, name + ".npy"), "wb") as f:
+                np.save(f, arr)
+                os.fsync(f.fileno())
+
+        save("ts", np.asarray(ts, np.int64))
+        save("lvl", lvl)
+        save("moff", moff)
+        save("msg", np.frombuffer(b"".join(blobs), np.uint8))
+        save("gkeys", np.array([g for g, _ in items], dtype="U3"))
+        save("goff", goff)
+        save("post", post)
+        # meta.json last: a chunk directory without it is an interrupted write
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"base": base, "n": len(msgs), "levels": vocab}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def line(self, pos: int) -> Tuple[str, str, int]:
+        j = pos - self.base
+        a, b = int(self.moff[j]), int(self.moff[j + 1])
+        return self.vocab[int(self.lvl[j])], self.msg[a:b].tobytes().decode(), int(self.ts[j])
+
+    def ts_at(self, pos: int) -> int:
+        return int(self.ts[pos - self.base])
+
+    def candidates(self, grams: Iterable[str], level: Optional[str], lo: int, hi: int) -> Iterator[int]:
+        # Global positions in [lo, hi) that may match; callers still verify
+        lists = []
+        for g in grams:
+            i = int(np.searchsorted(self.gkeys, g))
+            if i >= len(self.gkeys) or self.gkeys[i] != g:
+                return
+            lists.append(self.post[self.goff[i]:self.goff[i + 1]])
+        if not lists and level is None:
+            yield from range(lo, hi)
+            return
+        a, b = lo - self.base, hi - self.base
+        if lists:
+            ids = min(lists, key=len)
+            sel = np.asarray(ids[np.searchsorted(ids, a):np.searchsorted(ids, b)], np.int64)
+        else:
+            sel = np.arange(a, b)
+        if level is not None:
+            codes = [c for c, name in enumerate(self.vocab) if name.upper() == level]
+            if not codes:
+                return
+            sel = sel[np.isin(self.lvl[sel], codes)]
+        for j in sel.tolist():
+            yield self.base + j
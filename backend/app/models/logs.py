@@ -0,0 +1,187 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _TsView:
+    # Sequence view of ts over both tiers, for bisect
+    __slots__ = ("logs",)
+
+    def __init__(self, logs: "RunLogs"):
+        self.logs = logs
+
+    def __len__(self) -> int:
+        return len(self.logs)
+
+    def __getitem__(self, pos: int) -> int:
+        return self.logs.ts_at(pos)
+
+
+class RunLogs:
+    # Append-only log lines of one run with an incremental inverted index:
+    # lowercase trigram -> line positions and level -> line positions. Posting
+    # lists are typed arrays in append order, so they are already sorted and a
+    # position cursor can be resolved with a binary search.
+    #
+    # Lines [0, offset) may have been spilled to ColdLogChunks (models/cold.py),
+    # each carrying its own slice of the index; positions are always global.
+    __slots__ = ("ts", "levels", "msgs", "ts_sorted", "_grams", "_by_level", "last_ts", "nbytes",
+                 "offset", "chunks", "chunk_bases")
+
+    def __init__(self):
+        self.ts = array("q")
+        self.levels: List[str] = []
+        self.msgs: List[str] = []
+        self.ts_sorted = True
+        self._grams: Dict[str, array] = {}
+        self._by_level: Dict[str, array] = {}
+        self.last_ts = -(1 << 63)
+        self.nbytes = 0
+        self.offset = 0
+        self.chunks: list = []
+        self.chunk_bases: List[int] = []
+
+    def __len__(self) -> int:
+        return self.offset + len(self.msgs)
+
+    def append(self, level: str, msg: str, ts: int):
+        pos = len(self)
+        if self.ts_sorted and ts < self.last_ts:
+            self.ts_sorted = False
+        self.last_ts = ts
+        self.ts.append(ts)
+        self.levels.append(sys.intern(level))
+        self.msgs.append(msg)
+        key = level.upper()
+        ids = self._by_level.get(key)
+        if ids is None:
+            ids = self._by_level[key] = array("I")
+        ids.append(pos)
+        grams = self._grams
+        tg = trigrams(msg.lower())
+        for g in tg:
+            ids = grams.get(g)
+            if ids is None:
+                ids = grams[g] = array("I")
+            ids.append(pos)
+        # Rough heap cost of the line: str + list slots + ts + postings
+        self.nbytes += 80 + len(msg) + 4 * len(tg)
+
+    def _chunk(self, pos: int):
+        return self.chunks[bisect_right(self.chunk_bases, pos) - 1]
+
+    def line(self, pos: int) -> Tuple[str, str, int]:
+        if pos < self.offset:
+            return self._chunk(pos).line(pos)
+        j = pos - self.offset
+        return self.levels[j], self.msgs[j], self.ts[j]
+
+    def ts_at(self, pos: int) -> int:
+        if pos < self.offset:
+            return self._chunk(pos).ts_at(pos)
+        return self.ts[pos - self.offset]
+
+    def ts_column(self) -> np.ndarray:
+        # ts of every line, over both tiers
+        hot = np.frombuffer(self.ts, dtype=np.int64)
+        return np.concatenate([c.ts for c in self.chunks] + [hot]) if self.chunks else hot
+
+    def item(self, pos: int) -> dict:
+        level, msg, ts = self.line(pos)
+        return {"level": level, "msg": msg, "ts": ts}
+
+    def _bounds(self, ts_from: Optional[int], ts_to: Optional[int]) -> Tuple[int, int]:
+        if not self.ts_sorted:
+            return 0, len(self)
+        view = _TsView(self)
+        lo = 0 if ts_from is None else bisect_left(view, ts_from)
+        hi = len(self) if ts_to is None else bisect_right(view, ts_to)
+        return lo, hi
+
+    def _hot_candidates(self, grams: Iterable[str], level: Optional[str], lo: int, hi: int) -> Iterator[int]:
+        postings = []
+        for g in grams:
+            ids = self._grams.get(g)
+            if ids is None:
+                return
+            postings.append(ids)
+        if level:
+            ids = self._by_level.get(level)
+            if ids is None:
+                return
+            postings.append(ids)
+        if postings:
+            ids = min(postings, key=len)
+            for j in range(bisect_left(ids, lo), bisect_left(ids, hi)):
+                yield ids[j]
+        else:
+            yield from range(lo, hi)
+
+    def _candidates(self, grams, level, lo: int, hi: int) -> Iterator[int]:
+        for c in self.chunks:
+            if c.base + c.n > lo and c.base < hi:
+                yield from c.candidates(grams, level, max(lo, c.base), min(hi, c.base + c.n))
+        if hi > self.offset:
+            yield from self._hot_candidates(grams, level, max(lo, self.offset), hi)
+
+    def search(self, query: Optional[str] = None, level: Optional[str] = None, ts_from: Optional[int] = None,
+               ts_to: Optional[int] = None, cursor: int = 0, limit: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        # Returns (items, next_cursor). Candidates come from the shortest posting
+        # list among the query trigrams and the level, so the work done tracks the
+        # number of matches rather than the number of lines.
+        lo, hi = self._bounds(ts_from, ts_to)
+        lo = max(lo, cursor)
+        q = query.lower() if query else None
+        grams = trigrams(q) if q and len(q) >= 3 else ()
+        lvl = level.upper() if level else None
+        check_ts = not self.ts_sorted and (ts_from is not None or ts_to is not None)
+        out: List[dict] = []
+        for pos in self._candidates(grams, lvl, lo, hi):
+            line_level, msg, t = self.line(pos)
+            if q and q not in msg.lower():
+                continue
+            if lvl and line_level.upper() != lvl:
+                continue
+            if check_ts and ((ts_from is not None and t < ts_from) or (ts_to is not None and t > ts_to)):
+                continue
+            if limit is not None and len(out) == limit:
+                return out, pos
+            out.append({"level": line_level, "msg": msg, "ts": t})
+        return out, None
+
+    def split_hot(self, n: int):
+        # The first n hot lines with their slice of the index, for writing a chunk:
+        # (base, ts, levels, msgs, [(trigram, positions)])
+        end = self.offset + n
+        grams = []
+        for g, ids in self._grams.items():
+            k = bisect_left(ids, end)
+            if k:
+                grams.append((g, ids[:k]))
+        return self.offset, self.ts[:n], self.levels[:n], self.msgs[:n], grams
+
+    def spill(self, chunk, n: int):
+        # Drop the first n hot lines (and their postings) once `chunk` holds them
+        end = self.offset + n
+        for index in (self._grams, self._by_level):
+            for key in list(index):
+                ids = index[key]
+                k = bisect_left(ids, end)
+                if k == len(ids):
+                    del index[key]
+                elif k:
+                    index[key] = ids[k:]
+        self.chunks.append(chunk)
+        self.chunk_bases.append(chunk.base)
+        self.offset = end
+        self.ts = self.ts[n:]
+        self.levels = self.levels[n:]
+        self.msgs = self.msgs[n:]
+        self.nbytes = sum(80 + len(m) for m in self.msgs) + 4 * sum(len(ids) for ids in self._grams.values())
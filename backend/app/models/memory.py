@@ -1,6 +1,9 @@
 import time
-from typing import Dict, List
+from typing import Dict, List, Set
 from ..core.config import settings
+from .series import MetricSeries
+from .catalog import RunCatalog
+from .logs import RunLogs
 
 # In-memory demo storage (kept for MVP)
 TENANT = settings.DEMO_TENANT
@@ -13,8 +16,7 @@ USERS = {
         "tenant": TENANT,
     }
 }
-TOKENS: Dict[str, str] = {}
-RUNS: List[dict] = [
+RUNS = RunCatalog([
     {
         "id": 1,
         "tenant_id": TENANT,
@@ -39,7 +41,12 @@ RUNS: List[dict] = [
         "end_ts": int(time.time()) - 3000,
         "tags_json": {"exp": "B"},
     },
-]
+])
 
-RUN_METRICS: Dict[int, list] = {}
-RUN_LOGS: Dict[int, list] = {}
+# run_id -> metric name -> columnar series
+RUN_METRICS: Dict[int, Dict[str, MetricSeries]] = {}
+RUN_LOGS: Dict[int, RunLogs] = {}
+# run_id -> artifact records ({"run_id", "name", "key", "size", "checksum", "type", "created_at"})
+RUN_ARTIFACTS: Dict[int, List[dict]] = {}
+# sha256 -> tenants with an artifact referencing that blob
+BLOB_TENANTS: Dict[str, Set[str]] = {}
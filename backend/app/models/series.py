@@ -0,0 +1,144 @@
+from array import array
+from itertools import chain
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .stats import SeriesStats
+
+NO_STEP = -(1 << 63)
+# Inclusive (lo, hi) of a column; None is unbounded
+Bounds = Tuple[Optional[float], Optional[float]]
+
+
+class MetricSeries:
+    # Columnar storage for one (run, metric name) series: parallel typed arrays
+    # instead of one dict per point. Missing step/epoch are stored as 0, which the
+    # read path already treats the same as None. steps_sorted stays True while
+    # every point has a step and steps never decrease, so range queries can
+    # binary-search the step column directly; ts_sorted does the same for ts.
+    #
+    # Points [0, offset) may have been spilled to a ColdSeries (models/cold.py);
+    # the arrays hold the hot tail. Indexes passed to point()/x_at() are global.
+    __slots__ = ("name", "steps", "epochs", "ts", "values", "steps_sorted", "ts_sorted",
+                 "last_step", "last_ts", "cold", "offset", "stats")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.steps = array("q")
+        self.epochs = array("q")
+        self.ts = array("d")
+        self.values = array("d")
+        self.steps_sorted = True
+        self.ts_sorted = True
+        self.last_step = NO_STEP
+        self.last_ts = 0.0
+        self.cold = None
+        self.offset = 0
+        self.stats = SeriesStats()
+
+    def __len__(self) -> int:
+        return self.offset + len(self.values)
+
+    def append(self, value: float, step: Optional[int] = None, epoch: Optional[int] = None, ts: Optional[float] = None):
+        if self.steps_sorted and (not step or step < self.last_step):
+            self.steps_sorted = False
+        ts = ts or 0.0
+        if self.ts_sorted and ts < self.last_ts:
+            self.ts_sorted = False
+        self.last_step = step or 0
+        self.last_ts = ts
+        self.steps.append(step or 0)
+        self.epochs.append(epoch or 0)
+        self.ts.append(ts)
+        self.values.append(value)
+
+    def extend(self, steps: array, epochs: array, ts: array, values: array):
+        # Bulk append of whole columns (journal replay); keeps the sorted flags exact
+        if not values:
+            return
+        if self.steps_sorted:
+            self.steps_sorted = 0 not in steps and steps[0] >= self.last_step and steps.tolist() == sorted(steps)
+        if self.ts_sorted:
+            self.ts_sorted = ts[0] >= self.last_ts and ts.tolist() == sorted(ts)
+        self.last_step = steps[-1]
+        self.last_ts = ts[-1]
+        self.steps.extend(steps)
+        self.epochs.extend(epochs)
+        self.ts.extend(ts)
+        self.values.extend(values)
+
+    def track(self, start: int):
+        # Folds points [start:] into self.stats; they must still be in the hot tail
+        j = start - self.offset
+        steps = np.frombuffer(self.steps, dtype=np.int64)[j:]
+        epochs = np.frombuffer(self.epochs, dtype=np.int64)[j:]
+        pos = np.arange(start + 1, len(self) + 1, dtype=np.int64)
+        x = np.where(steps != 0, steps, np.where(epochs != 0, epochs, pos))
+        self.stats.merge(x, np.frombuffer(self.values, dtype=np.float64)[j:], settings.SUMMARY_EMA_WEIGHT)
+
+    def point(self, idx: int) -> Tuple[int, int, float, float]:
+        # (step, epoch, ts, value) of the idx-th point, from whichever tier holds it
+        if idx < self.offset:
+            return self.cold.point(idx)
+        j = idx - self.offset
+        return self.steps[j], self.epochs[j], self.ts[j], self.values[j]
+
+    def x_at(self, idx: int) -> int:
+        # Same fallback the flat list used: step, then epoch, then 1-based position
+        step, epoch, _, _ = self.point(idx)
+        return step or epoch or idx + 1
+
+    def search(self, col: str, value: float, side: str = "left") -> int:
+        # np.searchsorted over the whole of a sorted column ("steps" or "ts"),
+        # one tier at a time, so the tiers are never joined
+        hot = getattr(self, col)
+        hot = np.frombuffer(hot, dtype=np.int64 if hot.typecode == "q" else np.float64)
+        if self.offset:
+            i = int(np.searchsorted(self.cold.columns()[0 if col == "steps" else 2], value, side))
+            if i < self.offset:
+                return i
+        return self.offset + int(np.searchsorted(hot, value, side))
+
+    def bounds(self, col: str, lo: Optional[float], hi: Optional[float]) -> Tuple[int, int]:
+        # Global [start, stop) of the points with lo <= col <= hi; the whole
+        # series when the column is not sorted
+        if not (self.ts_sorted if col == "ts" else self.steps_sorted) or (lo is None and hi is None):
+            return 0, len(self)
+        start = 0 if lo is None else self.search(col, lo, "left")
+        stop = len(self) if hi is None else self.search(col, hi, "right")
+        return start, max(start, stop)
+
+    def ts_bounds(self, ts_from: Optional[float], ts_to: Optional[float]) -> Tuple[int, int]:
+        return self.bounds("ts", ts_from, ts_to)
+
+    def rows(self, start: int, stop: int) -> List[Tuple[int, int, float, float]]:
+        # (step, epoch, ts, value) of points [start, stop), copied out of both tiers
+        out = []
+        if start < self.offset:
+            out = list(zip(*(c[start:min(stop, self.offset)].tolist() for c in self.cold.columns())))
+        j0, j1 = max(start - self.offset, 0), stop - self.offset
+        if j1 > j0:
+            out.extend(zip(self.steps[j0:j1], self.epochs[j0:j1], self.ts[j0:j1], self.values[j0:j1]))
+        return out
+
+    def iter_points(self) -> Iterator[Tuple[int, int, float, float]]:
+        hot = zip(self.steps, self.epochs, self.ts, self.values)
+        if not self.offset:
+            return hot
+        cold = zip(*(c.tolist() for c in self.cold.columns()))
+        return chain(cold, hot)
+
+    def spill(self, cold, n: int):
+        # Drop the first n hot points once they have been committed to `cold`
+        self.cold = cold
+        self.offset += n
+        self.steps = self.steps[n:]
+        self.epochs = self.epochs[n:]
+        self.ts = self.ts[n:]
+        self.values = self.values[n:]
+
+    def nbytes(self) -> int:
+        # Heap bytes of the hot tail; spilled points live in the page cache
+        return sum(a.itemsize * len(a) for a in (self.steps, self.epochs, self.ts, self.values))
@@ -0,0 +1,72 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+
+class SeriesStats:
+    # Running aggregates of one metric series, folded in as points arrive so
+    # summaries never re-read raw points: count, last/min/max with the x (step,
+    # else epoch, else position) they occurred at, mean and M2 for the variance,
+    # and an EMA of the values. A batch of k points is merged with one numpy
+    # pass (Chan et al. pairwise update), i.e. O(1) amortized per point.
+    __slots__ = ("count", "last", "last_step", "min", "min_step", "max", "max_step", "mean", "m2", "ema")
+
+    FIELDS = __slots__
+
+    def __init__(self):
+        self.count = 0
+        self.last = self.min = self.max = self.mean = self.m2 = self.ema = 0.0
+        self.last_step = self.min_step = self.max_step = 0
+
+    def merge(self, x: np.ndarray, y: np.ndarray, weight: float):
+        k = len(y)
+        if not k:
+            return
+        i = int(y.argmin())
+        if not self.count or y[i] < self.min:
+            self.min, self.min_step = float(y[i]), int(x[i])
+        i = int(y.argmax())
+        if not self.count or y[i] > self.max:
+            self.max, self.max_step = float(y[i]), int(x[i])
+        self.last, self.last_step = float(y[-1]), int(x[-1])
+        mean = float(y.mean())
+        m2 = float(np.square(y - mean).sum())
+        n = self.count + k
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * k / n
+        self.mean += delta * k / n
+        # Seeded with the first value, like downsample.ema()
+        carry = self.ema if self.count else float(y[0])
+        decay = weight ** np.arange(k - 1, -1, -1, dtype=np.float64)
+        self.ema = weight ** k * carry + (1 - weight) * float(decay @ y)
+        self.count = n
+
+    def copy(self) -> "SeriesStats":
+        other = SeriesStats()
+        for f in self.FIELDS:
+            setattr(other, f, getattr(self, f))
+        return other
+
+    @classmethod
+    def from_row(cls, row) -> "SeriesStats":
+        st = cls()
+        for f in cls.FIELDS:
+            setattr(st, f, getattr(row, f))
+        return st
+
+    def as_row(self) -> dict:
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+    def as_dict(self) -> Optional[dict]:
+        if not self.count:
+            return None
+        var = self.m2 / self.count
+        return {
+            "count": self.count,
+            "last": self.last, "last_step": self.last_step,
+            "min": self.min, "min_step": self.min_step,
+            "max": self.max, "max_step": self.max_step,
+            "mean": self.mean, "var": var, "std": math.sqrt(var),
+            "ema": self.ema,
+        }
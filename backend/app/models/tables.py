@@ -0,0 +1,120 @@
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, PrimaryKeyConstraint,
+    Table, Text, func, true,
+)
+
+# Schema of the SQL run repository (repositories/sql.py). scripts/init.sql is
+# the same schema in Postgres DDL; keep the two in step.
+
+metadata = MetaData()
+
+# SQLite only auto-increments INTEGER PRIMARY KEY columns
+_RowId = BigInteger().with_variant(Integer, "sqlite")
+
+tenants = Table(
+    "tenants", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", Text, unique=True, nullable=False),
+    Column("status", Text, server_default="active"),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("tenant_id", Integer, ForeignKey("tenants.id")),
+    Column("email", Text, unique=True, nullable=False),
+    Column("name", Text, nullable=False, server_default=""),
+    Column("hash_pwd", Text, nullable=False),
+    Column("role", Text, nullable=False),
+    Column("is_active", Boolean, server_default=true()),
+)
+
+# tenant_id holds the tenant name, as in the API's run records
+runs = Table(
+    "runs", metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=False),
+    Column("tenant_id", Text, nullable=False),
+    Column("project_id", Integer),
+    Column("name", Text, nullable=False),
+    Column("status", Text, nullable=False),
+    Column("framework", Text, nullable=False),
+    Column("params_json", JSON),
+    Column("start_ts", BigInteger),
+    Column("end_ts", BigInteger),
+    Column("tags_json", JSON),
+    # List filters are always tenant-scoped and keyset-paginated on id
+    Index("ix_runs_tenant", "tenant_id", "id"),
+    Index("ix_runs_tenant_status", "tenant_id", "status", "id"),
+    Index("ix_runs_tenant_framework", "tenant_id", "framework", "id"),
+)
+
+# tags_json flattened for tag.<key>=<value> filters
+run_tags = Table(
+    "run_tags", metadata,
+    Column("run_id", BigInteger, ForeignKey("runs.id", ondelete="CASCADE"), nullable=False),
+    Column("tenant_id", Text, nullable=False),
+    Column("key", Text, nullable=False),
+    Column("value", Text, nullable=False),
+    PrimaryKeyConstraint("run_id", "key"),
+    Index("ix_run_tags_lookup", "tenant_id", "key", "value", "run_id"),
+)
+
+# Row id order is append order: a series' points and a run's log lines are
+# read back ordered by id, and log cursors are row ids.
+metrics = Table(
+    "metrics", metadata,
+    Column("id", _RowId, primary_key=True, autoincrement=True),
+    Column("run_id", BigInteger, nullable=False),
+    Column("name", Text, nullable=False),
+    Column("step", BigInteger, nullable=False),
+    Column("epoch", BigInteger, nullable=False),
+    Column("ts", Float, nullable=False),
+    Column("value", Float, nullable=False),
+    Index("ix_metrics_series", "run_id", "name", "id"),
+    Index("ix_metrics_series_ts", "run_id", "name", "ts", "id"),
+)
+
+# Running aggregates per series (models/stats.py), folded in by the same
+# transaction that inserts the points
+metric_summaries = Table(
+    "metric_summaries", metadata,
+    Column("run_id", BigInteger, nullable=False),
+    Column("name", Text, nullable=False),
+    Column("count", BigInteger, nullable=False),
+    Column("last", Float, nullable=False),
+    Column("last_step", BigInteger, nullable=False),
+    Column("min", Float, nullable=False),
+    Column("min_step", BigInteger, nullable=False),
+    Column("max", Float, nullable=False),
+    Column("max_step", BigInteger, nullable=False),
+    Column("mean", Float, nullable=False),
+    Column("m2", Float, nullable=False),
+    Column("ema", Float, nullable=False),
+    PrimaryKeyConstraint("run_id", "name"),
+)
+
+logs = Table(
+    "logs", metadata,
+    Column("id", _RowId, primary_key=True, autoincrement=True),
+    Column("run_id", BigInteger, nullable=False),
+    Column("level", Text, nullable=False),
+    Column("msg", Text, nullable=False),
+    Column("ts", BigInteger, nullable=False),
+    Index("ix_logs_run", "run_id", "id"),
+    Index("ix_logs_run_ts", "run_id", "ts"),
+)
+
+artifacts = Table(
+    "artifacts", metadata,
+    Column("id", _RowId, primary_key=True, autoincrement=True),
+    Column("run_id", BigInteger, nullable=False),
+    Column("name", Text),
+    Column("key", Text, nullable=False),  # blobs/sha256/<aa>/<sha256>, shared between runs
+    Column("size", BigInteger, nullable=False),
+    Column("checksum", Text),  # sha256 hex
+    Column("type", Text),
+    Column("created_at", Float, nullable=False),
+    Index("ix_artifacts_run", "run_id", "id"),
+    Index("ix_artifacts_checksum", "checksum"),
+)
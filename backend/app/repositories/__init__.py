@@ -0,0 +1,21 @@
+from ..core.config import settings
+from .memory import MemoryRepository
+from .sql import SqlRepository
+
+# The active run repository. Services look it up as `repositories.repo` on every
+# call; start() swaps in the SQL backend when DATABASE_URL is set.
+repo = MemoryRepository()
+
+
+async def start():
+    global repo
+    if settings.DATABASE_URL:
+        sql = SqlRepository(settings.DATABASE_URL)
+        await sql.start()
+        repo = sql
+
+
+async def stop():
+    global repo
+    current, repo = repo, MemoryRepository()
+    await current.close()
@@ -0,0 +1,255 @@
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..models.memory import BLOB_TENANTS, RUNS, RUN_ARTIFACTS, RUN_LOGS, RUN_METRICS, USERS
+from ..models.logs import RunLogs
+from ..models.series import Bounds, MetricSeries
+from ..services import downsample as ds, wal
+from ..services.streams import hub
+
+# Mutations of the in-process store. These stay synchronous so the WAL replay
+# (services/persistence.py) can re-apply records without an event loop; every
+# change is journaled here, next to the write it describes.
+
+
+def insert_run(record: dict):
+    RUNS.add(record)
+    RUN_METRICS.setdefault(record["id"], {})
+    if record["id"] not in RUN_LOGS:
+        RUN_LOGS[record["id"]] = RunLogs()
+    wal.journal.append(["run", record])
+
+
+def add_metrics(points) -> int:
+    # points is an iterable of (run_id, name, value, step, epoch, ts); series
+    # lookups are cached per batch.
+    now = time.time()
+    cache: Dict[tuple, MetricSeries] = {}
+    starts: Dict[tuple, int] = {}
+    n = 0
+    for run_id, name, value, step, epoch, ts in points:
+        s = cache.get((run_id, name))
+        if s is None:
+            by_name = RUN_METRICS.get(run_id)
+            if by_name is None:
+                by_name = RUN_METRICS[run_id] = {}
+            s = by_name.get(name)
+            if s is None:
+                s = by_name[name] = MetricSeries(name)
+            cache[(run_id, name)] = s
+            starts[(run_id, name)] = len(s)
+        s.append(value, step, epoch, ts or now)
+        n += 1
+    for key, s in cache.items():
+        s.track(starts[key])
+    if wal.journal.enabled:
+        # One journal record per touched series, holding the new column tails
+        for (run_id, name), s in cache.items():
+            wal.journal.append_raw(wal.KIND_SERIES, wal.pack_series(run_id, s, starts[(run_id, name)]))
+    for run_id, _ in cache:
+        hub.mark(("metrics", run_id))
+    return n
+
+
+def add_logs(lines) -> int:
+    # lines is an iterable of (run_id, level, msg, ts)
+    now = int(time.time())
+    n = 0
+    touched = set()
+    rows = [] if wal.journal.enabled else None
+    for run_id, level, msg, ts in lines:
+        logs = RUN_LOGS.get(run_id)
+        if logs is None:
+            logs = RUN_LOGS[run_id] = RunLogs()
+        ts = ts or now
+        logs.append(level, msg, ts)
+        if rows is not None:
+            rows.append((run_id, level, msg, ts))
+        touched.add(run_id)
+        n += 1
+    if rows:
+        wal.journal.append(["logs", rows])
+    for run_id in touched:
+        hub.publish(("logs", run_id))
+    return n
+
+
+def link_artifact(record: dict):
+    RUN_ARTIFACTS.setdefault(record["run_id"], []).append(record)
+    run = RUNS.get(record["run_id"])
+    if run is not None and record.get("checksum"):
+        BLOB_TENANTS.setdefault(record["checksum"], set()).add(run["tenant_id"])
+
+
+def add_artifact(record: dict):
+    link_artifact(record)
+    wal.journal.append(["artifact", record])
+
+
+def finish_run(run_id: int, status: str, end_ts: int):
+    RUNS.update(run_id, status=status, end_ts=end_ts)
+    wal.journal.append(["finish", run_id, status, end_ts])
+    hub.publish(("logs", run_id))
+    hub.publish(("metrics", run_id))
+
+
+class MemoryRepository:
+    # The single-process backend: the run catalog and the columnar metric/log
+    # stores in models/memory.py, made durable by the optional WAL.
+    poll_s: Optional[float] = None  # change notifications are in-process
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def commit(self):
+        await wal.journal.commit()
+
+    # --- runs ---
+
+    async def insert_run(self, record: dict):
+        insert_run(record)
+
+    async def get_run(self, run_id: int) -> Optional[dict]:
+        return RUNS.get(run_id)
+
+    async def query_runs(self, tenant: str, filters: Dict[str, str], cursor: Optional[int] = None,
+                         limit: Optional[int] = None, descending: bool = False) -> Tuple[List[dict], Optional[int]]:
+        return RUNS.query(tenant, filters, cursor, limit, descending)
+
+    async def latest_run_id(self) -> Optional[int]:
+        r = RUNS.last()
+        return r["id"] if r else None
+
+    async def finish_run(self, run_id: int, status: str, end_ts: int):
+        finish_run(run_id, status, end_ts)
+
+    # --- metrics ---
+
+    async def add_metrics(self, points) -> int:
+        return add_metrics(points)
+
+    async def has_metrics(self, run_id: int) -> bool:
+        return run_id in RUN_METRICS
+
+    async def series(self, run_id: int, name: str, columns: Optional[Sequence[str]] = None,
+                     ts: Bounds = (None, None), steps: Bounds = (None, None)) -> Optional[MetricSeries]:
+        # The live series, whole: windowing it costs nothing here (see SqlRepository)
+        return RUN_METRICS.get(run_id, {}).get(name)
+
+    async def series_len(self, run_id: int, name: str) -> int:
+        s = RUN_METRICS.get(run_id, {}).get(name)
+        return len(s) if s is not None else 0
+
+    async def series_end(self, run_id: int, name: str) -> Tuple[int, int]:
+        # (point count, read_points key of the last point); the key is a position
+        n = await self.series_len(run_id, name)
+        return n, n
+
+    async def read_points(self, run_id: int, name: str, after: Optional[int],
+                          limit: int) -> Tuple[List[Tuple[int, int, float, float]], Optional[int]]:
+        # (step, epoch, ts, value) of up to `limit` points after the key, and the
+        # key of the last one
+        s = RUN_METRICS.get(run_id, {}).get(name)
+        start = after or 0
+        if s is None:
+            return [], after
+        stop = min(len(s), start + limit)
+        return [s.point(i) for i in range(start, stop)], stop
+
+    async def metric_names(self, run_id: int) -> List[str]:
+        return sorted(RUN_METRICS.get(run_id, {}))
+
+    async def metric_window(self, run_id: int, name: str, ts_from: Optional[float], ts_to: Optional[float],
+                            cursor=None, limit: int = 1000) -> Tuple[List[Tuple[int, int, float, float]], Optional[int]]:
+        # (step, epoch, ts, value) of the points with ts in [ts_from, ts_to], in
+        # ts order and at most `limit` per call. The cursor is a position while
+        # ts is sorted (storage order is ts order), else a (ts, position) keyset.
+        s = RUN_METRICS.get(run_id, {}).get(name)
+        if s is None:
+            return [], None
+        if not s.ts_sorted:
+            if isinstance(cursor, int):  # ts stopped being sorted between pages
+                cursor = (s.point(cursor - 1)[2], cursor - 1) if cursor else None
+            page, cursor = ds.ts_page(ds.series_column(s, "ts"), ts_from, ts_to, cursor, limit)
+            return [s.point(int(i)) for i in page], cursor
+        lo, hi = s.ts_bounds(ts_from, ts_to)
+        pos = max(lo, cursor or 0)
+        stop = min(hi, pos + limit)
+        return s.rows(pos, stop), stop if stop < hi else None
+
+    async def summaries(self, run_ids: List[int], names: Optional[List[str]] = None) -> Dict[int, Dict[str, dict]]:
+        out = {}
+        for rid in run_ids:
+            by_name = RUN_METRICS.get(rid) or {}
+            out[rid] = {
+                name: s.stats.as_dict() for name, s in by_name.items()
+                if s.stats.count and (names is None or name in names)
+            }
+        return out
+
+    # --- logs ---
+
+    async def add_logs(self, lines) -> int:
+        return add_logs(lines)
+
+    async def has_logs(self, run_id: int) -> bool:
+        return bool(RUN_LOGS.get(run_id))
+
+    async def log_end(self, run_id: int) -> int:
+        # Cursor just past the newest line
+        logs = RUN_LOGS.get(run_id)
+        return len(logs) if logs else 0
+
+    async def search_logs(self, run_id: int, query: Optional[str], level: Optional[str], ts_from: Optional[int],
+                          ts_to: Optional[int], cursor: int = 0, limit: Optional[int] = None,
+                          end: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        # end is only needed by backends that can change during the call
+        logs = RUN_LOGS.get(run_id)
+        if logs is None:
+            return [], None
+        return logs.search(query, level, ts_from, ts_to, cursor, limit)
+
+    async def log_window(self, run_id: int, level: Optional[str], ts_from: Optional[int], ts_to: Optional[int],
+                         cursor=None, limit: int = 1000) -> Tuple[List[dict], Optional[object]]:
+        # Lines with ts in [ts_from, ts_to] in ts order, like metric_window
+        logs = RUN_LOGS.get(run_id)
+        if logs is None:
+            return [], None
+        if logs.ts_sorted and not isinstance(cursor, tuple):
+            return logs.search(None, level, ts_from, ts_to, cursor or 0, limit)
+        if isinstance(cursor, int):
+            cursor = (logs.ts_at(cursor - 1), cursor - 1) if cursor else None
+        page, cursor = ds.ts_page(logs.ts_column(), ts_from, ts_to, cursor, limit)
+        lvl = level.upper() if level else None
+        items = [logs.item(int(i)) for i in page]
+        return [x for x in items if not lvl or x["level"].upper() == lvl], cursor
+
+    # --- artifacts ---
+
+    async def add_artifact(self, record: dict):
+        add_artifact(record)
+
+    async def list_artifacts(self, run_id: int) -> List[dict]:
+        return list(RUN_ARTIFACTS.get(run_id, []))
+
+    async def blob_referenced(self, tenant: str, checksum: str) -> bool:
+        return tenant in BLOB_TENANTS.get(checksum, ())
+
+    # --- users ---
+
+    async def authenticate(self, email: str, password: str) -> Optional[dict]:
+        user = USERS.get(email)
+        if not user or user["password"] != password:
+            return None
+        return self._user(email)
+
+    async def get_user(self, email: str) -> Optional[dict]:
+        return self._user(email) if email in USERS else None
+
+    @staticmethod
+    def _user(email: str) -> dict:
+        u = USERS[email]
+        return {"id": u["id"], "name": u["name"], "email": email, "role": u["role"], "tenant": u["tenant"]}
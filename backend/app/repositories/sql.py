@@ -0,0 +1,447 @@
+import asyncio
+import logging
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from passlib.context import CryptContext
+from sqlalchemy import Table, and_, exists, func, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from ..core.config import settings
+from ..models import tables as t
+from ..models.memory import USERS
+from ..models.series import Bounds, MetricSeries
+from ..models.stats import SeriesStats
+from ..services.streams import hub
+
+log = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"])
+
+
+class _Batcher:
+    # Group commit for metric/log inserts: rows queued by concurrent requests
+    # within flush_ms go out in one transaction as multi-row executemany chunks
+    # of at most max_rows. add() returns once its rows are committed.
+    # before_commit(conn, pending) runs inside the same transaction.
+
+    def __init__(self, engine: AsyncEngine, flush_ms: int, max_rows: int, before_commit=None):
+        self.engine = engine
+        self.before_commit = before_commit
+        self.flush_s = flush_ms / 1000.0
+        self.max_rows = max_rows
+        self._pending: Dict[Table, List[dict]] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._count = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def add(self, table: Table, rows: List[dict]):
+        if not rows:
+            return
+        self._pending.setdefault(table, []).extend(rows)
+        self._count += len(rows)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        if self._count >= self.max_rows:
+            self._wake.set()
+        await fut
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._waiters:
+            return
+        pending, waiters = self._pending, self._waiters
+        self._pending, self._waiters, self._count = {}, [], 0
+        try:
+            async with self.engine.begin() as conn:
+                for table, rows in pending.items():
+                    for i in range(0, len(rows), self.max_rows):
+                        await conn.execute(table.insert(), rows[i:i + self.max_rows])
+                if self.before_commit is not None:
+                    await self.before_commit(conn, pending)
+        except Exception as e:
+            log.exception("batched insert failed")
+            for fut in waiters:
+                fut.done() or fut.set_exception(e)
+            return
+        for fut in waiters:
+            fut.done() or fut.set_result(None)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+# MetricSeries column -> metrics table column
+_COLUMN = {"steps": "step", "epochs": "epoch", "ts": "ts", "values": "value"}
+_COLUMNS = tuple(_COLUMN)
+
+
+class SqlRepository:
+    # Shared backend for running several replicas: SQLite (tests, single node) or
+    # Postgres through SQLAlchemy's async engine and connection pool. Metric
+    # windowing/downsampling and log matching use the same code as the memory
+    # backend, on series loaded from the metrics table.
+
+    def __init__(self, url: str):
+        pool = {} if url.startswith("sqlite") else {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_pre_ping": True,
+        }
+        self.engine = create_async_engine(url, **pool)
+        self.poll_s = settings.DB_POLL_S
+        self._batch = _Batcher(self.engine, settings.DB_FLUSH_MS, settings.DB_BATCH_ROWS, self._fold_summaries)
+
+    async def start(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(t.metadata.create_all)
+            await self._seed(conn)
+        self._batch.start()
+
+    async def _seed(self, conn):
+        # Demo tenant and users (models/memory.py) on an empty database
+        tenant_id = (await conn.execute(
+            select(t.tenants.c.id).where(t.tenants.c.name == settings.DEMO_TENANT))).scalar()
+        if tenant_id is None:
+            tenant_id = (await conn.execute(
+                t.tenants.insert().values(name=settings.DEMO_TENANT))).inserted_primary_key[0]
+        if (await conn.execute(select(func.count()).select_from(t.users))).scalar():
+            return
+        await conn.execute(t.users.insert(), [
+            {"tenant_id": tenant_id, "email": email, "name": u["name"],
+             "hash_pwd": pwd_context.hash(u["password"]), "role": u["role"]}
+            for email, u in USERS.items()
+        ])
+
+    async def close(self):
+        await self._batch.close()
+        await self.engine.dispose()
+
+    async def commit(self):
+        # add_metrics/add_logs only return after their transaction committed
+        pass
+
+    # --- runs ---
+
+    async def insert_run(self, record: dict):
+        tags = record.get("tags_json") or {}
+        async with self.engine.begin() as conn:
+            await conn.execute(t.runs.insert().values(**record))
+            if tags:
+                await conn.execute(t.run_tags.insert(), [
+                    {"run_id": record["id"], "tenant_id": record["tenant_id"], "key": k, "value": str(v)}
+                    for k, v in tags.items()
+                ])
+
+    async def get_run(self, run_id: int) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(select(t.runs).where(t.runs.c.id == run_id))).first()
+        return dict(row._mapping) if row else None
+
+    async def query_runs(self, tenant: str, filters: Dict[str, str], cursor: Optional[int] = None,
+                         limit: Optional[int] = None, descending: bool = False) -> Tuple[List[dict], Optional[int]]:
+        # Same filters and keyset cursor as RunCatalog.query
+        runs, tags = t.runs.c, t.run_tags.c
+        q = select(t.runs).where(runs.tenant_id == tenant)
+        for field, value in filters.items():
+            if field.startswith("tag."):
+                cond = [tags.run_id == runs.id, tags.tenant_id == tenant, tags.key == field[4:]]
+                if value != "*":
+                    cond.append(tags.value == value)
+                q = q.where(exists().where(*cond))
+            else:
+                q = q.where(runs[field] == value)
+        if cursor is not None:
+            q = q.where(runs.id < cursor if descending else runs.id > cursor)
+        q = q.order_by(runs.id.desc() if descending else runs.id)
+        if limit is not None:
+            q = q.limit(limit + 1)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(q)).all()
+        page = [dict(r._mapping) for r in rows[:limit]]
+        more = limit is not None and len(rows) > limit
+        return page, page[-1]["id"] if more else None
+
+    async def latest_run_id(self) -> Optional[int]:
+        # Run ids are time-ordered, so the newest run has the largest id
+        async with self.engine.connect() as conn:
+            return (await conn.execute(select(func.max(t.runs.c.id)))).scalar()
+
+    async def finish_run(self, run_id: int, status: str, end_ts: int):
+        async with self.engine.begin() as conn:
+            await conn.execute(t.runs.update().where(t.runs.c.id == run_id).values(status=status, end_ts=end_ts))
+        hub.publish(("logs", run_id))
+        hub.publish(("metrics", run_id))
+
+    # --- metrics ---
+
+    async def add_metrics(self, points) -> int:
+        now = time.time()
+        rows = [
+            {"run_id": run_id, "name": name, "value": value, "step": step or 0, "epoch": epoch or 0, "ts": ts or now}
+            for run_id, name, value, step, epoch, ts in points
+        ]
+        await self._batch.add(t.metrics, rows)
+        for run_id in {r["run_id"] for r in rows}:
+            hub.mark(("metrics", run_id))
+        return len(rows)
+
+    async def has_metrics(self, run_id: int) -> bool:
+        async with self.engine.connect() as conn:
+            return bool((await conn.execute(select(exists().where(t.runs.c.id == run_id)))).scalar())
+
+    async def series(self, run_id: int, name: str, columns: Optional[Sequence[str]] = None,
+                     ts: Bounds = (None, None), steps: Bounds = (None, None)) -> Optional[MetricSeries]:
+        # The series with only the points inside the inclusive ts and steps bounds
+        # and only the given columns ("steps", "epochs", "ts", "values"; the rest
+        # read as 0). Points without a step are kept by the steps bounds, as their
+        # x falls back to the epoch. If the x of a loaded point falls back to its
+        # position the bounds are dropped, since positions count every point.
+        m = t.metrics.c
+        columns = set(columns or _COLUMNS)
+        if "steps" in columns or steps != (None, None):
+            columns |= {"steps", "epochs"}
+        names = [c for c in _COLUMNS if c in columns]
+        base = select(*(getattr(m, _COLUMN[c]) for c in names)).where(m.run_id == run_id, m.name == name)
+        q = base
+        if ts[0] is not None:
+            q = q.where(m.ts >= ts[0])
+        if ts[1] is not None:
+            q = q.where(m.ts <= ts[1])
+        within = ([m.step >= steps[0]] if steps[0] is not None else []) + \
+                 ([m.step <= steps[1]] if steps[1] is not None else [])
+        if within:
+            q = q.where(or_(m.step == 0, and_(*within)))
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(q.order_by(m.id))).all()
+            if q is not base and "steps" in columns and any(not r.step and not r.epoch for r in rows):
+                rows = (await conn.execute(base.order_by(m.id))).all()
+        if not rows:
+            return None
+        data = dict(zip(names, zip(*rows)))
+        zeros = (0,) * len(rows)
+        s = MetricSeries(name)
+        s.extend(array("q", data.get("steps", zeros)), array("q", data.get("epochs", zeros)),
+                 array("d", data.get("ts", zeros)), array("d", data.get("values", zeros)))
+        return s
+
+    def _insert(self, table: Table):
+        # INSERT with the dialect's ON CONFLICT clauses
+        return (postgresql if self.engine.dialect.name == "postgresql" else sqlite).insert(table)
+
+    async def _fold_summaries(self, conn, pending: Dict[Table, List[dict]]):
+        # Merges the flushed points into metric_summaries, one row per series.
+        # Missing rows are created empty first (ON CONFLICT DO NOTHING), so the
+        # SELECT ... FOR UPDATE locks every row of the batch and concurrent
+        # replicas serialize on it, also for the first points of a series.
+        groups: Dict[Tuple[int, str], List[dict]] = {}
+        for r in pending.get(t.metrics, ()):
+            groups.setdefault((r["run_id"], r["name"]), []).append(r)
+        if not groups:
+            return
+        ms = t.metric_summaries
+        keys = sorted(groups)
+        empty = SeriesStats().as_row()
+        await conn.execute(self._insert(ms).on_conflict_do_nothing(),
+                           [{"run_id": rid, "name": name, **empty} for rid, name in keys])
+        q = (select(ms).where(tuple_(ms.c.run_id, ms.c.name).in_(keys))
+             .order_by(ms.c.run_id, ms.c.name).with_for_update())
+        existing = {(r.run_id, r.name): r for r in (await conn.execute(q)).all()}
+        for key, rows in groups.items():
+            st = SeriesStats.from_row(existing[key])
+            steps = np.fromiter((r["step"] for r in rows), np.int64, len(rows))
+            epochs = np.fromiter((r["epoch"] for r in rows), np.int64, len(rows))
+            pos = np.arange(st.count + 1, st.count + len(rows) + 1, dtype=np.int64)
+            x = np.where(steps != 0, steps, np.where(epochs != 0, epochs, pos))
+            st.merge(x, np.fromiter((r["value"] for r in rows), np.float64, len(rows)), settings.SUMMARY_EMA_WEIGHT)
+            await conn.execute(ms.update().where(ms.c.run_id == key[0], ms.c.name == key[1]).values(**st.as_row()))
+
+    async def metric_names(self, run_id: int) -> List[str]:
+        # One summary row per series, cheaper than DISTINCT over the points
+        c = t.metric_summaries.c
+        q = select(c.name).where(c.run_id == run_id).order_by(c.name)
+        async with self.engine.connect() as conn:
+            return list((await conn.execute(q)).scalars())
+
+    async def metric_window(self, run_id: int, name: str, ts_from: Optional[float], ts_to: Optional[float],
+                            cursor=None, limit: int = 1000) -> Tuple[List[Tuple[int, int, float, float]], Optional[tuple]]:
+        # Keyset pages over ix_metrics_series_ts, so rows come back in ts order;
+        # the cursor is the (ts, id) of the last row returned
+        m = t.metrics.c
+        q = select(m.id, m.step, m.epoch, m.ts, m.value).where(m.run_id == run_id, m.name == name)
+        if ts_from is not None:
+            q = q.where(m.ts >= ts_from)
+        if ts_to is not None:
+            q = q.where(m.ts <= ts_to)
+        if cursor is not None:
+            q = q.where(tuple_(m.ts, m.id) > tuple_(*cursor))
+        q = q.order_by(m.ts, m.id).limit(limit + 1)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(q)).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [(r.step, r.epoch, r.ts, r.value) for r in rows], (rows[-1].ts, rows[-1].id) if more else None
+
+    async def summaries(self, run_ids: List[int], names: Optional[List[str]] = None) -> Dict[int, Dict[str, dict]]:
+        ms = t.metric_summaries
+        q = select(ms).where(ms.c.run_id.in_(run_ids))
+        if names is not None:
+            q = q.where(ms.c.name.in_(names))
+        out: Dict[int, Dict[str, dict]] = {rid: {} for rid in run_ids}
+        async with self.engine.connect() as conn:
+            for r in (await conn.execute(q)).all():
+                out[r.run_id][r.name] = SeriesStats.from_row(r).as_dict()
+        return out
+
+    async def series_len(self, run_id: int, name: str) -> int:
+        # The summary row's count is committed with the points, and is a key lookup
+        c = t.metric_summaries.c
+        async with self.engine.connect() as conn:
+            return (await conn.execute(select(c.count).where(c.run_id == run_id, c.name == name))).scalar() or 0
+
+    async def series_end(self, run_id: int, name: str) -> Tuple[int, Optional[int]]:
+        # Point count and id of the last point, in one statement so they agree
+        c, m = t.metric_summaries.c, t.metrics.c
+        count = select(c.count).where(c.run_id == run_id, c.name == name).scalar_subquery()
+        last = select(func.max(m.id)).where(m.run_id == run_id, m.name == name).scalar_subquery()
+        async with self.engine.connect() as conn:
+            n, key = (await conn.execute(select(count, last))).one()
+        return n or 0, key
+
+    async def read_points(self, run_id: int, name: str, after: Optional[int],
+                          limit: int) -> Tuple[List[Tuple[int, int, float, float]], Optional[int]]:
+        # Keyset pages over ix_metrics_series, so a poll costs the same however
+        # long the series is: the key is the id of the last point read
+        m = t.metrics.c
+        q = select(m.id, m.step, m.epoch, m.ts, m.value).where(m.run_id == run_id, m.name == name)
+        if after is not None:
+            q = q.where(m.id > after)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(q.order_by(m.id).limit(limit))).all()
+        return [(r.step, r.epoch, r.ts, r.value) for r in rows], rows[-1].id if rows else after
+
+    # --- logs ---
+
+    async def add_logs(self, lines) -> int:
+        now = int(time.time())
+        rows = [{"run_id": run_id, "level": level, "msg": msg, "ts": ts or now} for run_id, level, msg, ts in lines]
+        await self._batch.add(t.logs, rows)
+        for run_id in {r["run_id"] for r in rows}:
+            hub.publish(("logs", run_id))
+        return len(rows)
+
+    async def has_logs(self, run_id: int) -> bool:
+        async with self.engine.connect() as conn:
+            return bool((await conn.execute(select(exists().where(t.logs.c.run_id == run_id)))).scalar())
+
+    async def log_end(self, run_id: int) -> int:
+        # Log cursors are row ids
+        async with self.engine.connect() as conn:
+            last = (await conn.execute(select(func.max(t.logs.c.id)).where(t.logs.c.run_id == run_id))).scalar()
+        return last + 1 if last is not None else 0
+
+    async def search_logs(self, run_id: int, query: Optional[str], level: Optional[str], ts_from: Optional[int],
+                          ts_to: Optional[int], cursor: int = 0, limit: Optional[int] = None,
+                          end: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        c = t.logs.c
+        q = select(c.id, c.level, c.msg, c.ts).where(c.run_id == run_id, c.id >= cursor)
+        if end is not None:
+            q = q.where(c.id < end)
+        if query:
+            q = q.where(func.lower(c.msg).contains(query.lower(), autoescape=True))
+        if level:
+            q = q.where(func.upper(c.level) == level.upper())
+        if ts_from is not None:
+            q = q.where(c.ts >= ts_from)
+        if ts_to is not None:
+            q = q.where(c.ts <= ts_to)
+        q = q.order_by(c.id)
+        if limit is not None:
+            q = q.limit(limit + 1)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(q)).all()
+        items = [{"level": r.level, "msg": r.msg, "ts": r.ts} for r in rows[:limit]]
+        more = limit is not None and len(rows) > limit
+        return items, rows[limit].id if more else None
+
+    async def log_window(self, run_id: int, level: Optional[str], ts_from: Optional[int], ts_to: Optional[int],
+                         cursor=None, limit: int = 1000) -> Tuple[List[dict], Optional[tuple]]:
+        # Keyset pages in ts order over ix_logs_run_ts; the cursor is the
+        # (ts, id) of the last row returned
+        c = t.logs.c
+        q = select(c.id, c.level, c.msg, c.ts).where(c.run_id == run_id)
+        if level:
+            q = q.where(func.upper(c.level) == level.upper())
+        if ts_from is not None:
+            q = q.where(c.ts >= ts_from)
+        if ts_to is not None:
+            q = q.where(c.ts <= ts_to)
+        if cursor is not None:
+            q = q.where(tuple_(c.ts, c.id) > tuple_(*cursor))
+        q = q.order_by(c.ts, c.id).limit(limit + 1)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(q)).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [{"level": r.level, "msg": r.msg, "ts": r.ts} for r in rows], (rows[-1].ts, rows[-1].id) if more else None
+
+    # --- artifacts ---
+
+    async def add_artifact(self, record: dict):
+        async with self.engine.begin() as conn:
+            await conn.execute(t.artifacts.insert().values(**record))
+
+    async def list_artifacts(self, run_id: int) -> List[dict]:
+        a = t.artifacts.c
+        q = select(a.run_id, a.name, a.key, a.size, a.checksum, a.type, a.created_at).where(a.run_id == run_id).order_by(a.id)
+        async with self.engine.connect() as conn:
+            return [dict(r._mapping) for r in (await conn.execute(q)).all()]
+
+    async def blob_referenced(self, tenant: str, checksum: str) -> bool:
+        a, r = t.artifacts.c, t.runs.c
+        q = (select(a.id).select_from(t.artifacts.join(t.runs, a.run_id == r.id))
+             .where(a.checksum == checksum, r.tenant_id == tenant).limit(1))
+        async with self.engine.connect() as conn:
+            return (await conn.execute(q)).first() is not None
+
+    # --- users ---
+
+    def _user_query(self):
+        u = t.users.c
+        return (select(u.id, u.name, u.email, u.role, u.hash_pwd, t.tenants.c.name.label("tenant"))
+                .select_from(t.users.join(t.tenants, t.tenants.c.id == u.tenant_id))
+                .where(u.is_active.is_(True)))
+
+    @staticmethod
+    def _user(row) -> dict:
+        return {"id": row.id, "name": row.name, "email": row.email, "role": row.role, "tenant": row.tenant}
+
+    async def authenticate(self, email: str, password: str) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(self._user_query().where(t.users.c.email == email))).first()
+        if row is None or not pwd_context.verify(password, row.hash_pwd):
+            return None
+        return self._user(row)
+
+    async def get_user(self, email: str) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(self._user_query().where(t.users.c.email == email))).first()
+        return self._user(row) if row else None
@@ -1,9 +1,23 @@
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, Field
+
+# Longest lifetime an API token can be issued with
+MAX_API_TOKEN_DAYS = 365
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    expires_in: Optional[int] = None
+    refresh_token: Optional[str] = None
+
+
+class RefreshReq(BaseModel):
+    refresh_token: str
+
+
+class ApiTokenReq(BaseModel):
+    ttl_days: Optional[int] = Field(None, ge=1, le=MAX_API_TOKEN_DAYS)
 
 
 class User(BaseModel):
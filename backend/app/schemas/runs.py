@@ -0,0 +1,12 @@
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class ReplayReq(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    ts_from: Optional[float] = Field(None, alias="from")
+    ts_to: Optional[float] = Field(None, alias="to")
+    metrics: Optional[List[str]] = None  # default: every series of the run
+    logs: bool = True
+    level: Optional[str] = None
@@ -37,3 +37,9 @@ class SDKFinishReq(BaseModel):
     run_id: Optional[int] = None
     status: str = "success"
     ts: Optional[int] = None
+
+
+class SDKArtifactRefReq(BaseModel):
+    run_id: Optional[int] = None
+    name: str
+    sha256: str
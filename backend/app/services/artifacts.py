@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Set
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+from ..core.config import settings
+from . import http_cache, storage
+
+log = logging.getLogger(__name__)
+
+# Artifact reads. Blobs are content-addressed, so a local copy named by its
+# sha256 can never be stale and the cache in front of the store is a plain
+# byte-bounded LRU of files. A full read of a blob that fits is teed into it;
+# a range read (Netron and friends fetch models piecewise) is served from the
+# store while one background fill per blob brings in the whole object. Copies
+# are checked against the digest before they are published, and the LRU order
+# is mirrored in file mtimes so it survives a restart.
+
+CHUNK = 1 << 20
+
+
+def _append(f, h, chunk: bytes):
+    f.write(chunk)
+    h.update(chunk)
+
+
+class BlobCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items: Optional["OrderedDict[str, int]"] = None
+        self._filling: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256)
+
+    def _load(self):
+        if self._items is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.name.endswith(".tmp"):
+                os.unlink(e.path)
+            elif len(e.name) == 64:
+                st = e.stat()
+                entries.append((st.st_mtime, e.name, st.st_size))
+        self._items = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self.nbytes = sum(self._items.values())
+
+    def fits(self, size: int) -> bool:
+        # One blob may take at most a quarter of the cache
+        return 0 < size <= self.max_bytes // 4
+
+    def get(self, sha256: str) -> Optional[str]:
+        # Path of the cached blob, marked as recently used
+        if not self.max_bytes:
+            return None
+        self._load()
+        if sha256 not in self._items:
+            return None
+        path = self.path(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.nbytes -= self._items.pop(sha256)
+            return None
+        self._items.move_to_end(sha256)
+        return path
+
+    def _add(self, sha256: str, size: int):
+        self._items[sha256] = size
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            old, n = self._items.popitem(last=False)
+            self.nbytes -= n
+            try:
+                os.unlink(self.path(old))
+            except FileNotFoundError:
+                pass
+
+    async def tee(self, sha256: str, key: str, size: int) -> AsyncIterator[bytes]:
+        # Streams the whole blob from the store while writing it into the cache
+        self._load()
+        self._filling.add(sha256)
+        tmp = os.path.join(self.directory, f".{sha256}.{uuid.uuid4().hex}.tmp")
+        f = open(tmp, "wb")
+        h = hashlib.sha256()
+        n = 0
+        complete = False
+        try:
+            async for chunk in storage.read_object(key, chunk=CHUNK):
+                await asyncio.to_thread(_append, f, h, chunk)
+                n += len(chunk)
+                yield chunk
+            complete = True
+        finally:
+            f.close()
+            self._filling.discard(sha256)
+            if complete and n == size and h.hexdigest() == sha256 and sha256 not in self._items:
+                os.replace(tmp, self.path(sha256))
+                self._add(sha256, n)
+            else:
+                os.unlink(tmp)
+
+    def prefetch(self, sha256: str, key: str, size: int):
+        # Starts one background fill of the blob, unless one is running
+        if sha256 in self._filling:
+            return
+
+        async def fill():
+            try:
+                async for _ in self.tee(sha256, key, size):
+                    pass
+            except Exception as e:
+                log.warning("artifact cache fill of %s failed: %s", sha256, e)
+
+        task = asyncio.ensure_future(fill())
+        self._filling.add(sha256)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+cache = BlobCache(settings.ARTIFACT_CACHE_DIR, settings.ARTIFACT_CACHE_MB << 20)
+
+
+async def _read_file(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    # The open file survives an eviction that unlinks it meanwhile
+    f = open(path, "rb")
+    try:
+        f.seek(start)
+        left = end - start
+        while left > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK, left))
+            if not chunk:
+                return
+            left -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _body(sha256: Optional[str], key: str, size: int, start: int, end: int) -> AsyncIterator[bytes]:
+    path = cache.get(sha256) if sha256 else None
+    if path is not None:
+        return _read_file(path, start, end)
+    if not await storage.get_minio_client():
+        raise HTTPException(503, detail="Artifact storage unavailable")
+    if sha256 and cache.fits(size) and sha256 not in cache._filling:
+        if end - start == size:
+            return cache.tee(sha256, key, size)
+        cache.prefetch(sha256, key, size)
+    return storage.read_object(key, start, end - start, chunk=CHUNK)
+
+
+async def download(artifact: dict, range_header: Optional[str], if_none_match: Optional[str]) -> Response:
+    # artifact is an entry of runs.artifact_index(); the sha256 is a strong ETag
+    sha256, key, size = artifact["sha256"], artifact["key"], artifact["size"]
+    headers = {"Accept-Ranges": "bytes"}
+    if sha256:
+        tag = f'"{sha256}"'
+        if http_cache.matches(if_none_match, tag):
+            return http_cache.not_modified(tag)
+        headers.update({"ETag": tag, "Cache-Control": "private, no-cache"})
+    try:
+        window = http_cache.byte_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    start, end = window or (0, size)
+    if window:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(await _body(sha256, key, size, start, end), status_code=206 if window else 200,
+                             media_type=artifact["type"] or "application/octet-stream", headers=headers)
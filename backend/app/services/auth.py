@@ -1,26 +1,122 @@
 import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from .. import repositories
+from ..core.config import settings
 from ..schemas.auth import Token, User
-from ..models.memory import USERS, TOKENS, TENANT
+from ..models.memory import TENANT
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Tokens are HS256 JWTs carrying the user, so any replica holding AUTH_SECRET
+# can verify them without shared state. typ is "access" (short-lived, from
+# login), "refresh" (only accepted by /auth/token/refresh) or "api" (long-lived,
+# for SDKs and agents). A disabled user keeps working until the token expires;
+# refresh re-reads the user.
+ALGORITHM = "HS256"
+DEMO_USER = User(id=1, name="Demo Admin", email="demo@oneservice.local", role="TENANT_ADMIN", tenant=TENANT)
+
+
+class _UserCache:
+    # token -> (User, typ, expires_at), LRU-bounded; an entry lives until the
+    # token's exp or AUTH_CACHE_TTL_S, whichever comes first
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[User, str, float]]" = OrderedDict()
+
+    def get(self, token: str, now: float) -> Optional[Tuple[User, str]]:
+        hit = self._items.get(token)
+        if hit is None:
+            return None
+        if hit[2] <= now:
+            del self._items[token]
+            return None
+        self._items.move_to_end(token)
+        return hit[0], hit[1]
+
+    def put(self, token: str, user: User, typ: str, exp: float, now: float):
+        self._items[token] = (user, typ, min(exp, now + self.ttl))
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+
+_cache = _UserCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_S)
+
+
+def issue_token(user: dict, typ: str, ttl: int) -> str:
+    now = int(time.time())
+    claims = {"sub": user["email"], "uid": user["id"], "name": user["name"], "role": user["role"],
+              "tenant": user["tenant"], "typ": typ, "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, settings.AUTH_SECRET, algorithm=ALGORITHM)
+
+
+def _decode(token: str) -> dict:
+    try:
+        return jwt.decode(token, settings.AUTH_SECRET, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def _resolve(token: str) -> Tuple[User, str]:
+    now = time.time()
+    hit = _cache.get(token, now)
+    if hit is not None:
+        return hit
+    claims = _decode(token)
+    typ = claims.get("typ")
+    if typ not in ("access", "api"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    user = User(id=claims["uid"], name=claims["name"], email=claims["sub"], role=claims["role"],
+                tenant=claims["tenant"])
+    _cache.put(token, user, typ, claims["exp"], now)
+    return user, typ
+
+
+def _session(user: dict) -> Token:
+    return Token(access_token=issue_token(user, "access", settings.ACCESS_TOKEN_TTL_S),
+                 expires_in=settings.ACCESS_TOKEN_TTL_S,
+                 refresh_token=issue_token(user, "refresh", settings.REFRESH_TOKEN_TTL_S))
+
 
 async def login_service(form_data: OAuth2PasswordRequestForm = Depends()) -> Token:
-    user = USERS.get(form_data.username)
-    if not user or user["password"] != form_data.password:
+    user = await repositories.repo.authenticate(form_data.username, form_data.password)
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    token = f"tok-{int(time.time()*1000)}-{form_data.username}"
-    TOKENS[token] = form_data.username
-    return Token(access_token=token)
+    return _session(user)
+
+
+async def refresh_service(refresh_token: str) -> Token:
+    claims = _decode(refresh_token)
+    if claims.get("typ") != "refresh":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not a refresh token")
+    user = await repositories.repo.get_user(claims["sub"])
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is disabled")
+    return _session(user)
+
+
+def api_token_service(user: User, ttl_days: Optional[int] = None) -> Token:
+    ttl = ttl_days * 86400 if ttl_days else settings.API_TOKEN_TTL_S
+    return Token(access_token=issue_token(user.model_dump(), "api", ttl), expires_in=ttl)
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     if token == "tok-demo":
-        return User(id=1, name="Demo Admin", email="demo@oneservice.local", role="TENANT_ADMIN", tenant=TENANT)
-    user_email = TOKENS.get(token)
-    if not user_email or user_email not in USERS:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = USERS[user_email]
-    return User(id=user["id"], name=user["name"], email=user_email, role=user["role"], tenant=user["tenant"])
+        return DEMO_USER
+    return _resolve(token)[0]
+
+
+async def get_session_user(token: str = Depends(oauth2_scheme)) -> User:
+    # Like get_current_user, but API tokens are refused (they cannot mint tokens)
+    if token == "tok-demo":
+        return DEMO_USER
+    user, typ = _resolve(token)
+    if typ != "access":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requires a login session")
+    return user
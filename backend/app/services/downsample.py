@@ -0,0 +1,203 @@
+from typing import Optional, Tuple
+import numpy as np
+
+from ..models.series import MetricSeries
+
+
+# NumPy views over MetricSeries columns are zero-copy (np.frombuffer), but an
+# array.array cannot grow while a view is alive. Only use these inside
+# synchronous code and drop the views before returning to the event loop.
+# Series with a cold tier read their memory-mapped prefix too; only the parts
+# of the two tiers inside [start, stop) are copied and joined.
+
+def series_column(s: MetricSeries, col: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+    hot = getattr(s, col)
+    view = np.frombuffer(hot, dtype=np.int64 if hot.typecode == "q" else np.float64)
+    n = s.offset
+    stop = n + len(view) if stop is None else stop
+    if start >= n:
+        return view[start - n:stop - n]
+    cold = s.cold.columns()[("steps", "epochs", "ts", "values").index(col)]
+    if stop <= n:
+        return cold[start:stop]
+    return np.concatenate((cold[start:], view[:stop - n]))
+
+
+def series_xy(s: MetricSeries, start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    y = series_column(s, "values", start, stop)
+    steps = series_column(s, "steps", start, stop)
+    if s.steps_sorted:
+        return steps, y
+    # Mixed step/epoch/position axis: materialize x the same way x_at() does
+    epochs = series_column(s, "epochs", start, stop)
+    pos = np.arange(start + 1, start + len(steps) + 1, dtype=np.int64)
+    return np.where(steps != 0, steps, np.where(epochs != 0, epochs, pos)), y
+
+
+def range_slice(x: np.ndarray, x_sorted: bool, lo: Optional[float], hi: Optional[float]):
+    # Returns a slice when x is sorted (binary search, no copy) or an index array
+    if lo is None and hi is None:
+        return slice(0, len(x))
+    if x_sorted:
+        start = 0 if lo is None else int(np.searchsorted(x, lo, side="left"))
+        stop = len(x) if hi is None else int(np.searchsorted(x, hi, side="right"))
+        return slice(start, max(start, stop))
+    mask = np.ones(len(x), dtype=bool)
+    if lo is not None:
+        mask &= x >= lo
+    if hi is not None:
+        mask &= x <= hi
+    return np.flatnonzero(mask)
+
+
+def narrow_after(sel, col: np.ndarray, col_sorted: bool, value: float):
+    # Restrict a range_slice() result to points whose col value is > value
+    if isinstance(sel, slice) and col_sorted:
+        start = max(sel.start, int(np.searchsorted(col, value, side="right")))
+        return slice(start, max(start, sel.stop))
+    idx = np.arange(sel.start, sel.stop) if isinstance(sel, slice) else sel
+    return idx[col[idx] > value]
+
+
+def ts_page(ts: np.ndarray, ts_from: Optional[float], ts_to: Optional[float], cursor: Optional[tuple],
+            limit: int) -> Tuple[np.ndarray, Optional[tuple]]:
+    # Positions of the next `limit` points of an unsorted ts column within
+    # [ts_from, ts_to], in (ts, position) order. The cursor is the (ts, position)
+    # of the last point returned, like the SQL keyset pages; None after the last.
+    idx = range_slice(ts, False, ts_from, ts_to)
+    if cursor is not None:
+        t, p = cursor
+        v = ts[idx]
+        idx = idx[(v > t) | ((v == t) & (idx > p))]
+    order = idx[np.lexsort((idx, ts[idx]))]
+    page = order[:limit]
+    return page, (ts[page[-1]].item(), int(page[-1])) if len(order) > limit else None
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    # Keep the min and max of each bucket, in index order: n_out // 2 buckets
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 4:
+        # Too few for a bucket: the extremes first, then the endpoints
+        keep = dict.fromkeys([int(y.argmin()), int(y.argmax()), 0, n - 1])
+        return np.array(sorted(list(keep)[:n_out]), dtype=np.int64)
+    buckets = n_out // 2
+    size = -(-n // buckets)
+    full = n // size
+    grid = y[:full * size].reshape(full, size)
+    base = np.arange(full) * size
+    idx = [base + grid.argmin(axis=1), base + grid.argmax(axis=1)]
+    if full * size < n:
+        tail = y[full * size:]
+        idx.append(np.array([full * size + tail.argmin(), full * size + tail.argmax()]))
+    return np.unique(np.concatenate(idx))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: keeps first/last point and, per bucket, the
+    # point forming the largest triangle with the previous pick and the mean of
+    # the next bucket. Work inside each bucket is vectorized.
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    xf = x.astype(np.float64, copy=False)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx = xf[nlo:nhi].mean()
+        cy = y[nlo:nhi].mean()
+        bx = xf[lo:hi]
+        by = y[lo:hi]
+        area = np.abs((xf[a] - cx) * (by - y[a]) - (xf[a] - bx) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: Optional[int], method: str = "lttb") -> np.ndarray:
+    if not max_points or len(y) <= max_points:
+        return np.arange(len(y))
+    if method == "minmax":
+        return minmax_indices(y, max_points)
+    return lttb_indices(x, y, max_points)
+
+
+def ema(y: np.ndarray, weight: float) -> np.ndarray:
+    # s[i] = weight * s[i-1] + (1 - weight) * y[i], s[0] = y[0], without a Python
+    # loop per point. Within a block, s[i] = w^i * (s0 + (1-w) * cumsum(y[k] / w^k));
+    # blocks are kept short enough that w^-k cannot overflow.
+    n = len(y)
+    out = np.empty(n, dtype=np.float64)
+    if not n or weight <= 0:
+        out[:] = y
+        return out
+    block = max(1, min(n, int(np.log(1e150) / -np.log(weight))))
+    powers = weight ** np.arange(block + 1, dtype=np.float64)
+    carry = float(y[0])
+    for start in range(0, n, block):
+        chunk = np.asarray(y[start:start + block], dtype=np.float64)
+        m = len(chunk)
+        p = powers[1:m + 1]
+        out[start:start + m] = p * (carry + (1 - weight) * np.cumsum(chunk / p))
+        carry = out[start + m - 1]
+    return out
+
+
+def resample(x: np.ndarray, y: np.ndarray, grid: np.ndarray, x_sorted: bool = False) -> np.ndarray:
+    # Linear interpolation of (x, y) onto grid; NaN outside the series' x range.
+    # Only the 2 * len(grid) neighbouring points are touched when x is sorted.
+    n = len(x)
+    if not n:
+        return np.full(len(grid), np.nan)
+    if not x_sorted and n > 1 and np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind="stable")
+        x, y = x[order], y[order]
+    right = np.searchsorted(x, grid, side="right")
+    i0 = np.clip(right - 1, 0, n - 1)
+    i1 = np.minimum(right, n - 1)
+    x0, x1 = x[i0].astype(np.float64), x[i1].astype(np.float64)
+    y0, y1 = y[i0], y[i1]
+    dx = x1 - x0
+    t = np.divide(grid - x0, dx, out=np.zeros(len(grid)), where=dx > 0)
+    out = y0 + t * (y1 - y0)
+    out[(right == 0) | (grid > x[-1])] = np.nan
+    return out
+
+
+def bucket(x: np.ndarray, y: np.ndarray, interval: float, agg: str = "last",
+           x_sorted: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    # Fixed-width buckets aligned to multiples of interval (like a Prometheus
+    # range query step): returns (bucket starts, reduced values) for the buckets
+    # that hold at least one point. agg is last | mean | max | count.
+    if not len(x):
+        return np.empty(0), np.empty(0)
+    if not x_sorted and len(x) > 1 and np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind="stable")
+        x, y = x[order], y[order]
+    first, last = np.floor_divide(x[0], interval), np.floor_divide(x[-1], interval)
+    if last - first < len(x):
+        # Fewer buckets than points: binary-search each bucket edge instead of
+        # keying every point
+        keys = np.arange(first, last + 1)
+        starts = np.unique(np.searchsorted(x, keys * interval, side="left"))
+        starts = starts[starts < len(x)]
+        keys = np.floor_divide(x[starts], interval)
+    else:
+        keys = np.floor_divide(x, interval)
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        keys = keys[starts]
+    if agg == "last":
+        values = y[np.append(starts[1:], len(y)) - 1]
+    elif agg == "max":
+        values = np.maximum.reduceat(y, starts)
+    else:
+        counts = np.diff(np.append(starts, len(y)))
+        values = counts.astype(np.float64) if agg == "count" else np.add.reduceat(y, starts) / counts
+    return keys * interval, values
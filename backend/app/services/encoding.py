@@ -0,0 +1,81 @@
+import asyncio
+import functools
+import gzip
+from typing import Optional
+
+import numpy as np
+import orjson
+from fastapi import Response
+
+from ..core.config import settings
+
+# Optional encoders; without them the formats/codings are simply not offered
+try:
+    import msgpack
+except Exception:  # pragma: no cover
+    msgpack = None  # type: ignore
+try:
+    import zstandard
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+# Response formats for the large read routes (/runs/{id}/metrics and /logs),
+# picked from the Accept header:
+#   application/json                        the original shape, a dict per point
+#   application/vnd.oneservice.columns+json parallel columns ("x"/"values" per
+#                                           series, "ts"/"level"/"msg" for logs)
+#   application/msgpack                     the same columns, numeric ones as raw
+#                                           little-endian bytes {"dtype", "data"}
+# Columns are numpy arrays handed straight to orjson/msgpack, so no per-point
+# Python object is built on the way out.
+JSON = "application/json"
+COLUMNS = "application/vnd.oneservice.columns+json"
+MSGPACK = "application/msgpack"
+
+# Low levels: most of the gain on numeric payloads at a fraction of the CPU
+_ZSTD = zstandard.ZstdCompressor(level=1) if zstandard is not None else None
+# Bodies above this are compressed in a worker thread (both codecs drop the GIL)
+_OFFLOAD_BYTES = 1 << 20
+
+
+def negotiate(accept: Optional[str]) -> str:
+    # First supported type in the header wins; q-values are not weighed
+    for part in (accept or "").split(","):
+        media = part.split(";", 1)[0].strip().lower()
+        if media == COLUMNS:
+            return COLUMNS
+        if media in (MSGPACK, "application/x-msgpack") and msgpack is not None:
+            return MSGPACK
+        if media == JSON:
+            return JSON
+    return JSON
+
+
+def _packable(obj):
+    if isinstance(obj, np.ndarray):
+        a = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<"))
+        return {"dtype": a.dtype.str, "data": a.tobytes()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"cannot pack {type(obj).__name__}")
+
+
+async def render(payload, media_type: str, accept_encoding: Optional[str] = None) -> Response:
+    if media_type == MSGPACK:
+        body = msgpack.packb(payload, default=_packable)
+    else:
+        body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    threshold = settings.RESPONSE_COMPRESS_MIN_BYTES
+    if threshold and len(body) >= threshold and accept_encoding:
+        codings = {c.split(";", 1)[0].strip().lower() for c in accept_encoding.split(",")}
+        compress = None
+        if "zstd" in codings and _ZSTD is not None:
+            compress = _ZSTD.compress
+            headers["Content-Encoding"] = "zstd"
+        elif "gzip" in codings:
+            compress = functools.partial(gzip.compress, compresslevel=1, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+        if compress is not None:
+            body = await asyncio.to_thread(compress, body) if len(body) > _OFFLOAD_BYTES else compress(body)
+    return Response(body, media_type=media_type, headers=headers)
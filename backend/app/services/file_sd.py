@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional, Set
+
+from ..core.config import settings
+
+log = logging.getLogger(__name__)
+
+# Prometheus file_sd target files, one <tenant>.json per tenant. The targets
+# live in an in-memory index (seeded from the tenant's file on first use), so an
+# agent check-in is a dict update. A background writer coalesces changes for
+# FILE_SD_DEBOUNCE_S and rewrites each changed tenant's file atomically (temp
+# file + rename, so Prometheus never reads half a file), and only if the
+# rendered content differs from what is on disk.
+
+_targets: Dict[str, Dict[tuple, dict]] = {}
+_written: Dict[str, bytes] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+_dirty: Set[str] = set()
+_wake: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+
+
+def path_of(tenant: str) -> str:
+    return os.path.join(settings.FILE_SD_DIR, f"{tenant}.json")
+
+
+def key_of(item: dict) -> tuple:
+    # Stable key: tuple of sorted label items
+    return tuple(sorted((item.get("labels") or {}).items()))
+
+
+def _render(index: Dict[tuple, dict]) -> bytes:
+    return json.dumps(list(index.values())).encode()
+
+
+def _load(tenant: str) -> Dict[tuple, dict]:
+    try:
+        with open(path_of(tenant), "rb") as f:
+            existing = json.load(f) or []
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log.warning("ignoring unreadable file_sd file for %s: %s", tenant, e)
+        return {}
+    return {key_of(it): it for it in existing if isinstance(it, dict)}
+
+
+def _write(path: str, body: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _lock(tenant: str) -> asyncio.Lock:
+    lock = _locks.get(tenant)
+    if lock is None:
+        lock = _locks[tenant] = asyncio.Lock()
+    return lock
+
+
+async def register(tenant: str, items: Iterable[dict]) -> int:
+    # Merges items (keyed by their labels) into the tenant's targets; returns
+    # how many the tenant has. The file is written later by the writer.
+    index = _targets.get(tenant)
+    if index is None:
+        async with _lock(tenant):
+            index = _targets.get(tenant)
+            if index is None:
+                index = await asyncio.to_thread(_load, tenant)
+                _written[tenant] = _render(index)
+                _targets[tenant] = index
+    for item in items:
+        index[key_of(item)] = item
+    _dirty.add(tenant)
+    if _wake is not None:
+        _wake.set()
+    return len(index)
+
+
+async def flush():
+    for tenant in list(_dirty):
+        _dirty.discard(tenant)
+        async with _lock(tenant):
+            body = _render(_targets[tenant])
+            if body == _written.get(tenant):
+                continue
+            try:
+                await asyncio.to_thread(_write, path_of(tenant), body)
+                _written[tenant] = body
+            except Exception:
+                log.exception("writing file_sd targets for %s failed", tenant)
+                _dirty.add(tenant)  # retried on the writer's next pass
+                if _wake is not None:
+                    _wake.set()
+
+
+async def _writer(debounce: float):
+    while True:
+        await _wake.wait()
+        await asyncio.sleep(debounce)
+        _wake.clear()
+        await flush()
+
+
+def start():
+    global _task, _wake
+    _wake = asyncio.Event()
+    if _dirty:
+        _wake.set()
+    _task = asyncio.get_running_loop().create_task(_writer(settings.FILE_SD_DEBOUNCE_S))
+
+
+async def stop():
+    global _task, _wake
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    _wake = None
+    await flush()
+    _locks.clear()
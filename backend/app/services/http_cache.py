@@ -0,0 +1,86 @@
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Response
+
+from ..core.config import settings
+
+# Conditional GET support. Run data is append-only, so a series' point count
+# (or a log's end cursor) is a version counter: together with the request it
+# names the exact response, and an ETag is just a hash of that key. Finished
+# runs do not change in practice, so their rendered responses are also kept in
+# a byte-bounded LRU; the version is part of the key, so a late write can never
+# be served stale.
+
+
+def etag(*key) -> str:
+    return '"' + hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest() + '"'
+
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    return any(t.strip().removeprefix("W/") == tag for t in if_none_match.split(","))
+
+
+def byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # [start, end) of a single "bytes=" range. None means send the whole body:
+    # no header, or a multi-range or malformed one, which RFC 9110 lets a
+    # server ignore. Raises ValueError if the range cannot be satisfied.
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, dash, last = range_header[6:].strip().partition("-")
+    if not dash or not (first + last).isdigit():
+        return None
+    if first:
+        start, end = int(first), int(last) + 1 if last else size
+        if last and end <= start:
+            return None
+    else:
+        start, end = max(size - int(last), 0), size if int(last) else 0
+    if start >= size or end <= start:
+        raise ValueError(f"range not satisfiable for {size} bytes")
+    return start, min(end, size)
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "private, no-cache"})
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items: "OrderedDict[str, Tuple[bytes, str, dict]]" = OrderedDict()
+
+    def get(self, tag: str) -> Optional[Response]:
+        hit = self._items.get(tag)
+        if hit is None:
+            return None
+        self._items.move_to_end(tag)
+        body, media_type, headers = hit
+        return Response(body, media_type=media_type, headers=headers)
+
+    def put(self, tag: str, response: Response):
+        body = response.body
+        if len(body) > self.max_bytes // 8 or tag in self._items:
+            return
+        headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+        self._items[tag] = (body, response.media_type, headers)
+        self.nbytes += len(body)
+        while self.nbytes > self.max_bytes:
+            _, (old, _, _) = self._items.popitem(last=False)
+            self.nbytes -= len(old)
+
+
+responses = ResponseCache(settings.RESPONSE_CACHE_MB << 20)
+
+
+def tagged(response: Response, tag: str) -> Response:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,37 @@
+import time
+
+from ..core.config import settings
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+SEQ_BITS = 9
+NODE_BITS = 3
+
+
+class RunIdAllocator:
+    # Snowflake-style ids kept within 53 bits so browsers can hold them as a
+    # Number: [41 bits ms since EPOCH_MS][9 bits sequence][3 bits node].
+    # Ids sort by creation time and are unique per node. next_id is only called
+    # on the event loop thread (runs.create_run), so it takes no lock.
+
+    def __init__(self, node: int = 0, clock=time.time):
+        self.node = node & ((1 << NODE_BITS) - 1)
+        self._clock = clock
+        self._last = self._floor() - 1
+
+    def _floor(self) -> int:
+        return (int(self._clock() * 1000) - EPOCH_MS) << SEQ_BITS
+
+    def next_id(self) -> int:
+        # After idle periods the sequence jumps forward to the clock; bursts
+        # above 512 ids/ms borrow from the following milliseconds rather than
+        # wrapping, so ids never repeat and never go backwards.
+        v = self._last = max(self._last + 1, self._floor())
+        return (v << NODE_BITS) | self.node
+
+
+def id_timestamp(run_id: int) -> float:
+    # Creation time (unix seconds) encoded in an allocated id
+    return ((run_id >> (NODE_BITS + SEQ_BITS)) + EPOCH_MS) / 1000.0
+
+
+run_ids = RunIdAllocator(settings.RUN_ID_NODE)
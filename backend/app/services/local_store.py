@@ -0,0 +1,173 @@
+import os
+import shutil
+import uuid
+from typing import List, Optional
+
+# Filesystem stand-in for the subset of the minio client that services/storage
+# uses, selected by STORAGE_DIR. Objects are files under <root>/<bucket>/<key>,
+# multipart uploads are directories of part files under <root>/.uploads, and
+# every object appears atomically (written to a temp file, then renamed).
+
+CHUNK = 1 << 20
+
+
+class StoreError(Exception):
+    def __init__(self, code: str, message: str = ""):
+        super().__init__(message or code)
+        self.code = code
+
+
+class Part:
+    def __init__(self, part_number: int, etag: str, last_modified=None, size: Optional[int] = None):
+        self.part_number = part_number
+        self.etag = etag
+        self.size = size
+
+
+class ComposeSource:
+    def __init__(self, bucket_name: str, object_name: str):
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+
+
+class _Stat:
+    def __init__(self, st: os.stat_result):
+        self.size = st.st_size
+        self.last_modified = st.st_mtime
+
+
+class _Page:
+    def __init__(self, parts: List[Part]):
+        self.parts = parts
+        self.is_truncated = False
+        self.next_part_number_marker = None
+
+
+class _Reader:
+    # The parts of a urllib3 response that storage reads from
+    def __init__(self, path: str, offset: int, length: int):
+        self._f = open(path, "rb")
+        self._f.seek(offset)
+        self._left = length or None
+
+    def stream(self, amt: int = CHUNK):
+        while self._left is None or self._left > 0:
+            chunk = self._f.read(amt if self._left is None else min(amt, self._left))
+            if not chunk:
+                return
+            if self._left is not None:
+                self._left -= len(chunk)
+            yield chunk
+
+    def read(self) -> bytes:
+        return b"".join(self.stream())
+
+    def close(self):
+        self._f.close()
+
+    def release_conn(self):
+        pass
+
+
+class LocalStore:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.uploads = os.path.join(self.root, ".uploads")
+        os.makedirs(self.uploads, exist_ok=True)
+
+    def _path(self, bucket: str, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.join(self.root, bucket) + os.sep):
+            raise StoreError("InvalidObjectName", key)
+        return path
+
+    def _publish(self, tmp: str, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+
+    def _tmp(self) -> str:
+        return os.path.join(self.uploads, f".{uuid.uuid4().hex}.tmp")
+
+    def bucket_exists(self, bucket: str) -> bool:
+        return os.path.isdir(os.path.join(self.root, bucket))
+
+    def make_bucket(self, bucket: str):
+        os.makedirs(os.path.join(self.root, bucket), exist_ok=True)
+
+    def stat_object(self, bucket: str, key: str) -> _Stat:
+        try:
+            return _Stat(os.stat(self._path(bucket, key)))
+        except FileNotFoundError:
+            raise StoreError("NoSuchKey", key)
+
+    def get_object(self, bucket: str, key: str, offset: int = 0, length: int = 0) -> _Reader:
+        try:
+            return _Reader(self._path(bucket, key), offset, length)
+        except FileNotFoundError:
+            raise StoreError("NoSuchKey", key)
+
+    def put_object(self, bucket: str, key: str, data, length: int, **kw):
+        tmp = self._tmp()
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(data, f, CHUNK)
+        self._publish(tmp, self._path(bucket, key))
+
+    def compose_object(self, bucket: str, key: str, sources: List[ComposeSource]):
+        tmp = self._tmp()
+        src = [self._path(s.bucket_name, s.object_name) for s in sources]
+        try:
+            if len(src) != 1:
+                raise OSError
+            os.link(src[0], tmp)  # same filesystem: no copy
+        except OSError:
+            with open(tmp, "wb") as out:
+                for p in src:
+                    with open(p, "rb") as f:
+                        shutil.copyfileobj(f, out, CHUNK)
+        self._publish(tmp, self._path(bucket, key))
+
+    def remove_object(self, bucket: str, key: str):
+        try:
+            os.unlink(self._path(bucket, key))
+        except FileNotFoundError:
+            pass
+
+    def _upload_dir(self, upload_id: str) -> str:
+        path = os.path.join(self.uploads, upload_id)
+        if not upload_id.isalnum() or not os.path.isdir(path):
+            raise StoreError("NoSuchUpload", upload_id)
+        return path
+
+    def _create_multipart_upload(self, bucket: str, key: str, headers) -> str:
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.uploads, upload_id))
+        return upload_id
+
+    def _upload_part(self, bucket: str, key: str, data: bytes, headers, upload_id: str, part_number: int) -> str:
+        path = os.path.join(self._upload_dir(upload_id), f"{part_number:05d}")
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        return f"{part_number:05d}-{len(data)}"
+
+    def _list_parts(self, bucket: str, key: str, upload_id: str, **kw) -> _Page:
+        d = self._upload_dir(upload_id)
+        parts = []
+        for name in sorted(os.listdir(d)):
+            if name.isdigit():
+                size = os.path.getsize(os.path.join(d, name))
+                parts.append(Part(int(name), f"{name}-{size}", size=size))
+        return _Page(parts)
+
+    def _complete_multipart_upload(self, bucket: str, key: str, upload_id: str, parts):
+        d = self._upload_dir(upload_id)
+        tmp = self._tmp()
+        with open(tmp, "wb") as out:
+            for p in parts:
+                with open(os.path.join(d, f"{p.part_number:05d}"), "rb") as f:
+                    shutil.copyfileobj(f, out, CHUNK)
+        self._publish(tmp, self._path(bucket, key))
+        shutil.rmtree(d, ignore_errors=True)
+
+    def _abort_multipart_upload(self, bucket: str, key: str, upload_id: str):
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
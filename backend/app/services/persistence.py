@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from ..core.config import settings
+from ..models.memory import RUNS, RUN_ARTIFACTS, RUN_LOGS, RUN_METRICS
+from ..models.cold import ColdLogChunk, ColdSeries
+from ..models.series import MetricSeries
+from ..models.logs import RunLogs
+from ..repositories import memory as mem
+from . import wal
+from .wal import NullJournal, WriteAheadLog
+
+log = logging.getLogger(__name__)
+
+_snapshot_task: Optional[asyncio.Task] = None
+
+
+def apply_record(kind: int, body: bytes):
+    # Re-applies one journal record; journal is a NullJournal while this runs
+    if kind == wal.KIND_SERIES:
+        rid, name, steps, epochs, ts, values = wal.unpack_series(body)
+        by_name = RUN_METRICS.setdefault(rid, {})
+        s = by_name.get(name)
+        if s is None:
+            s = by_name[name] = MetricSeries(name)
+        start = len(s)
+        s.extend(steps, epochs, ts, values)
+        s.track(start)
+        return
+    rec = json.loads(body)
+    kind = rec[0]
+    if kind == "logs":
+        mem.add_logs(rec[1])
+    elif kind == "run":
+        mem.insert_run(rec[1])
+    elif kind == "artifact":
+        mem.add_artifact(rec[1])
+    elif kind == "finish":
+        _, rid, status, end_ts = rec
+        mem.finish_run(rid, status, end_ts)
+
+
+def capture_state():
+    # Must run on the event loop thread, where all store mutations happen, so the
+    # lengths below and the journal position describe one consistent instant.
+    # Hot columns are append-only (a spill swaps in new arrays rather than
+    # trimming these), so the captured prefixes can be copied later. Spilled
+    # data is referenced by path: cold files are never rewritten below offset.
+    return {
+        "seq": wal.journal.seq,
+        "runs": [dict(r) for r in RUNS],
+        "metrics": [
+            (rid, name, s.offset, s.cold.path if s.cold else None, (s.steps, s.epochs, s.ts, s.values),
+             len(s.values), s.steps_sorted, s.ts_sorted, s.stats.copy())
+            for rid, by_name in RUN_METRICS.items() for name, s in by_name.items()
+        ],
+        "logs": [
+            (rid, lg.offset, [c.directory for c in lg.chunks], (lg.ts, lg.levels, lg.msgs), len(lg.msgs), lg.ts_sorted)
+            for rid, lg in RUN_LOGS.items()
+        ],
+        # Artifact records are never modified once added
+        "artifacts": [a for items in RUN_ARTIFACTS.values() for a in items],
+    }
+
+
+def build_snapshot(captured: dict) -> dict:
+    # Safe off the loop thread: array/list slicing holds the GIL while copying
+    return {
+        "runs": captured["runs"],
+        "metrics": [
+            (rid, name, offset, path, tuple(col[:n] for col in cols), steps_sorted, ts_sorted, stats)
+            for rid, name, offset, path, cols, n, steps_sorted, ts_sorted, stats in captured["metrics"]
+        ],
+        "logs": [
+            (rid, offset, dirs, tuple(col[:n] for col in cols), ts_sorted)
+            for rid, offset, dirs, cols, n, ts_sorted in captured["logs"]
+        ],
+        "artifacts": captured["artifacts"],
+    }
+
+
+def restore_snapshot(state: dict) -> int:
+    for r in state["runs"]:
+        RUNS.add(r)
+    points = 0
+    for rid, name, offset, path, cols, steps_sorted, ts_sorted, stats in state["metrics"]:
+        s = MetricSeries(name)
+        if offset:
+            if not os.path.exists(path):
+                raise RuntimeError(f"spilled series file missing: {path}")
+            s.cold, s.offset = ColdSeries(path, offset), offset
+        s.steps, s.epochs, s.ts, s.values = cols
+        s.steps_sorted, s.ts_sorted, s.stats = steps_sorted, ts_sorted, stats
+        if len(s):
+            s.last_step, _, s.last_ts, _ = s.point(len(s) - 1)
+        RUN_METRICS.setdefault(rid, {})[name] = s
+        points += len(s)
+    for rid, offset, dirs, (ts, levels, msgs), ts_sorted in state["logs"]:
+        lg = RUN_LOGS[rid] = RunLogs()
+        for d in dirs:
+            chunk = ColdLogChunk(d)
+            lg.chunks.append(chunk)
+            lg.chunk_bases.append(chunk.base)
+            lg.last_ts = chunk.ts_at(chunk.base + chunk.n - 1)
+        lg.offset = offset
+        for t, level, msg in zip(ts, levels, msgs):
+            lg.append(level, msg, t)
+        lg.ts_sorted = lg.ts_sorted and ts_sorted
+    for a in state.get("artifacts", []):  # absent from older snapshots
+        mem.link_artifact(a)
+    return points
+
+
+def recover(w: WriteAheadLog) -> int:
+    t0 = time.perf_counter()
+    seq, state = w.latest_snapshot()
+    points = restore_snapshot(state) if state else 0
+    t1 = time.perf_counter()
+    last = w.replay(seq, apply_record)
+    log.info("run store restored: snapshot@%d (%d points) in %.2fs, replayed %d records in %.2fs",
+             seq, points, t1 - t0, last - seq, time.perf_counter() - t1)
+    return last
+
+
+async def snapshot(w: WriteAheadLog):
+    captured = capture_state()
+    w.rotate()
+
+    def write():
+        w.write_snapshot(captured["seq"], build_snapshot(captured))
+        w.drop_segments_before(captured["seq"])
+
+    await asyncio.to_thread(write)
+    return captured["seq"]
+
+
+async def _snapshot_loop(w: WriteAheadLog, interval: float):
+    last = w.seq
+    while True:
+        await asyncio.sleep(interval)
+        if w.seq != last:
+            try:
+                last = await snapshot(w)
+            except Exception:
+                log.exception("run store snapshot failed")
+
+
+def start():
+    global _snapshot_task
+    if not settings.WAL_DIR or settings.DATABASE_URL:
+        # The SQL repository is durable on its own
+        return
+    os.makedirs(settings.WAL_DIR, exist_ok=True)
+    w = WriteAheadLog(settings.WAL_DIR, settings.WAL_FSYNC, settings.WAL_SEGMENT_MB << 20, settings.WAL_FLUSH_MS)
+    last = recover(w)
+    w.start(last)
+    wal.journal = w
+    _snapshot_task = asyncio.get_running_loop().create_task(_snapshot_loop(w, settings.WAL_SNAPSHOT_INTERVAL_S))
+
+
+async def stop():
+    global _snapshot_task
+    w = wal.journal
+    if not isinstance(w, WriteAheadLog):
+        return
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        _snapshot_task = None
+    await snapshot(w)
+    wal.journal = NullJournal()
+    w.close()
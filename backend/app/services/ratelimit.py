@@ -0,0 +1,78 @@
+import math
+import time
+from typing import Dict, List
+
+from fastapi import Depends, HTTPException
+from ..core.config import settings
+from ..schemas.auth import User
+from . import telemetry
+from .auth import get_current_user, oauth2_scheme
+
+# Token buckets for the SDK ingest routes. All state is touched from the event
+# loop thread with no await between the check and the update, so there is
+# nothing to lock; a take() is a dict lookup and a few float operations.
+
+# Idle buckets are dropped once a limiter tracks more keys than this
+MAX_KEYS = 100_000
+
+
+class TokenBucket:
+    # One bucket per key: [tokens, last refill time]. rate <= 0 disables it.
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._state: Dict[str, List[float]] = {}
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        # Returns 0 when the cost was taken, else the seconds until it would be.
+        # A cost above the burst is capped so big batches pass on a full bucket.
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        cost = min(cost, self.burst)
+        st = self._state.get(key)
+        if st is None:
+            if len(self._state) >= MAX_KEYS:
+                self._prune(now)
+            st = self._state[key] = [self.burst, now]
+        else:
+            st[0] = min(self.burst, st[0] + (now - st[1]) * self.rate)
+            st[1] = now
+        if st[0] >= cost:
+            st[0] -= cost
+            return 0.0
+        return (cost - st[0]) / self.rate
+
+    def _prune(self, now: float):
+        full = [k for k, (tokens, last) in self._state.items() if tokens + (now - last) * self.rate >= self.burst]
+        for k in full:
+            del self._state[k]
+
+
+tenant_requests = TokenBucket(settings.SDK_TENANT_RPS, settings.SDK_TENANT_BURST)
+token_requests = TokenBucket(settings.SDK_TOKEN_RPS, settings.SDK_TOKEN_BURST)
+tenant_points = TokenBucket(settings.SDK_TENANT_POINTS_PER_S, settings.SDK_TENANT_POINTS_BURST)
+
+
+def _reject(tenant: str, limit: str, wait: float):
+    telemetry.throttled(tenant, limit)
+    raise HTTPException(429, detail=f"rate limit exceeded ({limit})",
+                        headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+
+async def sdk_limit(token: str = Depends(oauth2_scheme), current: User = Depends(get_current_user)):
+    # Router dependency: one request from each of the tenant's and the token's buckets
+    wait = token_requests.take(token)
+    if wait:
+        _reject(current.tenant, "token", wait)
+    wait = tenant_requests.take(current.tenant)
+    if wait:
+        _reject(current.tenant, "tenant", wait)
+
+
+def charge_points(tenant: str, n: int):
+    # Ingest quota: called with the number of points/lines about to be stored
+    if n:
+        wait = tenant_points.take(tenant, n)
+        if wait:
+            _reject(tenant, "points", wait)
@@ -1,47 +1,415 @@
+import asyncio
+import heapq
+import json
 import math
+import mimetypes
 import time
-from typing import Dict, Optional
-from ..models.memory import RUNS, RUN_LOGS, RUN_METRICS
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .. import repositories
+from ..models.series import MetricSeries
+from ..models.logs import RunLogs
+from . import downsample as ds
+from .ids import run_ids
+from . import streams
+from .streams import hub
 
+REPLAY_BATCH = 1000
 
-def list_runs_for_tenant(tenant: str):
-    return [r for r in RUNS if r["tenant_id"] == tenant]
 
+async def list_runs_for_tenant(tenant: str, filters: Optional[Dict[str, str]] = None, cursor: Optional[int] = None,
+                              limit: Optional[int] = None, descending: bool = False,
+                              summary: Optional[List[str]] = None):
+    runs, _ = await page_runs_for_tenant(tenant, filters, cursor, limit, descending, summary)
+    return runs
 
-def get_run_for_tenant(run_id: int, tenant: str):
-    for r in RUNS:
-        if r["id"] == run_id and r["tenant_id"] == tenant:
-            return r
+
+async def page_runs_for_tenant(tenant: str, filters: Optional[Dict[str, str]] = None, cursor: Optional[int] = None,
+                               limit: Optional[int] = None, descending: bool = False,
+                               summary: Optional[List[str]] = None):
+    # Same as list_runs_for_tenant but also returns the cursor for the next page.
+    # summary: metric names (or ["*"]) whose running aggregates are attached to
+    # each run as "summary"; read from the per-series stats, not from points.
+    runs, next_cursor = await repositories.repo.query_runs(tenant, filters or {}, cursor, limit, descending)
+    if summary:
+        names = None if "*" in summary else summary
+        stats = await repositories.repo.summaries([r["id"] for r in runs], names)
+        runs = [dict(r, summary=stats.get(r["id"], {})) for r in runs]
+    return runs, next_cursor
+
+
+async def get_run_for_tenant(run_id: int, tenant: str):
+    r = await repositories.repo.get_run(run_id)
+    if r is not None and r["tenant_id"] == tenant:
+        return r
     return None
 
 
-def get_run_metrics(run_id: int, name: str, by: str):
-    if run_id in RUN_METRICS:
-        series_points = [p for p in RUN_METRICS[run_id] if p.get("name") == name]
-        points = [{by: p.get("step") or p.get("epoch") or idx + 1, "value": p.get("value", 0.0)} for idx, p in enumerate(series_points)]
-        return {"series": [{"name": name, "points": points}]}
+async def latest_run_id() -> Optional[int]:
+    return await repositories.repo.latest_run_id()
+
+
+async def run_id_for_tenant(run_id: Optional[int], tenant: str) -> Optional[int]:
+    # run_id if it is one of the tenant's runs, without one the tenant's latest
+    # run; None when there is no such run
+    if not run_id:
+        runs, _ = await repositories.repo.query_runs(tenant, {}, None, 1, True)
+        return runs[0]["id"] if runs else None
+    return run_id if await get_run_for_tenant(run_id, tenant) else None
+
+
+def _window(s: MetricSeries, by: str, max_points: Optional[int], x_from: Optional[float], x_to: Optional[float],
+            method: str, since_step: Optional[int] = None, since_ts: Optional[float] = None,
+            interval: Optional[float] = None, agg: str = "last") -> Tuple[np.ndarray, np.ndarray]:
+    # (x, values) of the selected points, as arrays the caller owns.
+    # by=time uses the wall-clock ts column as x (from/to are unix seconds);
+    # anything else the step/epoch/position axis. On a sorted axis the range and
+    # the since_* cursors are binary-searched first, so only that part of the
+    # series (and of its cold tier) is read.
+    col = "ts" if by == "time" else "steps"
+    start, stop = s.bounds(col, x_from, x_to)
+    if since_step is not None and s.steps_sorted:
+        start = max(start, s.search("steps", since_step, "right"))
+    if since_ts is not None and s.ts_sorted:
+        start = max(start, s.search("ts", since_ts, "right"))
+    stop = max(start, stop)
+    if by == "time":
+        x, y = ds.series_column(s, "ts", start, stop), ds.series_column(s, "values", start, stop)
+        x_sorted = s.ts_sorted
+    else:
+        x, y = ds.series_xy(s, start, stop)
+        x_sorted = s.steps_sorted
+    windowed = max_points or x_from is not None or x_to is not None or since_step is not None or since_ts is not None
+    if not windowed and not interval:
+        return x.copy(), y.copy()
+    sel = ds.range_slice(x, x_sorted, x_from, x_to)
+    if since_step is not None:
+        steps = ds.series_xy(s, start, stop)[0] if by == "time" else x
+        sel = ds.narrow_after(sel, steps, s.steps_sorted, since_step)
+    if since_ts is not None:
+        sel = ds.narrow_after(sel, ds.series_column(s, "ts", start, stop), s.ts_sorted, since_ts)
+    xw, yw = x[sel], y[sel]
+    if interval:
+        return ds.bucket(xw, yw, interval, agg, x_sorted)
+    idx = ds.downsample(xw, yw, max_points, method)
+    return xw[idx], yw[idx]
+
+
+async def get_run_metrics(run_id: int, name: str, by: str, max_points: Optional[int] = None,
+                          x_from: Optional[float] = None, x_to: Optional[float] = None, method: str = "lttb",
+                          since_step: Optional[int] = None, since_ts: Optional[float] = None,
+                          interval: Optional[float] = None, agg: str = "last", columns: bool = False):
+    # interval (seconds, by=time only) reduces the points to fixed wall-clock
+    # buckets with agg = last | mean | max | count instead of downsampling.
+    # columns=True returns each series as parallel "x"/"values" numpy arrays
+    # instead of a list of point dicts (see services/encoding.py).
+    repo = repositories.repo
+    if await repo.has_metrics(run_id):
+        since = since_step is not None or since_ts is not None
+        s = await repo.series(run_id, name, **_pushdown(by, x_from, x_to, since_step, since_ts))
+        if s is not None:
+            x, y = _window(s, by, max_points, x_from, x_to, method, since_step, since_ts, interval, agg)
+        else:
+            x, y = np.empty(0, dtype=np.int64), np.empty(0)
+        series = _series(name, by, x, y, columns)
+        if since:
+            # Watermark of the newest stored point, to pass back as the next since_*
+            last = len(s) - 1 if s is not None else -1
+            series["cursor"] = {
+                "step": s.x_at(last) if last >= 0 else since_step,
+                "ts": s.point(last)[2] if last >= 0 else since_ts,
+            }
+        return {"series": [series]}
     # fallback demo
-    points = []
-    for i in range(1, 51):
-        val = 1.0 / i if name == "loss" else min(0.5 + math.log(i+1)/5, 0.99)
-        points.append({by: i, "value": val})
-    return {"series": [{"name": name, "points": points}]}
-
-
-def get_run_logs(run_id: int, query: Optional[str], follow: bool):
-    logs = RUN_LOGS.get(run_id) or [
-        {"ts": int(time.time()) - 10, "level": "INFO", "msg": "loading dataset shard-1"},
-        {"ts": int(time.time()) - 5, "level": "INFO", "msg": "epoch 1 loss=0.52 acc=0.81"},
-        {"ts": int(time.time()) - 1, "level": "WARN", "msg": "grad norm high"},
-    ]
-    if query:
-        logs = [l for l in logs if query.lower() in l["msg"].lower()]
-    return {"items": logs, "follow": follow}
-
-
-def create_run(tenant: str, name: str, framework: str, tags: Dict[str, str]):
-    run_id = int(time.time())
-    RUNS.append({
+    x = np.arange(1, 51)
+    y = 1.0 / x if name == "loss" else np.minimum(0.5 + np.log(x + 1) / 5, 0.99)
+    return {"series": [_series(name, by, x, y, columns)]}
+
+
+def _pushdown(by: str, x_from: Optional[float], x_to: Optional[float], since_step: Optional[int],
+              since_ts: Optional[float]) -> dict:
+    # The part of get_run_metrics' window a repository can apply while reading:
+    # the columns _window uses and inclusive bounds on the x axis. With a since_*
+    # cursor every column is read and `to` is not applied, because the reply's
+    # cursor is the newest point read.
+    since = since_step is not None or since_ts is not None
+    lo, hi = x_from, None if since else x_to
+    ts, steps = (lo, hi) if by == "time" else (None, None), (None, None) if by == "time" else (lo, hi)
+    if since_ts is not None:
+        ts = (max(ts[0], since_ts) if ts[0] is not None else since_ts, ts[1])
+    if since_step is not None:
+        steps = (max(steps[0], since_step) if steps[0] is not None else since_step, steps[1])
+    if since:
+        return {"ts": ts, "steps": steps}
+    return {"columns": ("ts", "values") if by == "time" else ("steps", "values"), "ts": ts, "steps": steps}
+
+
+def _series(name: str, by: str, x: np.ndarray, y: np.ndarray, columns: bool) -> dict:
+    if columns:
+        return {"name": name, "by": by, "x": x, "values": y}
+    return {"name": name, "points": [{by: xv, "value": yv} for xv, yv in zip(x.tolist(), y.tolist())]}
+
+
+async def data_version(run_id: int, name: Optional[str] = None) -> Tuple[int, bool]:
+    # (version, finished): the point count of series `name`, or the log end
+    # cursor when name is None. Both only grow, so they identify the content.
+    repo = repositories.repo
+    r = await repo.get_run(run_id)
+    version = await repo.series_len(run_id, name) if name is not None else await repo.log_end(run_id)
+    return version, r is not None and r["status"] != "running"
+
+
+async def get_run_summary(run_id: int, names: Optional[List[str]] = None):
+    stats = await repositories.repo.summaries([run_id], names)
+    return {"run_id": run_id, "metrics": stats.get(run_id, {})}
+
+
+def _axis(s: MetricSeries, by: str) -> Tuple[np.ndarray, bool, float]:
+    # (x column, whether it is known to be sorted, origin subtracted from x)
+    if by == "epoch":
+        return ds.series_column(s, "epochs"), False, 0.0
+    if by == "time":
+        # Seconds since the series' first point, so runs started at different
+        # times overlay
+        ts = ds.series_column(s, "ts")
+        return ts, s.ts_sorted, float(ts[0])
+    x, _ = ds.series_xy(s)
+    return x, s.steps_sorted, 0.0
+
+
+async def compare_runs(run_ids: List[int], name: str, by: str = "step", points: int = 500,
+                       x_from: Optional[float] = None, x_to: Optional[float] = None, smooth: float = 0.0):
+    # Resamples one metric of several runs onto a shared, evenly spaced axis
+    # (linear interpolation, null outside a run's range), optionally EMA-smoothed
+    # first, so the client can overlay them without aligning anything.
+    repo = repositories.repo
+    # Interpolating at the ends of the range needs the points beyond it, so
+    # only the columns are narrowed
+    columns = ("epochs", "values") if by == "epoch" else ("ts", "values") if by == "time" else ("steps", "values")
+    found = [(rid, await repo.series(rid, name, columns)) for rid in run_ids]
+    axes = []
+    for rid, s in found:
+        if s is None or not len(s):
+            axes.append(None)
+            continue
+        x, x_sorted, origin = _axis(s, by)
+        y = ds.series_column(s, "values")
+        axes.append((x, ds.ema(y, smooth) if smooth else y, x_sorted, origin))
+    present = [a for a in axes if a is not None]
+    if not present:
+        return {"name": name, "by": by, "x": [], "series": [{"run_id": rid, "values": []} for rid, _ in found]}
+    # Sorted axes give their range without a scan
+    if x_from is None:
+        x_from = min(float(x[0] if ok else x.min()) - origin for x, _, ok, origin in present)
+    if x_to is None:
+        x_to = max(float(x[-1] if ok else x.max()) - origin for x, _, ok, origin in present)
+    if by != "time" and float(x_from).is_integer() and float(x_to).is_integer() and x_to - x_from < points:
+        grid = np.arange(x_from, x_to + 1, dtype=np.float64)
+    else:
+        grid = np.linspace(x_from, x_to, points)
+    series = []
+    for (rid, _), a in zip(found, axes):
+        if a is None:
+            values = np.full(len(grid), np.nan)
+        else:
+            x, y, x_sorted, origin = a
+            values = ds.resample(x, y, grid + origin, x_sorted)
+        series.append({"run_id": rid, "values": [None if v != v else v for v in values.tolist()]})
+    x_out = grid.astype(np.int64).tolist() if by != "time" and np.all(grid == np.round(grid)) else grid.tolist()
+    return {"name": name, "by": by, "x": x_out, "series": series}
+
+
+async def get_run_logs(run_id: int, query: Optional[str], follow: bool, level: Optional[str] = None,
+                       ts_from: Optional[int] = None, ts_to: Optional[int] = None, cursor: int = 0,
+                       limit: Optional[int] = None, columns: bool = False):
+    # columns=True returns parallel "ts"/"level"/"msg" lists instead of "items"
+    repo = repositories.repo
+    if await repo.has_logs(run_id):
+        items, next_cursor = await repo.search_logs(run_id, query, level, ts_from, ts_to, cursor, limit)
+        return _log_page(items, follow, next_cursor, columns)
+    demo = RunLogs()
+    for ts, lvl, msg in (
+        (int(time.time()) - 10, "INFO", "loading dataset shard-1"),
+        (int(time.time()) - 5, "INFO", "epoch 1 loss=0.52 acc=0.81"),
+        (int(time.time()) - 1, "WARN", "grad norm high"),
+    ):
+        demo.append(lvl, msg, ts)
+    items, next_cursor = demo.search(query, level, ts_from, ts_to, cursor, limit)
+    return _log_page(items, follow, next_cursor, columns)
+
+
+def _log_page(items: List[dict], follow: bool, next_cursor: Optional[int], columns: bool) -> dict:
+    if columns:
+        return {"ts": [x["ts"] for x in items], "level": [x["level"] for x in items], "msg": [x["msg"] for x in items],
+                "follow": follow, "next_cursor": next_cursor}
+    return {"items": items, "follow": follow, "next_cursor": next_cursor}
+
+
+async def follow_logs(run_id: int, query: Optional[str], level: Optional[str], cursor: Optional[int]):
+    # SSE body for follow=true: replays from cursor (default: the current end of
+    # the log), then sends new lines as add_logs publishes them. Ends once the run
+    # is no longer running and everything has been sent, or once it is gone.
+    repo = repositories.repo
+    pos = cursor if cursor is not None else await repo.log_end(run_id)
+    while True:
+        end = await repo.log_end(run_id)
+        if pos < end:
+            items, nxt = await repo.search_logs(run_id, query, level, None, None, pos, streams.FOLLOW_BATCH, end)
+            pos = nxt if nxt is not None else end
+            if items:
+                yield streams.sse("logs", {"items": items, "cursor": pos}, pos)
+            else:
+                await asyncio.sleep(0)
+            continue
+        r = await repo.get_run(run_id)
+        if r is None or r["status"] != "running":
+            yield streams.sse("end", {"status": r["status"] if r else "deleted", "cursor": pos}, pos)
+            return
+        if not await hub.wait(("logs", run_id), repo.poll_s or streams.HEARTBEAT_S):
+            yield ": keepalive\n\n"
+
+
+async def _new_points(run_id: int, name: str, start: int, after, limit: int) -> Tuple[List[dict], object]:
+    # Points after the repository key `after`; start is the position of the
+    # first, for the x of points without a step or epoch
+    rows, after = await repositories.repo.read_points(run_id, name, after, limit)
+    return [
+        {"step": step or epoch or i + 1, "value": value, "ts": ts}
+        for i, (step, epoch, ts, value) in enumerate(rows, start)
+    ], after
+
+
+async def follow_metrics(pairs: List[Tuple[int, str]]):
+    # SSE body for live charts: one 'metrics' frame per broadcaster tick holding
+    # every point appended to the requested (run, name) series since the last
+    # frame. Starts at the current end of each series.
+    repo = repositories.repo
+    cursors = {}
+    for rid, name in pairs:
+        cursors[(rid, name)] = await repo.series_end(rid, name)
+    rids = {rid for rid, _ in pairs}
+    while True:
+        frame = []
+        for (rid, name), (pos, key) in cursors.items():
+            points, key = await _new_points(rid, name, pos, key, streams.FOLLOW_BATCH)
+            if points:
+                cursors[(rid, name)] = pos + len(points), key
+                frame.append({"run_id": rid, "name": name, "points": points})
+        if frame:
+            yield streams.sse("metrics", {"series": frame})
+            continue
+        runs = [await repo.get_run(rid) for rid in rids]
+        if all(r is not None and r["status"] != "running" for r in runs):
+            yield streams.sse("end", {"runs": sorted(rids)})
+            return
+        if not await hub.wait_any([("metrics", rid) for rid in rids], repo.poll_s or streams.HEARTBEAT_S):
+            yield ": keepalive\n\n"
+
+
+async def _replay_source(fetch):
+    # Chunks of (ts, encoded line) from a cursor-paged reader; fetch(cursor)
+    # returns (lines, next_cursor) like the repository window/search methods
+    cursor = None
+    while True:
+        lines, cursor = await fetch(cursor)
+        if lines:
+            yield lines
+        if cursor is None:
+            return
+
+
+def _metric_encoder(name: str):
+    # Metric points dominate a replay, so they skip json.dumps: a %-template with
+    # the name pre-encoded (repr() of a finite float is valid JSON)
+    template = '{"type":"metric","ts":%r,"name":' + json.dumps(name) + ',"step":%d,"epoch":%d,"value":%r}'
+
+    def encode(step, epoch, ts, value):
+        if math.isfinite(value) and math.isfinite(ts):
+            return template % (ts, step, epoch, value)
+        return json.dumps({"type": "metric", "ts": ts, "name": name, "step": step, "epoch": epoch, "value": value})
+    return encode
+
+
+async def replay_run(run: dict, ts_from: Optional[float], ts_to: Optional[float], names: Optional[List[str]] = None,
+                     logs: bool = True, level: Optional[str] = None):
+    # NDJSON body for POST /runs/{id}/replay: a header line, then run events,
+    # metric points and log lines with ts in [ts_from, ts_to] merged in ts order,
+    # then an end line with counts. Every source is read REPLAY_BATCH rows at a
+    # time from a range lookup, so memory stays flat however long the window is.
+    repo = repositories.repo
+    rid = run["id"]
+    if names is None:
+        names = await repo.metric_names(rid)
+
+    def inside(ts):
+        return ts is not None and (ts_from is None or ts >= ts_from) and (ts_to is None or ts <= ts_to)
+
+    events = [{"ts": run["start_ts"], "event": "start"}]
+    events += [{"ts": a["created_at"], "event": "artifact", "name": a.get("name"), "key": a["key"],
+                "size": a["size"]} for a in await repo.list_artifacts(rid)]
+    if run["status"] != "running":
+        events.append({"ts": run["end_ts"], "event": run["status"]})
+    events = sorted((e for e in events if inside(e["ts"])), key=lambda e: e["ts"])
+
+    async def event_lines(cursor):
+        return [(e["ts"], json.dumps(dict(type="event", **e))) for e in events], None
+
+    def metric_lines(name):
+        encode = _metric_encoder(name)
+
+        async def fetch(cursor):
+            rows, cursor = await repo.metric_window(rid, name, ts_from, ts_to, cursor, REPLAY_BATCH)
+            return [(row[2], encode(*row)) for row in rows], cursor
+        return fetch
+
+    async def log_lines(cursor):
+        items, cursor = await repo.log_window(rid, level, ts_from, ts_to, cursor, REPLAY_BATCH)
+        return [(x["ts"], json.dumps(dict(type="log", **x))) for x in items], cursor
+
+    # (kind, source); the position in this list breaks ts ties
+    sources = [("event", _replay_source(event_lines))]
+    sources += [("metric", _replay_source(metric_lines(n))) for n in names]
+    if logs:
+        sources.append(("log", _replay_source(log_lines)))
+
+    yield json.dumps({"type": "run", "run": run, "from": ts_from, "to": ts_to, "metrics": names}) + "\n"
+    counts = {"event": 0, "metric": 0, "log": 0}
+    # k-way merge: one buffered chunk per source, the heap holds each source's
+    # head as (ts, source order, position in chunk, chunk)
+    heap = []
+    for order, (_, src) in enumerate(sources):
+        chunk = await anext(src, None)
+        if chunk:
+            heap.append((chunk[0][0], order, 0, chunk))
+    heapq.heapify(heap)
+    out = []
+    while heap:
+        _, order, i, chunk = heapq.heappop(heap)
+        kind, src = sources[order]
+        # Emit this source's run of lines up to the next source's head at once
+        j = i + 1
+        if heap:
+            bound = heap[0][:2]
+            while j < len(chunk) and (chunk[j][0], order) < bound:
+                j += 1
+        else:
+            j = len(chunk)
+        out.extend(line for _, line in chunk[i:j])
+        counts[kind] += j - i
+        if j == len(chunk):
+            chunk, j = await anext(src, None), 0
+        if chunk:
+            heapq.heappush(heap, (chunk[j][0], order, j, chunk))
+        if len(out) >= REPLAY_BATCH:
+            yield "\n".join(out) + "\n"
+            out = []
+    out.append(json.dumps({"type": "end", "events": counts["event"], "points": counts["metric"], "lines": counts["log"]}))
+    yield "\n".join(out) + "\n"
+
+
+async def create_run(tenant: str, name: str, framework: str, tags: Dict[str, str]):
+    run_id = run_ids.next_id()
+    await repositories.repo.insert_run({
         "id": run_id,
         "tenant_id": tenant,
         "project_id": 1,
@@ -53,25 +421,53 @@ def create_run(tenant: str, name: str, framework: str, tags: Dict[str, str]):
         "end_ts": None,
         "tags_json": tags or {},
     })
-    RUN_METRICS[run_id] = []
-    RUN_LOGS[run_id] = []
     return run_id
 
 
-def add_metric(run_id: int, payload: dict):
-    RUN_METRICS.setdefault(run_id, []).append(payload)
+async def add_metric(run_id: int, payload: dict):
+    await repositories.repo.add_metrics([(run_id, payload["name"], payload.get("value", 0.0), payload.get("step"),
+                                          payload.get("epoch"), payload.get("ts"))])
+
+
+async def add_metrics(points):
+    # Bulk variant of add_metric: points is an iterable of
+    # (run_id, name, value, step, epoch, ts)
+    return await repositories.repo.add_metrics(points)
+
+
+async def add_log(run_id: int, level: str, msg: str, ts: Optional[int]):
+    await repositories.repo.add_logs([(run_id, level, msg, ts)])
+
+
+async def add_logs(lines):
+    # Bulk variant of add_log: lines is an iterable of (run_id, level, msg, ts)
+    return await repositories.repo.add_logs(lines)
+
+
+async def add_artifact(run_id: int, name: str, blob: dict):
+    # Adds name -> blob (from storage.store_blob) to the run's artifact index
+    await repositories.repo.add_artifact({
+        "run_id": run_id, "name": name, "key": blob["key"], "size": blob["size"], "checksum": blob["sha256"],
+        "type": mimetypes.guess_type(name)[0] or "application/octet-stream", "created_at": time.time()})
+
+
+async def blob_referenced(tenant: str, sha256: str) -> bool:
+    # Whether some run of the tenant already has this blob as an artifact. Only
+    # then may the tenant learn it is stored or reference it without uploading.
+    return await repositories.repo.blob_referenced(tenant, sha256)
 
 
-def add_log(run_id: int, level: str, msg: str, ts: Optional[int]):
-    RUN_LOGS.setdefault(run_id, []).append({"level": level, "msg": msg, "ts": ts or int(time.time())})
+async def artifact_index(run_id: int) -> dict:
+    # filename -> the latest artifact uploaded under that name
+    index = {}
+    for a in await repositories.repo.list_artifacts(run_id):
+        index[a.get("name") or a["key"]] = {"sha256": a.get("checksum"), "size": a["size"], "type": a.get("type"),
+                                            "key": a["key"], "created_at": a["created_at"]}
+    return {"run_id": run_id, "artifacts": index}
 
 
-def finish_run(run_id: Optional[int], status: str, ts: Optional[int]):
-    rid = run_id or (RUNS[-1]["id"] if RUNS else None)
+async def finish_run(run_id: Optional[int], status: str, ts: Optional[int]):
+    rid = run_id or await latest_run_id()
     if rid is None:
         return
-    for r in RUNS:
-        if r["id"] == rid:
-            r["status"] = status
-            r["end_ts"] = ts or int(time.time())
-            break
+    await repositories.repo.finish_run(rid, status, ts or int(time.time()))
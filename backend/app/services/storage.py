@@ -1,33 +1,362 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from typing import AsyncIterable, AsyncIterator, List, Optional
+
+from ..core.config import settings
+from .local_store import LocalStore, StoreError
 
 # Optional MinIO for artifact storage
 try:
     from minio import Minio
+    from minio.commonconfig import ComposeSource
+    from minio.datatypes import Part
+    from minio.error import S3Error
+    import urllib3
 except Exception:  # pragma: no cover
     Minio = None  # type: ignore
+    from .local_store import ComposeSource, Part, StoreError as S3Error
 
-from ..core.config import settings
+log = logging.getLogger(__name__)
 
+# One process-wide client over a pooled urllib3 connection manager, created (and
+# the bucket checked) once. The minio client is blocking, so every object call
+# runs in a bounded thread pool and the event loop never waits on the network.
+# If MinIO is unreachable the failure is remembered for STORAGE_RETRY_S, so
+# uploads fail fast instead of each paying a connect timeout. With STORAGE_DIR
+# set, a LocalStore stands in for the client and nothing else changes.
 
-def get_minio_client():
-    if Minio is None:
-        return None
-    try:
-        use_secure = settings.MINIO_ENDPOINT.startswith("https://")
-        endpoint = settings.MINIO_ENDPOINT.replace("http://", "").replace("https://", "")
-        client = Minio(endpoint, access_key=settings.MINIO_ACCESS_KEY, secret_key=settings.MINIO_SECRET_KEY, secure=use_secure)
-        if not client.bucket_exists(settings.MINIO_BUCKET):
-            client.make_bucket(settings.MINIO_BUCKET)
+_client = None
+_failed_at: Optional[float] = None
+_lock: Optional[asyncio.Lock] = None
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.STORAGE_THREADS, thread_name_prefix="storage")
+    return _pool
+
+
+async def run(fn, *args):
+    # Runs a blocking storage call in the storage pool
+    return await asyncio.get_running_loop().run_in_executor(_executor(), fn, *args)
+
+
+def _connect():
+    if settings.STORAGE_DIR:
+        client = LocalStore(settings.STORAGE_DIR)
+        client.make_bucket(settings.MINIO_BUCKET)
         return client
-    except Exception:
+    use_secure = settings.MINIO_ENDPOINT.startswith("https://")
+    endpoint = settings.MINIO_ENDPOINT.replace("http://", "").replace("https://", "")
+    http = urllib3.PoolManager(
+        maxsize=settings.STORAGE_THREADS,
+        timeout=urllib3.Timeout(connect=settings.STORAGE_CONNECT_TIMEOUT_S, read=settings.STORAGE_READ_TIMEOUT_S),
+        retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+    )
+    client = Minio(endpoint, access_key=settings.MINIO_ACCESS_KEY, secret_key=settings.MINIO_SECRET_KEY,
+                   secure=use_secure, http_client=http)
+    if not client.bucket_exists(settings.MINIO_BUCKET):
+        client.make_bucket(settings.MINIO_BUCKET)
+    return client
+
+
+def _recently_failed() -> bool:
+    return _failed_at is not None and time.monotonic() - _failed_at < settings.STORAGE_RETRY_S
+
+
+async def get_minio_client():
+    global _client, _failed_at, _lock
+    if _client is not None or (Minio is None and not settings.STORAGE_DIR):
+        return _client
+    if _recently_failed():
         return None
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if _client is None and not _recently_failed():
+            try:
+                _client = await run(_connect)
+            except Exception as e:
+                _failed_at = time.monotonic()
+                log.warning("artifact storage unavailable: %s", e)
+    return _client
+
+
+def part_size() -> int:
+    return int(settings.STORAGE_PART_MB * (1 << 20))
+
+
+class PartWriter:
+    # Cuts a byte stream into part_size() parts of one multipart upload and sends
+    # up to STORAGE_PART_CONCURRENCY of them at once. write() waits for a free
+    # slot before cutting the next part, which back-pressures the reader. Parts
+    # are fed to hasher, if given, in order and off the event loop.
+
+    def __init__(self, client, key: str, upload_id: str, hasher=None, first_part: int = 1):
+        self.client = client
+        self.hasher = hasher
+        self.key = key
+        self.upload_id = upload_id
+        self.number = first_part
+        self.size = 0
+        self.parts: List[Part] = []
+        self._buf = bytearray()
+        self._slots = asyncio.Semaphore(settings.STORAGE_PART_CONCURRENCY)
+        self._tasks: List[asyncio.Task] = []
+
+    async def write(self, chunk: bytes):
+        self._buf += chunk
+        self.size += len(chunk)
+        n = part_size()
+        while len(self._buf) >= n:
+            with memoryview(self._buf) as mv:
+                data = bytes(mv[:n])
+            del self._buf[:n]
+            await self._send(data)
+
+    async def _send(self, data: bytes):
+        if self.hasher is not None:
+            await asyncio.to_thread(self.hasher.update, data)
+        await self._slots.acquire()
+        for t in self._tasks:
+            if t.done():
+                t.result()  # surface a failed part now rather than at close()
+        number, self.number = self.number, self.number + 1
+        self._tasks.append(asyncio.ensure_future(self._put(number, data)))
+
+    async def _put(self, number: int, data: bytes):
+        try:
+            etag = await run(self.client._upload_part, settings.MINIO_BUCKET, self.key, data, None,
+                             self.upload_id, number)
+            self.parts.append(Part(number, etag))
+        finally:
+            self._slots.release()
+
+    async def close(self) -> List[Part]:
+        if self._buf:
+            data, self._buf = bytes(self._buf), bytearray()
+            await self._send(data)
+        try:
+            await asyncio.gather(*self._tasks)
+        except BaseException:
+            for t in self._tasks:
+                t.cancel()
+            raise
+        return sorted(self.parts, key=lambda p: p.part_number)
+
+
+# Artifacts are content-addressed: a blob is stored once under the SHA-256 of
+# its bytes, and runs only keep references to it, so the tokenizer or base
+# weights uploaded by every job of a sweep take the space of one copy.
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def blob_key(sha256: str) -> str:
+    return f"blobs/sha256/{sha256[:2]}/{sha256}"
+
+
+def staging_key() -> str:
+    return f"uploads/{uuid.uuid4().hex}"
+
+
+def _blob(sha256: str, size: int, deduplicated: bool) -> dict:
+    return {"sha256": sha256, "size": size, "key": blob_key(sha256), "deduplicated": deduplicated}
 
 
-def put_artifact(client, key: str, data: bytes):
+def _check(expected: Optional[str], digest: str):
+    if expected and expected != digest:
+        raise ChecksumMismatch(f"sha256 mismatch: declared {expected}, received {digest}")
+
+
+async def blob_size(sha256: str) -> Optional[int]:
+    # Size of the stored blob with this digest, or None if there is none
+    client = await get_minio_client()
     if not client:
-        return False
+        return None
     try:
-        client.put_object(settings.MINIO_BUCKET, key, BytesIO(data), length=len(data))
-        return True
+        return (await run(client.stat_object, settings.MINIO_BUCKET, blob_key(sha256))).size
+    except (S3Error, StoreError) as e:
+        if e.code in ("NoSuchKey", "NoSuchObject", "ResourceNotFound"):
+            return None
+        raise
+
+
+def _digest(client, key: str) -> str:
+    resp = client.get_object(settings.MINIO_BUCKET, key)
+    try:
+        h = hashlib.sha256()
+        for chunk in resp.stream(1 << 20):
+            h.update(chunk)
+        return h.hexdigest()
+    finally:
+        resp.close()
+        resp.release_conn()
+
+
+async def _place(client, key: str, digest: str, size: int) -> dict:
+    # Moves a completed staging object to its blob key, or drops it if that
+    # blob is already stored
+    dedup = await blob_size(digest) is not None
+    if not dedup:
+        await run(client.compose_object, settings.MINIO_BUCKET, blob_key(digest),
+                  [ComposeSource(settings.MINIO_BUCKET, key)])
+    await run(client.remove_object, settings.MINIO_BUCKET, key)
+    return _blob(digest, size, dedup)
+
+
+async def store_blob(chunks: AsyncIterable[bytes], sha256: Optional[str] = None,
+                     skip_stored: bool = False) -> Optional[dict]:
+    # Stores a streamed body as a blob, hashing it on the way through, and
+    # returns _blob(); None if storage is unavailable or the upload failed. A
+    # declared sha256 that does not match the bytes raises ChecksumMismatch;
+    # with skip_stored (the caller may already reference that blob) one that is
+    # stored is not read at all. A body that fits in one part is a single PUT;
+    # anything larger becomes a parallel multipart upload.
+    client = await get_minio_client()
+    if not client:
+        return None
+    if sha256 and skip_stored:
+        size = await blob_size(sha256)
+        if size is not None:
+            return _blob(sha256, size, True)
+    h = hashlib.sha256()
+    it = chunks.__aiter__()
+    head = bytearray()
+    async for chunk in it:
+        head += chunk
+        if len(head) >= part_size():
+            break
+    else:
+        await asyncio.to_thread(h.update, head)
+        digest = h.hexdigest()
+        _check(sha256, digest)
+        try:
+            if await blob_size(digest) is not None:
+                return _blob(digest, len(head), True)
+            await run(lambda: client.put_object(settings.MINIO_BUCKET, blob_key(digest), BytesIO(head),
+                                                length=len(head)))
+            return _blob(digest, len(head), False)
+        except Exception:
+            log.exception("artifact upload failed: %s", digest)
+            return None
+    # The parts of an undeclared body go to a staging key, since its blob key is
+    # only known at the end; a declared one is only completed if it matches and
+    # is not stored yet.
+    key = blob_key(sha256) if sha256 else staging_key()
+    upload_id = await create_upload(key)
+    writer = PartWriter(client, key, upload_id, h)
+    try:
+        await writer.write(head)
+        del head
+        async for chunk in it:
+            await writer.write(chunk)
+        parts = await writer.close()
+        digest = h.hexdigest()
+        _check(sha256, digest)
+        if await blob_size(digest) is not None:
+            await abort_upload(key, upload_id)
+            return _blob(digest, writer.size, True)
+        await run(client._complete_multipart_upload, settings.MINIO_BUCKET, key, upload_id, parts)
+    except ChecksumMismatch:
+        await abort_upload(key, upload_id)
+        raise
     except Exception:
-        return False
+        log.exception("artifact upload failed: %s", key)
+        await abort_upload(key, upload_id)
+        return None
+    except BaseException:
+        await abort_upload(key, upload_id)
+        raise
+    if sha256:
+        return _blob(digest, writer.size, False)
+    return await _place(client, key, digest, writer.size)
+
+
+async def read_object(key: str, offset: int = 0, length: int = 0, chunk: int = 1 << 20) -> AsyncIterator[bytes]:
+    # Streams an object (or length bytes of it from offset; 0 means to the end)
+    # without holding it: each chunk is one read in the storage pool
+    client = await get_minio_client()
+    resp = await run(lambda: client.get_object(settings.MINIO_BUCKET, key, offset=offset, length=length))
+    try:
+        it = resp.stream(chunk)
+        while True:
+            data = await run(next, it, None)
+            if data is None:
+                return
+            yield data
+    finally:
+        resp.close()
+        resp.release_conn()
+
+
+# Resumable uploads: the client opens an upload, sends numbered parts (in any
+# order, in parallel, retrying any that failed), and completes it. The state
+# lives in the object store under the upload ID, so an interrupted upload can
+# be resumed from any replica by listing the parts already stored. Parts go to
+# a staging key; completing hashes the assembled object in the store and moves
+# it to its blob key.
+
+async def create_upload(key: str) -> str:
+    client = await get_minio_client()
+    return await run(client._create_multipart_upload, settings.MINIO_BUCKET, key, {})
+
+
+async def upload_part(key: str, upload_id: str, number: int, data: bytes) -> str:
+    client = await get_minio_client()
+    return await run(client._upload_part, settings.MINIO_BUCKET, key, data, None, upload_id, number)
+
+
+async def list_parts(key: str, upload_id: str) -> List[Part]:
+    client = await get_minio_client()
+    parts: List[Part] = []
+    marker = None
+    while True:
+        page = await run(lambda: client._list_parts(settings.MINIO_BUCKET, key, upload_id,
+                                                    part_number_marker=marker))
+        parts += page.parts
+        if not page.is_truncated:
+            return parts
+        marker = page.next_part_number_marker
+
+
+async def complete_upload(key: str, upload_id: str) -> int:
+    client = await get_minio_client()
+    parts = sorted(await list_parts(key, upload_id), key=lambda p: p.part_number)
+    await run(client._complete_multipart_upload, settings.MINIO_BUCKET, key, upload_id,
+              [Part(p.part_number, p.etag) for p in parts])
+    return sum(p.size or 0 for p in parts)
+
+
+async def complete_blob_upload(key: str, upload_id: str, sha256: Optional[str] = None) -> dict:
+    client = await get_minio_client()
+    size = await complete_upload(key, upload_id)
+    digest = await run(_digest, client, key)
+    if sha256 and sha256 != digest:
+        await run(client.remove_object, settings.MINIO_BUCKET, key)
+        _check(sha256, digest)
+    return await _place(client, key, digest, size)
+
+
+async def abort_upload(key: str, upload_id: str):
+    client = await get_minio_client()
+    try:
+        await run(client._abort_multipart_upload, settings.MINIO_BUCKET, key, upload_id)
+    except Exception as e:
+        log.warning("could not abort upload %s of %s: %s", upload_id, key, e)
+
+
+async def stop():
+    global _client, _failed_at, _lock, _pool
+    _client, _failed_at, _lock = None, None, None
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from typing import Dict, Hashable, Iterable, Optional, Set
+
+HEARTBEAT_S = 15.0
+FOLLOW_BATCH = 500
+TICK_S = 0.25
+
+
+class Broadcaster:
+    # Wake-up fan-out for live readers. Every key has at most one asyncio.Event,
+    # shared by all of its waiters and replaced on each publish, so publishing
+    # costs one dict pop however many viewers there are. Readers pull new data
+    # from the store using their own cursor, in batches of at most FOLLOW_BATCH,
+    # so a slow reader never queues data in memory or holds back a publisher.
+    #
+    # mark() is the coalesced variant for high-rate sources such as metric points:
+    # it only records the key as dirty, and a ticker publishes every dirty key
+    # once per TICK_S, so readers wake at most once per tick. Readers must look
+    # for new data before every wait, since nothing is recorded while no one is
+    # waiting.
+
+    def __init__(self, tick: float = TICK_S):
+        self.tick = tick
+        self._events: Dict[Hashable, asyncio.Event] = {}
+        self._dirty: Set[Hashable] = set()
+        self._ticker: Optional[asyncio.Task] = None
+        self.waiters: Dict[Hashable, int] = {}
+
+    def publish(self, key: Hashable):
+        ev = self._events.pop(key, None)
+        if ev is not None:
+            ev.set()
+
+    def mark(self, key: Hashable):
+        if key in self._events:
+            self._dirty.add(key)
+
+    async def _run_ticker(self):
+        while self._events:
+            await asyncio.sleep(self.tick)
+            dirty, self._dirty = self._dirty, set()
+            for key in dirty:
+                self.publish(key)
+
+    async def wait(self, key: Hashable, timeout: float) -> bool:
+        return await self.wait_any((key,), timeout)
+
+    async def wait_any(self, keys: Iterable[Hashable], timeout: float) -> bool:
+        keys = list(dict.fromkeys(keys))
+        events = []
+        for key in keys:
+            ev = self._events.get(key)
+            if ev is None:
+                ev = self._events[key] = asyncio.Event()
+            events.append(ev)
+            self.waiters[key] = self.waiters.get(key, 0) + 1
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.get_running_loop().create_task(self._run_ticker())
+        tasks = [asyncio.ensure_future(ev.wait()) for ev in events]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            return bool(done)
+        finally:
+            for t in tasks:
+                t.cancel()
+            for key in keys:
+                n = self.waiters[key] - 1
+                if n:
+                    self.waiters[key] = n
+                else:
+                    del self.waiters[key]
+                    self._events.pop(key, None)
+
+    def subscribers(self) -> int:
+        return sum(self.waiters.values())
+
+
+hub = Broadcaster()
+
+
+def sse(event: str, data, event_id=None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
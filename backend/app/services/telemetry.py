@@ -0,0 +1,104 @@
+import time
+from typing import Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+from ..models.memory import RUN_LOGS, RUN_METRICS
+from .streams import hub
+
+# Self-monitoring for the backend, exposed at GET /metrics. Hot paths only touch
+# pre-bound label children, looked up in a plain dict and created once per
+# (route, method) or tenant; store sizes are read at scrape time instead.
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_SECONDS = Histogram(
+    "oneservice_http_request_duration_seconds",
+    "Time until the response starts, by route template",
+    ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+INGESTED_POINTS = Counter("oneservice_ingested_points", "Metric points accepted", ["tenant"])
+INGESTED_LINES = Counter("oneservice_ingested_log_lines", "Log lines accepted", ["tenant"])
+THROTTLED = Counter("oneservice_sdk_throttled", "SDK requests rejected with 429, by the limit hit",
+                    ["tenant", "limit"])
+
+_request_children: Dict[tuple, object] = {}
+_point_children: Dict[str, object] = {}
+_line_children: Dict[str, object] = {}
+_throttle_children: Dict[tuple, object] = {}
+
+
+def points_ingested(tenant: str, n: int):
+    child = _point_children.get(tenant)
+    if child is None:
+        child = _point_children[tenant] = INGESTED_POINTS.labels(tenant)
+    child.inc(n)
+
+
+def lines_ingested(tenant: str, n: int):
+    child = _line_children.get(tenant)
+    if child is None:
+        child = _line_children[tenant] = INGESTED_LINES.labels(tenant)
+    child.inc(n)
+
+
+def throttled(tenant: str, limit: str):
+    key = (tenant, limit)
+    child = _throttle_children.get(key)
+    if child is None:
+        child = _throttle_children[key] = THROTTLED.labels(*key)
+    child.inc()
+
+
+class RequestTimer:
+    # ASGI middleware: observes REQUEST_SECONDS when the response starts, so
+    # SSE/NDJSON streams report time to first byte rather than stream length.
+    # Unmatched paths share one "unmatched" label to bound the cardinality.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                key = (scope["method"], route.path if route is not None else "unmatched")
+                child = _request_children.get(key)
+                if child is None:
+                    child = _request_children[key] = REQUEST_SECONDS.labels(*key)
+                child.observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+class StoreCollector:
+    # Gauges of the in-process run store (all zero on the SQL backend)
+
+    def collect(self):
+        series = 0
+        metric_bytes = 0
+        for by_name in list(RUN_METRICS.values()):
+            series += len(by_name)
+            metric_bytes += sum(s.nbytes() for s in by_name.values())
+        log_bytes = sum(lg.nbytes for lg in list(RUN_LOGS.values()))
+        store = GaugeMetricFamily("oneservice_store_hot_bytes", "Heap bytes held by the run store", labels=["kind"])
+        store.add_metric(["metrics"], metric_bytes)
+        store.add_metric(["logs"], log_bytes)
+        yield store
+        yield GaugeMetricFamily("oneservice_store_series", "Metric series in the run store", value=series)
+        yield GaugeMetricFamily("oneservice_stream_subscribers", "Live SSE readers waiting for data",
+                                value=hub.subscribers())
+
+
+REGISTRY.register(StoreCollector())
+
+
+def exposition() -> bytes:
+    return generate_latest(REGISTRY)
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+from typing import Dict, Optional
+
+from ..core.config import settings
+from ..models.cold import ColdLogChunk, ColdSeries
+from ..models.logs import RunLogs
+from ..models.memory import RUNS, RUN_LOGS, RUN_METRICS
+from ..models.series import MetricSeries
+
+log = logging.getLogger(__name__)
+
+# Spilling starts when a budget is exceeded and stops once usage is back under
+# this fraction of it, so a run at the limit does not spill a sliver every check.
+LOW_WATER = 0.8
+
+_task: Optional[asyncio.Task] = None
+_lock = asyncio.Lock()
+
+
+def series_path(run_id: int, name: str) -> str:
+    digest = hashlib.sha1(name.encode()).hexdigest()[:16]
+    return os.path.join(settings.TIER_DIR, "metrics", str(run_id), digest + ".bin")
+
+
+def chunk_dir(run_id: int, base: int) -> str:
+    return os.path.join(settings.TIER_DIR, "logs", str(run_id), f"{base:012d}")
+
+
+def run_sizes() -> Dict[int, int]:
+    # Hot heap bytes per run (metrics + logs)
+    sizes = {rid: sum(s.nbytes() for s in by_name.values()) for rid, by_name in list(RUN_METRICS.items())}
+    for rid, lg in list(RUN_LOGS.items()):
+        sizes[rid] = sizes.get(rid, 0) + lg.nbytes
+    return sizes
+
+
+async def spill_series(run_id: int, s: MetricSeries) -> int:
+    # Moves all but the newest TIER_HOT_POINTS points to the series' cold file.
+    # The slices are copied on the loop thread; the write runs in a worker.
+    n = len(s.values) - settings.TIER_HOT_POINTS
+    if n <= 0:
+        return 0
+    before = s.nbytes()
+    cold = s.cold or ColdSeries(series_path(run_id, s.name))
+    await asyncio.to_thread(cold.write, s.steps[:n], s.epochs[:n], s.ts[:n], s.values[:n])
+    cold.commit(n)
+    s.spill(cold, n)
+    return before - s.nbytes()
+
+
+async def spill_logs(run_id: int, lg: RunLogs) -> int:
+    # Moves all but the newest TIER_HOT_LINES lines, with their index, to a chunk
+    n = len(lg.msgs) - settings.TIER_HOT_LINES
+    if n <= 0:
+        return 0
+    before = lg.nbytes
+    base, ts, levels, msgs, grams = lg.split_hot(n)
+    directory = chunk_dir(run_id, base)
+    await asyncio.to_thread(ColdLogChunk.write, directory, base, ts, levels, msgs, grams)
+    lg.spill(ColdLogChunk(directory), n)
+    return before - lg.nbytes
+
+
+async def spill_run(run_id: int) -> int:
+    freed = 0
+    for s in list(RUN_METRICS.get(run_id, {}).values()):
+        freed += await spill_series(run_id, s)
+    lg = RUN_LOGS.get(run_id)
+    if lg is not None:
+        freed += await spill_logs(run_id, lg)
+    return freed
+
+
+async def enforce() -> int:
+    # One pass over the budgets; returns the number of hot bytes released.
+    # Victims: finished runs before running ones, then largest first.
+    if not settings.TIER_DIR:
+        return 0
+    async with _lock:
+        sizes = run_sizes()
+        tenant_of = {}
+        usage: Dict[str, int] = {}
+        for rid, b in sizes.items():
+            r = RUNS.get(rid)
+            t = tenant_of[rid] = r["tenant_id"] if r else None
+            usage[t] = usage.get(t, 0) + b
+        total = sum(sizes.values())
+        global_budget = settings.TIER_GLOBAL_MB << 20
+        tenant_budget = settings.TIER_TENANT_MB << 20
+        global_over = bool(global_budget) and total > global_budget
+        tenants_over = {t for t, b in usage.items() if tenant_budget and b > tenant_budget}
+        freed = 0
+        if not global_over and not tenants_over:
+            return 0
+
+        def running(rid):
+            r = RUNS.get(rid)
+            return r is not None and r["status"] == "running"
+
+        for rid in sorted(sizes, key=lambda rid: (running(rid), -sizes[rid])):
+            t = tenant_of[rid]
+            if not global_over and t not in tenants_over:
+                continue
+            n = await spill_run(rid)
+            freed += n
+            total -= n
+            usage[t] -= n
+            if total <= global_budget * LOW_WATER:
+                global_over = False
+            if t in tenants_over and usage[t] <= tenant_budget * LOW_WATER:
+                tenants_over.discard(t)
+            if not global_over and not tenants_over:
+                break
+        if global_over or tenants_over:
+            log.warning("tiering: still over budget after spilling (%d bytes hot)", total)
+        return freed
+
+
+def _prune():
+    # Drops files the restored store does not reference: everything when there is
+    # no WAL, otherwise data spilled after the last snapshot (replay brings it back
+    # into the hot tier).
+    if not settings.WAL_DIR:
+        shutil.rmtree(settings.TIER_DIR, ignore_errors=True)
+        return
+    keep = {s.cold.path for by_name in RUN_METRICS.values() for s in by_name.values() if s.cold}
+    keep.update(c.directory for lg in RUN_LOGS.values() for c in lg.chunks)
+    for kind in ("metrics", "logs"):
+        root = os.path.join(settings.TIER_DIR, kind)
+        if not os.path.isdir(root):
+            continue
+        for run_dir in os.listdir(root):
+            for name in os.listdir(os.path.join(root, run_dir)):
+                path = os.path.join(root, run_dir, name)
+                if path in keep:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+
+
+async def _maintenance_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await enforce()
+        except Exception:
+            log.exception("tiering pass failed")
+
+
+def start():
+    # Call after persistence.start() so restored spill files are kept
+    global _task
+    if not settings.TIER_DIR or settings.DATABASE_URL:
+        return
+    _prune()
+    os.makedirs(settings.TIER_DIR, exist_ok=True)
+    _task = asyncio.get_running_loop().create_task(_maintenance_loop(settings.TIER_CHECK_S))
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
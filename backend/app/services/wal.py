@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..models.series import MetricSeries
+
+log = logging.getLogger(__name__)
+
+# Frame: payload length, crc32 of payload, record sequence number, record kind,
+# then the payload. KIND_JSON payloads are JSON lists; KIND_SERIES payloads are
+# a metric series chunk (see pack_series), so metric ingest never encodes
+# individual points.
+FRAME = struct.Struct("<IIQB")
+KIND_JSON = 0
+KIND_SERIES = 1
+SERIES_HEAD = struct.Struct("<qHI")
+SEGMENT_SUFFIX = ".wal"
+SNAPSHOT_PREFIX = "snapshot-"
+
+
+class NullJournal:
+    # Used when persistence is disabled and while replaying
+    enabled = False
+    seq = 0
+
+    def append(self, record) -> int:
+        return 0
+
+    def append_raw(self, kind: int, data: bytes) -> int:
+        return 0
+
+    async def commit(self):
+        return None
+
+
+class WriteAheadLog:
+    # Append-only, segmented journal of store mutations. append() only encodes
+    # the record into an in-memory buffer; a flusher thread writes the buffer out
+    # every flush_ms (group commit) and fsyncs according to the policy:
+    #   "always"   - fsync every flush; commit() waits for it
+    #   "interval" - fsync at most once per flush interval, commit() returns at once
+    #   "never"    - leave it to the OS page cache
+    enabled = True
+
+    def __init__(self, directory: str, fsync: str = "interval", segment_bytes: int = 64 << 20, flush_ms: int = 50):
+        self.directory = directory
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        self.flush_s = flush_ms / 1000.0
+        self.seq = 0
+        self._buf = bytearray()
+        self._cond = threading.Condition(threading.Lock())
+        self._durable = 0
+        self._waiters: List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._fh = None
+        self._fh_size = 0
+        self._dirty = False  # written to the open segment since its last fsync
+        self._closed = False
+        self._rotate = False
+        self._thread: Optional[threading.Thread] = None
+
+    # --- writing ---
+
+    def start(self, seq: int):
+        self.seq = self._durable = seq
+        self._open_segment(seq + 1)
+        self._thread = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._thread.start()
+
+    def _open_segment(self, first_seq: int):
+        if self._fh is not None:
+            self._fh.close()
+        path = os.path.join(self.directory, f"{first_seq:020d}{SEGMENT_SUFFIX}")
+        self._fh = open(path, "ab")
+        self._fh_size = self._fh.tell()
+
+    def append(self, record) -> int:
+        return self.append_raw(KIND_JSON, json.dumps(record, separators=(",", ":")).encode())
+
+    def append_raw(self, kind: int, data: bytes) -> int:
+        with self._cond:
+            self.seq += 1
+            self._buf += FRAME.pack(len(data), zlib.crc32(data), self.seq, kind)
+            self._buf += data
+            return self.seq
+
+    async def commit(self):
+        # Resolves once everything appended so far is on disk (fsync=always only)
+        if self.fsync != "always":
+            return
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._cond:
+            if self._durable >= self.seq:
+                return
+            self._waiters.append((self.seq, loop, fut))
+            self._cond.notify()
+        await fut
+
+    def _flush_loop(self):
+        last_sync = time.monotonic()
+        while True:
+            with self._cond:
+                # Commit waiters cut the wait short; everything appended while the
+                # previous write/fsync was running goes out together.
+                if not self._closed and not self._waiters:
+                    self._cond.wait(self.flush_s)
+                buf, self._buf = self._buf, bytearray()
+                upto = self.seq
+                closed = self._closed
+            if buf:
+                self._write(buf, upto)
+            # An idle wakeup still syncs a batch written too soon after the last
+            # fsync, so the tail of a burst does not wait for the next append.
+            now = time.monotonic()
+            if self._dirty and (self.fsync == "always" or (self.fsync == "interval" and now - last_sync >= self.flush_s)):
+                os.fsync(self._fh.fileno())
+                self._dirty = False
+                last_sync = now
+            with self._cond:
+                self._durable = upto
+                ready = [w for w in self._waiters if w[0] <= upto]
+                self._waiters = [w for w in self._waiters if w[0] > upto]
+            for _, loop, fut in ready:
+                loop.call_soon_threadsafe(lambda f=fut: f.done() or f.set_result(None))
+            if closed:
+                return
+
+    def rotate(self):
+        # Start a new segment at the next flush so older ones can be dropped once
+        # a snapshot covers them
+        self._rotate = True
+
+    def _write(self, buf: bytearray, upto: int):
+        self._fh.write(buf)
+        self._fh.flush()
+        self._fh_size += len(buf)
+        self._dirty = True
+        if self._fh_size >= self.segment_bytes or self._rotate:
+            self._rotate = False
+            if self.fsync != "never":
+                os.fsync(self._fh.fileno())
+            self._dirty = False
+            self._open_segment(upto + 1)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._fh is not None:
+            if self._dirty and self.fsync != "never":
+                os.fsync(self._fh.fileno())
+            self._fh.close()
+            self._fh = None
+
+    # --- reading ---
+
+    def segments(self) -> List[Tuple[int, str]]:
+        out = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                out.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(self.directory, name)))
+        return sorted(out)
+
+    def replay(self, after_seq: int, apply: Callable[[int, bytes], None]) -> int:
+        # Applies every intact record with seq > after_seq and returns the last seq.
+        # A torn or corrupt frame ends the segment (the tail of an interrupted write).
+        last = after_seq
+        for _, path in self.segments():
+            with open(path, "rb") as f:
+                data = f.read()
+            off = 0
+            while off + FRAME.size <= len(data):
+                size, crc, seq, kind = FRAME.unpack_from(data, off)
+                body = data[off + FRAME.size:off + FRAME.size + size]
+                if len(body) < size or zlib.crc32(body) != crc:
+                    log.warning("wal: truncated record in %s at offset %d", path, off)
+                    break
+                off += FRAME.size + size
+                if seq > last:
+                    apply(kind, body)
+                    last = seq
+        return last
+
+    def drop_segments_before(self, seq: int):
+        # Deletes segments whose records are all <= seq (covered by a snapshot)
+        segs = self.segments()
+        for (first, path), (next_first, _) in zip(segs, segs[1:]):
+            if next_first - 1 <= seq:
+                os.remove(path)
+
+    # --- snapshots ---
+
+    def write_snapshot(self, seq: int, state: Dict):
+        tmp = os.path.join(self.directory, f".{SNAPSHOT_PREFIX}{seq:020d}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{seq:020d}"))
+        for name in os.listdir(self.directory):
+            if name.startswith(SNAPSHOT_PREFIX) and name != f"{SNAPSHOT_PREFIX}{seq:020d}":
+                os.remove(os.path.join(self.directory, name))
+
+    def latest_snapshot(self) -> Tuple[int, Optional[Dict]]:
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith(SNAPSHOT_PREFIX))
+        if not names:
+            return 0, None
+        with open(os.path.join(self.directory, names[-1]), "rb") as f:
+            return int(names[-1][len(SNAPSHOT_PREFIX):]), pickle.load(f)
+
+
+def pack_series(run_id: int, s: MetricSeries, start: int) -> bytes:
+    # Points [start:] of a series as raw column bytes: one memcpy per column.
+    # start must still be in the hot tail (it is: callers pack what they just appended).
+    name = s.name.encode()
+    n = len(s) - start
+    j = start - s.offset
+    return b"".join((
+        SERIES_HEAD.pack(run_id, len(name), n), name,
+        s.steps[j:].tobytes(), s.epochs[j:].tobytes(), s.ts[j:].tobytes(), s.values[j:].tobytes(),
+    ))
+
+
+def unpack_series(body: bytes) -> Tuple[int, str, array, array, array, array]:
+    run_id, name_len, n = SERIES_HEAD.unpack_from(body)
+    off = SERIES_HEAD.size
+    name = body[off:off + name_len].decode()
+    off += name_len
+    cols = []
+    for code in ("q", "q", "d", "d"):
+        col = array(code)
+        col.frombytes(body[off:off + 8 * n])
+        cols.append(col)
+        off += 8 * n
+    return (run_id, name, *cols)
+
+
+journal = NullJournal()
@@ -0,0 +1,43 @@
+import json
+import os
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import file_sd
+
+H = {'Authorization': 'Bearer tok-demo'}
+
+
+def wait_for(path, content):
+    for _ in range(200):
+        if os.path.exists(path) and json.load(open(path)) == content:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f'{path} never reached {content}')
+
+
+def test_register_coalesces_atomic_file_sd_writes(monkeypatch, tmp_path):
+    monkeypatch.setattr(file_sd.settings, 'FILE_SD_DIR', str(tmp_path))
+    monkeypatch.setattr(file_sd.settings, 'FILE_SD_DEBOUNCE_S', 0.05)
+    path = tmp_path / 'acme.json'
+    # targets written before a restart are kept
+    path.write_text(json.dumps([{'labels': {'job': 'node', 'host': 'old'}, 'targets': ['old:9100']}]))
+    writes = []
+    real_write = file_sd._write
+    monkeypatch.setattr(file_sd, '_write', lambda p, body: (writes.append(p), real_write(p, body)))
+    with TestClient(app) as client:
+        for i in range(50):
+            body = {'tenant': 'acme', 'endpoints': [{'job': 'node', 'targets': [f'h{i}:9100'], 'labels': {'host': f'h{i}'}}]}
+            r = client.post('/api/agents/register', json=body, headers=H)
+        assert r.json()['count'] == 51
+        expected = [{'labels': {'job': 'node', 'host': 'old'}, 'targets': ['old:9100']}] + [
+            {'labels': {'job': 'node', 'host': f'h{i}'}, 'targets': [f'h{i}:9100']} for i in range(50)]
+        wait_for(str(path), expected)
+        time.sleep(0.1)
+        n = len(writes)
+        assert 1 <= n <= 5  # coalesced, not one write per check-in
+        # re-registering the same targets does not touch the file
+        client.post('/api/agents/register', json=body, headers=H)
+        time.sleep(0.2)
+        assert len(writes) == n
+    assert not [p for p in os.listdir(tmp_path) if p.endswith('.tmp')]
@@ -15,3 +15,34 @@ def test_login_and_runs():
     r2 = client.get('/api/runs', headers={'Authorization': f'Bearer {token}'})
     assert r2.status_code == 200
     assert isinstance(r2.json(), list)
+
+def test_self_metrics():
+    H = {'Authorization': 'Bearer tok-demo'}
+    rid = client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': 'telemetry'}, headers=H).json()['run_id']
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': 1.0, 'step': i + 1} for i in range(7)], headers=H)
+    client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H)
+    body = client.get('/metrics').text
+    assert 'oneservice_http_request_duration_seconds_count{method="GET",route="/api/runs/{run_id}/metrics"}' in body
+    points = [l for l in body.splitlines() if l.startswith('oneservice_ingested_points_total{tenant="demo"}')]
+    assert points and float(points[0].split()[-1]) >= 7
+    assert 'oneservice_store_series ' in body and 'oneservice_stream_subscribers 0.0' in body
+
+def test_signed_tokens_refresh_and_api_tokens():
+    from app.services import auth
+    login = client.post('/api/auth/login', data={'username': 'demo@oneservice.local', 'password': 'demo123'}).json()
+    bearer = lambda tok: {'Authorization': f'Bearer {tok}'}
+    assert client.get('/api/auth/me', headers=bearer(login['access_token'])).json()['tenant'] == 'demo'
+    assert client.get('/api/auth/me', headers=bearer(login['refresh_token'])).status_code == 401
+    assert client.get('/api/auth/me', headers=bearer(login['access_token'][:-2] + 'xx')).status_code == 401
+    refreshed = client.post('/api/auth/token/refresh', json={'refresh_token': login['refresh_token']}).json()
+    assert client.get('/api/auth/me', headers=bearer(refreshed['access_token'])).status_code == 200
+    assert client.post('/api/auth/token/refresh', json={'refresh_token': login['access_token']}).status_code == 401
+
+    api = client.post('/api/auth/api-token', json={'ttl_days': 30}, headers=bearer(login['access_token'])).json()
+    assert api['expires_in'] == 30 * 86400
+    for days in (0, -1, 366, 10 ** 6):
+        assert client.post('/api/auth/api-token', json={'ttl_days': days}, headers=bearer(login['access_token'])).status_code == 422
+    assert client.get('/api/runs', headers=bearer(api['access_token'])).status_code == 200
+    assert client.post('/api/auth/api-token', headers=bearer(api['access_token'])).status_code == 403
+    user = {'id': 1, 'name': 'x', 'email': 'demo@oneservice.local', 'role': 'TENANT_ADMIN', 'tenant': 'demo'}
+    assert client.get('/api/auth/me', headers=bearer(auth.issue_token(user, 'access', -1))).status_code == 401
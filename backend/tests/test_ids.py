@@ -0,0 +1,24 @@
+from app.services.ids import RunIdAllocator, id_timestamp
+
+
+def test_ids_unique_and_ordered_in_a_burst():
+    alloc = RunIdAllocator(node=3, clock=lambda: 1760000000.0)
+    ids = [alloc.next_id() for _ in range(5000)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert all(i < 2 ** 53 and i & 0b111 == 3 for i in ids)
+    assert abs(id_timestamp(ids[0]) - 1760000000.0) < 0.001
+
+
+def test_ids_follow_clock_and_never_repeat_while_it_moves():
+    now = [1760000000.0]
+    alloc = RunIdAllocator(clock=lambda: now[0])
+    a = alloc.next_id()
+    now[0] += 5
+    b = alloc.next_id()
+    assert b > a and abs(id_timestamp(b) - now[0]) < 0.001
+    # a clock that moves on every call, and then goes back a second
+    ids = []
+    for i in range(2000):
+        now[0] += 0.0001 if i != 1000 else -1
+        ids.append(alloc.next_id())
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
@@ -0,0 +1,72 @@
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+
+H = {'Authorization': 'Bearer tok-demo'}
+
+
+def test_sql_backend_serves_the_same_api(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'DATABASE_URL', f"sqlite+aiosqlite:///{tmp_path / 'runs.db'}")
+    with TestClient(app) as client:
+        login = client.post('/api/auth/login', data={'username': 'demo@oneservice.local', 'password': 'demo123'})
+        auth = {'Authorization': f"Bearer {login.json()['access_token']}"}
+        assert client.get('/api/auth/me', headers=auth).json()['tenant'] == 'demo'
+
+        rids = []
+        for i, exp in enumerate(['A', 'B', 'A']):
+            r = client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': f'r{i}', 'tags': {'exp': exp}}, headers=auth)
+            rids.append(r.json()['run_id'])
+        client.post('/api/sdk/finish', json={'run_id': rids[1], 'status': 'success'}, headers=H)
+        r = client.get('/api/runs', params={'tag.exp': 'A', 'limit': 1}, headers=H)
+        assert [x['id'] for x in r.json()] == [rids[0]] and r.headers['X-Next-Cursor'] == str(rids[0])
+        r = client.get('/api/runs', params={'tag.exp': 'A', 'cursor': rids[0]}, headers=H)
+        assert [x['id'] for x in r.json()] == [rids[2]]
+        assert [x['id'] for x in client.get('/api/runs', params={'status': 'success'}, headers=H).json()] == [rids[1]]
+        assert client.get(f'/api/runs/{rids[1]}', headers=H).json()['tags_json'] == {'exp': 'B'}
+
+        rid = rids[0]
+        r = client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': 1.0 / i, 'step': i} for i in range(1, 1001)], headers=H)
+        assert r.json()['accepted'] == 1000
+        points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points']
+        assert len(points) == 1000 and points[1] == {'step': 2, 'value': 0.5}
+        window = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'max_points': 100}, headers=H).json()
+        assert len(window['series'][0]['points']) == 100
+        # live streams page by key, not by offset
+        from app import repositories
+        repo = repositories.repo
+        client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'grad', 'value': i, 'step': i} for i in range(1, 6)], headers=H)
+        n, key = client.portal.call(repo.series_end, rid, 'grad')
+        client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'grad', 'value': i, 'step': i} for i in range(6, 9)], headers=H)
+        rows, key = client.portal.call(repo.read_points, rid, 'grad', key, 2)
+        assert n == 5 and [r[0] for r in rows] == [6, 7]
+        rows, key = client.portal.call(repo.read_points, rid, 'grad', key, 10)
+        assert [r[0] for r in rows] == [8] and client.portal.call(repo.read_points, rid, 'grad', key, 10) == ([], key)
+        summary = client.get(f'/api/runs/{rid}/summary', headers=H).json()['metrics']['loss']
+        assert (summary['count'], summary['min_step'], summary['max'], summary['last']) == (1000, 1000, 1.0, 0.001)
+        # windows and cursors are applied while reading the rows
+        url = f'/api/runs/{rid}/metrics'
+        window = client.get(url, params={'name': 'loss', 'from': 10, 'to': 12}, headers=H).json()['series'][0]['points']
+        assert [p['step'] for p in window] == [10, 11, 12]
+        since = client.get(url, params={'name': 'loss', 'since_step': 998, 'to': 5}, headers=H).json()['series'][0]
+        assert [p['step'] for p in since['points']] == [] and since['cursor']['step'] == 1000
+        since = client.get(url, params={'name': 'loss', 'since_step': 998}, headers=H).json()['series'][0]
+        assert [p['step'] for p in since['points']] == [999, 1000]
+        compare = client.get('/api/runs/compare', params={'ids': f'{rid},{rids[1]}', 'name': 'loss', 'points': 3}, headers=H).json()
+        assert compare['x'] == [1, 500.5, 1000] and compare['series'][0]['values'][2] == 0.001
+        assert compare['series'][1]['values'] == [None, None, None]
+
+        client.post('/api/sdk/logs:batch', json=[{'run_id': rid, 'level': 'WARN' if i % 3 == 0 else 'INFO', 'msg': f'line {i}', 'ts': i} for i in range(30)], headers=H)
+        body = client.get(f'/api/runs/{rid}/logs', params={'level': 'warn', 'limit': 4}, headers=H).json()
+        assert [x['msg'] for x in body['items']] == ['line 0', 'line 3', 'line 6', 'line 9']
+        rest = client.get(f'/api/runs/{rid}/logs', params={'level': 'warn', 'cursor': body['next_cursor']}, headers=H).json()
+        assert [x['ts'] for x in rest['items']] == [12, 15, 18, 21, 24, 27]
+        assert client.get(f'/api/runs/{rid}/logs', params={'query': 'LINE 2', 'from': 25, 'to': 25}, headers=H).json()['items'] == [
+            {'level': 'INFO', 'msg': 'line 25', 'ts': 25}]
+        client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'lr', 'value': 0.1, 'ts': ts} for ts in (12, 10, 11)], headers=H)
+        lr = client.get(url, params={'name': 'lr', 'from': 2, 'to': 3}, headers=H).json()['series'][0]['points']
+        assert [p['step'] for p in lr] == [2, 3]  # positions count every point
+        lr = client.get(url, params={'name': 'lr', 'by': 'time', 'from': 11, 'to': 12}, headers=H).json()['series'][0]['points']
+        assert [p['time'] for p in lr] == [12, 11]
+        replay = client.post(f'/api/runs/{rid}/replay', json={'from': 10, 'to': 11, 'metrics': ['lr']}, headers=H).text.splitlines()
+        assert [(x['type'], x['ts']) for x in map(json.loads, replay[1:-1])] == [('metric', 10), ('log', 10), ('metric', 11), ('log', 11)]
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import msgpack
+import numpy as np
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models.memory import RUNS
+
+client = TestClient(app)
+H = {'Authorization': 'Bearer tok-demo'}
+
+
+def start_run(name='t-run'):
+    r = client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': name}, headers=H)
+    assert r.status_code == 200
+    return r.json()['run_id']
+
+
+def test_metric_series_by_name():
+    rid = start_run()
+    for i in range(1, 6):
+        client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'loss', 'value': 1.0 / i, 'step': i}, headers=H)
+        client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'acc', 'value': i / 10, 'step': i}, headers=H)
+    r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H)
+    points = r.json()['series'][0]['points']
+    assert [p['step'] for p in points] == [1, 2, 3, 4, 5]
+    assert points[1]['value'] == 0.5
+    r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'missing'}, headers=H)
+    assert r.json()['series'][0]['points'] == []
+
+
+def test_metric_without_step_uses_position():
+    rid = start_run()
+    client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'lr', 'value': 0.1}, headers=H)
+    client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'lr', 'value': 0.2, 'epoch': 7}, headers=H)
+    points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'lr'}, headers=H).json()['series'][0]['points']
+    assert points == [{'step': 1, 'value': 0.1}, {'step': 7, 'value': 0.2}]
+
+
+def test_metric_downsample_and_window():
+    rid = start_run()
+    body = [{'run_id': rid, 'name': 'loss', 'value': float((i % 50) == 0) * 10 + 1.0 / i, 'step': i} for i in range(1, 5001)]
+    client.post('/api/sdk/metrics:batch', json=body, headers=H)
+    for method in ('lttb', 'minmax'):
+        r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'max_points': 200, 'method': method}, headers=H)
+        points = r.json()['series'][0]['points']
+        assert 100 <= len(points) <= 200
+        steps = [p['step'] for p in points]
+        assert steps == sorted(steps)
+        assert max(p['value'] for p in points) > 10
+    r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'max_points': 3, 'method': 'minmax'}, headers=H)
+    points = r.json()['series'][0]['points']
+    assert len(points) == 3 and max(p['value'] for p in points) > 10 and min(p['value'] for p in points) < 0.001
+    r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'from': 100, 'to': 199}, headers=H)
+    points = r.json()['series'][0]['points']
+    assert len(points) == 100 and points[0]['step'] == 100 and points[-1]['step'] == 199
+
+
+def test_list_runs_filters_and_cursor():
+    ids = list(range(1000, 1005))
+    for i, rid in enumerate(ids):
+        RUNS.add({'id': rid, 'tenant_id': 'demo', 'project_id': 1, 'name': f'page-{i}', 'status': 'running',
+                  'framework': 'jax', 'params_json': {}, 'start_ts': 0, 'end_ts': None,
+                  'tags_json': {'sweep': 'S1', 'idx': str(i)}})
+    client.post('/api/sdk/finish', json={'run_id': ids[1], 'status': 'failed'}, headers=H)
+
+    r = client.get('/api/runs', params={'framework': 'jax', 'tag.sweep': 'S1', 'limit': 2}, headers=H)
+    first = r.json()
+    assert len(first) == 2
+    seen = [x['id'] for x in first]
+    while 'X-Next-Cursor' in r.headers:
+        r = client.get('/api/runs', params={'framework': 'jax', 'tag.sweep': 'S1', 'limit': 2,
+                                            'cursor': r.headers['X-Next-Cursor']}, headers=H)
+        seen += [x['id'] for x in r.json()]
+    assert seen == ids
+
+    failed = client.get('/api/runs', params={'status': 'failed', 'tag.sweep': 'S1'}, headers=H).json()
+    assert [x['id'] for x in failed] == [ids[1]]
+    running = client.get('/api/runs', params={'status': 'running', 'tag.idx': '*', 'framework': 'jax'}, headers=H).json()
+    assert ids[1] not in [x['id'] for x in running]
+
+
+def test_log_search_filters_and_cursor():
+    rid = start_run()
+    lines = [{'run_id': rid, 'level': 'WARN' if i % 10 == 0 else 'INFO', 'msg': f'step {i} Grad Norm {i % 7}', 'ts': 1000 + i}
+             for i in range(200)]
+    client.post('/api/sdk/logs:batch', json=lines, headers=H)
+    r = client.get(f'/api/runs/{rid}/logs', params={'query': 'grad norm 3', 'level': 'warn'}, headers=H).json()
+    assert [x['msg'] for x in r['items']] == [f'step {i} Grad Norm 3' for i in range(200) if i % 10 == 0 and i % 7 == 3]
+    r = client.get(f'/api/runs/{rid}/logs', params={'from': 1050, 'to': 1099, 'limit': 30}, headers=H).json()
+    assert len(r['items']) == 30 and r['items'][0]['ts'] == 1050
+    r = client.get(f'/api/runs/{rid}/logs', params={'from': 1050, 'to': 1099, 'cursor': r['next_cursor']}, headers=H).json()
+    assert [x['ts'] for x in r['items']] == list(range(1080, 1100)) and r['next_cursor'] is None
+    assert client.get(f'/api/runs/{rid}/logs', params={'query': 'no such'}, headers=H).json()['items'] == []
+
+
+def test_log_follow_streams_sse_until_run_ends():
+    rid = start_run()
+    client.post('/api/sdk/logs:batch', json=[{'run_id': rid, 'msg': f'line {i}'} for i in range(3)], headers=H)
+    client.post('/api/sdk/finish', json={'run_id': rid}, headers=H)
+    with client.stream('GET', f'/api/runs/{rid}/logs', params={'follow': 'true', 'cursor': 1}, headers=H) as r:
+        assert r.headers['content-type'].startswith('text/event-stream')
+        body = ''.join(r.iter_text())
+    assert 'event: logs' in body and '"line 1"' in body and '"line 0"' not in body
+    assert body.rstrip().split('\n')[-2] == 'event: end'
+    assert client.get('/api/runs/999999999/logs', params={'follow': 'true'}, headers=H).status_code == 404
+
+
+def test_log_follow_ends_when_the_run_is_gone():
+    from app.services import runs as run_svc
+    rid = start_run()
+    RUNS.remove(rid)
+
+    async def frames():
+        return [f async for f in run_svc.follow_logs(rid, None, None, None)]
+
+    body = asyncio.run(asyncio.wait_for(frames(), 1))
+    assert 'event: end' in body[-1] and '"deleted"' in body[-1]
+
+
+def test_log_follow_wakes_on_new_lines():
+    from app.services import runs as run_svc
+    rid = start_run()
+
+    async def scenario():
+        gen = run_svc.follow_logs(rid, None, None, None)
+        nxt = asyncio.ensure_future(gen.__anext__())
+        await asyncio.sleep(0.01)
+        assert not nxt.done()
+        await run_svc.add_log(rid, 'INFO', 'fresh line', None)
+        frame = await asyncio.wait_for(nxt, 1)
+        await gen.aclose()
+        return frame
+
+    assert '"fresh line"' in asyncio.run(scenario())
+
+
+def test_metrics_since_cursor():
+    rid = start_run()
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': i, 'step': i} for i in range(1, 11)], headers=H)
+    r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'since_step': 7}, headers=H).json()['series'][0]
+    assert [p['step'] for p in r['points']] == [8, 9, 10]
+    assert r['cursor']['step'] == 10
+    r = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'since_ts': r['cursor']['ts']}, headers=H).json()['series'][0]
+    assert r['points'] == []
+
+
+def test_metric_stream_coalesces_per_tick():
+    from app.services import runs as run_svc
+    rid = start_run()
+
+    async def scenario():
+        gen = run_svc.follow_metrics([(rid, 'loss'), (rid, 'acc')])
+        nxt = asyncio.ensure_future(gen.__anext__())
+        await asyncio.sleep(0.01)
+        for i in range(50):
+            await run_svc.add_metric(rid, {'name': 'loss', 'value': 1.0 / (i + 1), 'step': i + 1})
+            await run_svc.add_metric(rid, {'name': 'acc', 'value': i / 50, 'step': i + 1})
+        frame = await asyncio.wait_for(nxt, 2)
+        await gen.aclose()
+        return frame
+
+    frame = asyncio.run(scenario())
+    data = json.loads(frame.split('data: ', 1)[1])
+    assert sorted(len(s['points']) for s in data['series']) == [50, 50]
+
+
+def test_compare_aligns_runs_on_shared_axis():
+    a, b = start_run('cmp-a'), start_run('cmp-b')
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': a, 'name': 'loss', 'value': float(i), 'step': i} for i in range(10, 101, 10)], headers=H)
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': b, 'name': 'loss', 'value': 2.0 * i, 'step': i} for i in range(50, 151)], headers=H)
+    r = client.get('/api/runs/compare', params={'ids': f'{a},{b}', 'name': 'loss', 'points': 200}, headers=H).json()
+    assert r['x'] == list(range(10, 151))
+    va, vb = [s['values'] for s in r['series']]
+    assert va[35] == 45.0 and va[91] is None
+    assert vb[39] is None and vb[140] == 300.0
+    smoothed = client.get('/api/runs/compare', params={'ids': [str(a)], 'smooth': 0.5, 'points': 3, 'from': 10, 'to': 30}, headers=H).json()
+    assert smoothed['x'] == [10, 20, 30] and smoothed['series'][0]['values'] == [10.0, 15.0, 22.5]
+    assert client.get('/api/runs/compare', params={'ids': '999999'}, headers=H).status_code == 404
+
+
+def test_summary_tracks_series_without_reading_points():
+    rid = start_run('sum')
+    values = [3.0, 1.0, 4.0, 1.5, 5.0, 9.0, 2.0, 6.0]
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': v, 'step': 10 + i} for i, v in enumerate(values[:5])], headers=H)
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': v, 'step': 15 + i} for i, v in enumerate(values[5:])], headers=H)
+    s = client.get(f'/api/runs/{rid}/summary', headers=H).json()['metrics']['loss']
+    mean = sum(values) / len(values)
+    ema = values[0]
+    for v in values[1:]:
+        ema = 0.9 * ema + 0.1 * v
+    assert (s['count'], s['last'], s['last_step']) == (8, 6.0, 17)
+    assert (s['min'], s['min_step'], s['max'], s['max_step']) == (1.0, 11, 9.0, 15)
+    assert abs(s['mean'] - mean) < 1e-12 and abs(s['var'] - sum((v - mean) ** 2 for v in values) / 8) < 1e-12
+    assert abs(s['ema'] - ema) < 1e-12
+    listed = client.get('/api/runs', params={'summary': 'loss'}, headers=H).json()
+    assert next(r for r in listed if r['id'] == rid)['summary']['loss'] == s
+
+
+def test_metrics_by_time_buckets():
+    rid = start_run('time')
+    t0 = 1_700_000_000  # t0 % 60 == 20
+    # one point every 3s, with a gap leaving the t0+30 bucket empty
+    pts = [{'run_id': rid, 'name': 'gpu', 'value': float(i), 'step': i + 1, 'ts': t0 + 3 * i + (13 if i >= 9 else 0)} for i in range(12)]
+    client.post('/api/sdk/metrics:batch', json=pts, headers=H)
+    get = lambda **p: client.get(f'/api/runs/{rid}/metrics', params={'name': 'gpu', 'by': 'time', **p}, headers=H)
+    assert get().json()['series'][0]['points'][:2] == [{'time': t0, 'value': 0.0}, {'time': t0 + 3, 'value': 1.0}]
+    mean = get(interval='10s', agg='mean').json()['series'][0]['points']
+    assert mean == [{'time': t0 + k, 'value': v} for k, v in ((0, 1.5), (10, 5.0), (20, 7.5), (40, 10.0))]
+    assert [p['value'] for p in get(interval='10s', agg='count').json()['series'][0]['points']] == [4, 3, 2, 3]
+    assert [p['value'] for p in get(interval='10s').json()['series'][0]['points']] == [3, 6, 8, 11]
+    window = get(interval='1m', agg='max', **{'from': t0 + 10, 'to': t0 + 40}).json()['series'][0]['points']
+    assert window == [{'time': t0 - 20, 'value': 8.0}, {'time': t0 + 40, 'value': 9.0}]
+    assert get(interval='10x').status_code == 422
+    assert client.get(f'/api/runs/{rid}/metrics', params={'name': 'gpu', 'interval': '10s'}, headers=H).status_code == 422
+
+
+def test_replay_merges_window_in_time_order():
+    rid = start_run('replay')
+    t0 = 1_700_000_000
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': 1.0 / (i + 1), 'step': i + 1, 'ts': t0 + 2 * i} for i in range(3000)], headers=H)
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'acc', 'value': i / 100, 'step': i + 1, 'ts': t0 + 5 * i + 1} for i in range(100)], headers=H)
+    client.post('/api/sdk/logs:batch', json=[{'run_id': rid, 'msg': f'tick {i}', 'ts': t0 + 3 * i} for i in range(2000)], headers=H)
+    with client.stream('POST', f'/api/runs/{rid}/replay', json={'from': t0 + 100, 'to': t0 + 4100}, headers=H) as r:
+        assert r.headers['content-type'] == 'application/x-ndjson'
+        lines = [json.loads(x) for x in r.iter_lines() if x]
+    head, body, end = lines[0], lines[1:-1], lines[-1]
+    assert head['type'] == 'run' and head['metrics'] == ['acc', 'loss']
+    assert [x['ts'] for x in body] == sorted(x['ts'] for x in body)
+    assert all(t0 + 100 <= x['ts'] <= t0 + 4100 for x in body)
+    kinds = [x['type'] for x in body]
+    assert kinds.count('metric') == end['points'] == 2001 + 80 and kinds.count('log') == end['lines'] == 1333
+    only = client.post(f'/api/runs/{rid}/replay', json={'from': t0, 'to': t0 + 10, 'metrics': ['acc'], 'logs': False}, headers=H)
+    assert [x['value'] for x in map(json.loads, only.text.splitlines()[1:-1])] == [0.0, 0.01]
+    assert client.post('/api/runs/999999/replay', headers=H).status_code == 404
+
+
+def test_replay_orders_out_of_order_timestamps(monkeypatch):
+    from app.services import runs as run_svc
+    monkeypatch.setattr(run_svc, 'REPLAY_BATCH', 7)  # several pages per source
+    rid = start_run('replay-unordered')
+    order = [(i * 37) % 50 for i in range(50)]  # every ts once, out of order
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': t, 'step': i + 1, 'ts': 1000 + t}
+                                                for i, t in enumerate(order)], headers=H)
+    client.post('/api/sdk/logs:batch', json=[{'run_id': rid, 'msg': f'at {t}', 'level': 'WARN' if t % 2 else 'INFO',
+                                              'ts': 1000 + t} for t in order], headers=H)
+    r = client.post(f'/api/runs/{rid}/replay', json={'from': 1005, 'to': 1044, 'level': 'warn'}, headers=H)
+    body = [json.loads(x) for x in r.text.splitlines()[1:-1]]
+    assert [x['ts'] for x in body if x['type'] == 'metric'] == list(range(1005, 1045))
+    assert [x['ts'] for x in body if x['type'] == 'log'] == list(range(1005, 1045, 2))
+    assert [x['ts'] for x in body] == sorted(x['ts'] for x in body)
+
+
+def test_metrics_and_logs_negotiate_columnar_encodings():
+    rid = start_run('encodings')
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': 1.0 / i, 'step': i} for i in range(1, 5001)], headers=H)
+    client.post('/api/sdk/logs:batch', json=[{'run_id': rid, 'msg': f'l{i}', 'ts': i + 1} for i in range(3)], headers=H)
+    url = f'/api/runs/{rid}/metrics'
+    cols = client.get(url, params={'name': 'loss'}, headers={**H, 'Accept': 'application/vnd.oneservice.columns+json', 'Accept-Encoding': 'gzip'})
+    assert cols.headers['content-encoding'] == 'gzip'
+    series = cols.json()['series'][0]
+    assert series['by'] == 'step' and series['x'][:2] == [1, 2] and series['values'][1] == 0.5 and len(series['values']) == 5000
+    packed = client.get(url, params={'name': 'loss', 'max_points': 100}, headers={**H, 'Accept': 'application/msgpack', 'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in packed.headers
+    series = msgpack.unpackb(packed.content)['series'][0]
+    x = np.frombuffer(series['x']['data'], series['x']['dtype'])
+    assert len(x) == 100 and x[0] == 1 and np.frombuffer(series['values']['data'], series['values']['dtype'])[0] == 1.0
+    rows = client.get(url, params={'name': 'loss', 'max_points': 3}, headers=H).json()['series'][0]['points']
+    assert rows[0] == {'step': 1, 'value': 1.0}
+    logs = client.get(f'/api/runs/{rid}/logs', headers={**H, 'Accept': 'application/vnd.oneservice.columns+json'}).json()
+    assert logs['msg'] == ['l0', 'l1', 'l2'] and logs['ts'] == [1, 2, 3] and logs['next_cursor'] is None
+
+
+def test_conditional_get_and_finished_run_cache():
+    from app.services import http_cache
+    rid = start_run('etag')
+    client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': 1.0, 'step': i} for i in range(1, 11)], headers=H)
+    url = f'/api/runs/{rid}/metrics'
+    first = client.get(url, params={'name': 'loss'}, headers=H)
+    tag = first.headers['etag']
+    assert client.get(url, params={'name': 'loss'}, headers={**H, 'If-None-Match': tag}).status_code == 304
+    assert client.get(url, params={'name': 'loss', 'max_points': 5}, headers={**H, 'If-None-Match': tag}).status_code == 200
+    client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'loss', 'value': 2.0, 'step': 11}, headers=H)
+    changed = client.get(url, params={'name': 'loss'}, headers={**H, 'If-None-Match': tag})
+    assert changed.status_code == 200 and changed.headers['etag'] != tag and len(changed.json()['series'][0]['points']) == 11
+
+    client.post('/api/sdk/finish', json={'run_id': rid, 'status': 'success'}, headers=H)
+    cached = len(http_cache.responses._items)
+    body = client.get(url, params={'name': 'loss'}, headers=H).json()
+    assert len(http_cache.responses._items) == cached + 1
+    assert client.get(url, params={'name': 'loss'}, headers=H).json() == body
+    # the cached body of a finished run is not served to another tenant
+    from app.services import auth
+    other = {'id': 7, 'name': 'Eve', 'email': 'eve@other', 'role': 'TENANT_ADMIN', 'tenant': 'other'}
+    OH = {'Authorization': 'Bearer ' + auth.issue_token(other, 'api', 60)}
+    assert client.get(url, params={'name': 'loss'}, headers=OH).status_code == 404
+    assert client.get(url, params={'name': 'loss'}, headers={**OH, 'If-None-Match': tag}).status_code == 404
+    assert client.get(f'/api/runs/{rid}/logs', headers=OH).status_code == 404
+
+    asset = client.get('/api/agents/install.sh')
+    assert asset.status_code == 200
+    assert client.get('/api/agents/install.sh', headers={'If-None-Match': asset.headers['etag']}).status_code == 304
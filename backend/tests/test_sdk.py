@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import json
+import threading
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+H = {'Authorization': 'Bearer tok-demo'}
+
+
+def start_run(name='batch-run'):
+    return client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': name}, headers=H).json()['run_id']
+
+
+def test_metrics_batch_json_reports_bad_points():
+    rid = start_run()
+    body = [{'run_id': rid, 'name': 'loss', 'value': 1.0 / i, 'step': i} for i in range(1, 11)]
+    body[3] = {'run_id': rid, 'name': 'loss', 'value': 'nan?', 'step': 4}
+    body[7] = {'run_id': rid, 'value': 0.1}
+    r = client.post('/api/sdk/metrics:batch', json=body, headers=H)
+    assert r.status_code == 200
+    data = r.json()
+    assert data['accepted'] == 8
+    assert [x['index'] for x in data['rejected']] == [3, 7]
+    points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points']
+    assert [p['step'] for p in points] == [1, 2, 3, 5, 6, 7, 9, 10]
+
+
+def test_logs_batch_ndjson():
+    rid = start_run()
+    lines = [json.dumps({'msg': f'line {i}', 'level': 'INFO'}) for i in range(5)]
+    lines.insert(2, '{not json')
+    r = client.post(f'/api/sdk/logs:batch?run_id={rid}', content='\n'.join(lines) + '\n',
+                    headers={**H, 'Content-Type': 'application/x-ndjson'})
+    data = r.json()
+    assert data['accepted'] == 5
+    assert data['rejected'] == [{'index': 2, 'error': 'invalid json'}]
+    items = client.get(f'/api/runs/{rid}/logs', headers=H).json()['items']
+    assert [x['msg'] for x in items] == [f'line {i}' for i in range(5)]
+
+
+def test_batches_only_write_to_the_tenants_runs():
+    from app.services import auth
+    rid = start_run('owned')
+    other = {'id': 7, 'name': 'Eve', 'email': 'eve@other', 'role': 'TENANT_ADMIN', 'tenant': 'other'}
+    OH = {'Authorization': 'Bearer ' + auth.issue_token(other, 'api', 60)}
+    theirs = client.post('/api/sdk/start', json={'tenant': 'other', 'project': 'p', 'run_name': 'mine'}, headers=OH).json()['run_id']
+    body = [{'run_id': rid, 'name': 'loss', 'value': 1.0}, {'run_id': theirs, 'name': 'loss', 'value': 2.0},
+            {'run_id': 999999999, 'name': 'loss', 'value': 3.0}]
+    r = client.post('/api/sdk/metrics:batch', json=body, headers=OH).json()
+    assert r['accepted'] == 1 and [x['index'] for x in r['rejected']] == [0, 2]
+    r = client.post(f'/api/sdk/logs:batch?run_id={rid}', json=[{'msg': 'injected'}], headers=OH).json()
+    assert r['accepted'] == 0 and r['rejected'][0]['index'] == 0
+    assert client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points'] == []
+    assert 'injected' not in [x['msg'] for x in client.get(f'/api/runs/{rid}/logs', headers=H).json()['items']]
+
+
+def test_batch_rejects_non_array():
+    r = client.post('/api/sdk/metrics:batch', json={'name': 'loss', 'value': 1}, headers=H)
+    assert r.status_code == 400
+
+
+def test_sdk_rate_limits_return_429_with_retry_after(monkeypatch):
+    from app.services import ratelimit
+    rid = start_run('limited')
+    monkeypatch.setattr(ratelimit, 'token_requests', ratelimit.TokenBucket(0.5, 3))
+    codes = [client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'loss', 'value': 1.0}, headers=H).status_code for _ in range(5)]
+    assert codes == [200, 200, 200, 429, 429]
+    r = client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'loss', 'value': 1.0}, headers=H)
+    assert r.status_code == 429 and r.headers['Retry-After'] == '2'
+
+    monkeypatch.setattr(ratelimit, 'token_requests', ratelimit.TokenBucket(0, 0))
+    monkeypatch.setattr(ratelimit, 'tenant_points', ratelimit.TokenBucket(10, 100))
+    batch = [{'run_id': rid, 'name': 'acc', 'value': 0.5, 'step': i + 1} for i in range(100)]
+    assert client.post('/api/sdk/metrics:batch', json=batch, headers=H).status_code == 200
+    assert client.post('/api/sdk/metrics:batch', json=batch[:20], headers=H).status_code == 429
+    assert 'oneservice_sdk_throttled_total{limit="points",tenant="demo"} 1.0' in client.get('/metrics').text
+
+
+class MultipartMinio:
+    # In-memory stand-in for the object store
+    def __init__(self, endpoint, **kw):
+        self.objects, self.uploads, self.in_flight, self.peak = {}, {}, 0, 0
+
+    def bucket_exists(self, bucket):
+        return True
+
+    def stat_object(self, bucket, key):
+        from minio.error import S3Error
+        if key not in self.objects:
+            raise S3Error('NoSuchKey', 'not found', key, '', '', None)
+        return type('Stat', (), {'size': len(self.objects[key])})()
+
+    def get_object(self, bucket, key):
+        data = self.objects[key]
+        return type('Resp', (), {'stream': lambda self, n: iter([data]), 'close': lambda self: None,
+                                 'release_conn': lambda self: None})()
+
+    def put_object(self, bucket, key, data, length):
+        self.objects[key] = data.read()
+
+    def compose_object(self, bucket, key, sources):
+        self.objects[key] = self.objects[sources[0].object_name]
+
+    def remove_object(self, bucket, key):
+        del self.objects[key]
+
+    def _create_multipart_upload(self, bucket, key, headers):
+        upload_id = f'u{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    def _upload_part(self, bucket, key, data, headers, upload_id, number):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        threading.Event().wait(0.01)
+        self.uploads[upload_id][number] = bytes(data)
+        self.in_flight -= 1
+        return f'etag-{number}'
+
+    def _abort_multipart_upload(self, bucket, key, upload_id):
+        del self.uploads[upload_id]
+
+    def _list_parts(self, bucket, key, upload_id, part_number_marker=None):
+        from minio.datatypes import Part
+        parts = [Part(n, f'etag-{n}', size=len(d)) for n, d in sorted(self.uploads[upload_id].items())]
+        return type('Page', (), {'parts': parts, 'is_truncated': False})()
+
+    def _complete_multipart_upload(self, bucket, key, upload_id, parts):
+        assert [p.part_number for p in parts] == sorted(self.uploads[upload_id])
+        stored = self.uploads.pop(upload_id)
+        self.objects[key] = b''.join(stored[p.part_number] for p in parts)
+
+
+def test_artifact_uploads_share_one_client_off_the_event_loop(monkeypatch):
+    from app.services import storage
+    calls = {'clients': 0, 'bucket_checks': 0, 'threads': set()}
+
+    class CountingMinio(MultipartMinio):
+        def __init__(self, endpoint, **kw):
+            super().__init__(endpoint)
+            calls['clients'] += 1
+            assert kw['http_client'] is not None
+
+        def bucket_exists(self, bucket):
+            calls['bucket_checks'] += 1
+            return True
+
+        def put_object(self, bucket, key, data, length):
+            calls['threads'].add(threading.current_thread().name)
+            super().put_object(bucket, key, data, length)
+
+    monkeypatch.setattr(storage, 'Minio', CountingMinio)
+    asyncio.run(storage.stop())
+    rid = start_run('artifacts')
+    for i in range(3):
+        r = client.post('/api/sdk/artifact', params={'run_id': rid}, files={'file': (f'ckpt-{i}.pt', b'weights %d' % i)}, headers=H)
+        assert r.json()['name'] == f'ckpt-{i}.pt'
+    assert calls['clients'] == 1 and calls['bucket_checks'] == 1
+    assert calls['threads'] and all(name.startswith('storage') for name in calls['threads'])
+    asyncio.run(storage.stop())
+
+
+def test_large_artifact_streams_as_parallel_multipart_upload(monkeypatch):
+    from app.services import storage
+    monkeypatch.setattr(storage, 'Minio', MultipartMinio)
+    monkeypatch.setattr(storage.settings, 'STORAGE_PART_MB', 1000 / (1 << 20))
+    monkeypatch.setattr(storage.settings, 'STORAGE_PART_CONCURRENCY', 3)
+    asyncio.run(storage.stop())
+    rid = start_run('big-artifact')
+    data = bytes(range(256)) * 100
+    r = client.post('/api/sdk/artifact', params={'run_id': rid}, files={'file': ('ckpt.pt', data)}, headers=H).json()
+    assert r['size'] == len(data) and r['sha256'] == hashlib.sha256(data).hexdigest()
+    store = storage._client
+    assert store.objects == {r['key']: data} and not store.uploads
+    assert 1 < store.peak <= 3
+    # a raw body works too
+    r = client.post('/api/sdk/artifact', params={'run_id': rid, 'name': 'raw.bin'}, content=data[:500], headers=H)
+    assert store.objects[r.json()['key']] == data[:500]
+    asyncio.run(storage.stop())
+
+
+def test_artifacts_are_stored_once_by_content(monkeypatch):
+    from app.services import storage
+    monkeypatch.setattr(storage, 'Minio', MultipartMinio)
+    monkeypatch.setattr(storage.settings, 'STORAGE_PART_MB', 1000 / (1 << 20))
+    asyncio.run(storage.stop())
+    tokenizer = b'{"vocab": 1}' * 200
+    digest = hashlib.sha256(tokenizer).hexdigest()
+    first, second = start_run('sweep-1'), start_run('sweep-2')
+    assert client.head(f'/api/sdk/artifact/blobs/{digest}', headers=H).status_code == 404
+    r = client.post('/api/sdk/artifact', params={'run_id': first}, files={'file': ('tokenizer.json', tokenizer)}, headers=H).json()
+    assert r['sha256'] == digest and not r['deduplicated']
+    # the same bytes again, streamed without a declared hash, become a reference
+    r = client.post('/api/sdk/artifact', params={'run_id': second, 'name': 'tok.json'}, content=tokenizer, headers=H).json()
+    assert r['deduplicated'] and r['key'] == storage.blob_key(digest)
+    # the SDK can check first and skip the upload entirely
+    assert client.head(f'/api/sdk/artifact/blobs/{digest}', headers=H).status_code == 200
+    r = client.post('/api/sdk/artifact/refs', json={'run_id': second, 'name': 'tokenizer.json', 'sha256': digest}, headers=H)
+    assert r.json()['size'] == len(tokenizer)
+    assert list(storage._client.objects) == [storage.blob_key(digest)]
+    index = client.get(f'/api/runs/{second}/artifacts', headers=H).json()['artifacts']
+    assert index['tokenizer.json'] == {'sha256': digest, 'size': len(tokenizer), 'type': 'application/json',
+                                       'key': storage.blob_key(digest), 'created_at': index['tokenizer.json']['created_at']}
+    assert set(index) == {'tok.json', 'tokenizer.json'}
+    bad = client.post('/api/sdk/artifact', params={'run_id': first, 'name': 'x', 'sha256': '0' * 64}, content=b'x', headers=H)
+    assert bad.status_code == 400
+    # another tenant learns nothing about the blob and has to send the bytes once
+    from app.services import auth
+    other = {'id': 7, 'name': 'Eve', 'email': 'eve@other', 'role': 'TENANT_ADMIN', 'tenant': 'other'}
+    OH = {'Authorization': 'Bearer ' + auth.issue_token(other, 'api', 60)}
+    theirs = client.post('/api/sdk/start', json={'tenant': 'other', 'project': 'p', 'run_name': 'copy'}, headers=OH).json()['run_id']
+    assert client.head(f'/api/sdk/artifact/blobs/{digest}', headers=OH).status_code == 404
+    r = client.post('/api/sdk/artifact/refs', json={'run_id': theirs, 'name': 't.json', 'sha256': digest}, headers=OH)
+    assert r.status_code == 404
+    up = client.post('/api/sdk/artifact/uploads', params={'run_id': theirs, 'name': 't.json', 'sha256': digest}, headers=OH)
+    assert up.json()['exists'] is False
+    client.delete(f"/api/sdk/artifact/uploads/{up.json()['upload_id']}", headers=OH)
+    assert client.post('/api/sdk/artifact', params={'run_id': theirs, 'name': 't.json', 'sha256': digest},
+                       content=b'guess', headers=OH).status_code == 400
+    r = client.post('/api/sdk/artifact', params={'run_id': theirs, 'name': 't.json', 'sha256': digest},
+                    content=tokenizer, headers=OH).json()
+    # stored once, but the flag does not tell them another tenant had it
+    assert not r['deduplicated'] and list(storage._client.objects) == [storage.blob_key(digest)]
+    r = client.post('/api/sdk/artifact', params={'run_id': theirs, 'name': 'copy.json'}, content=tokenizer, headers=OH).json()
+    assert r['deduplicated']  # their own copy now
+    assert client.head(f'/api/sdk/artifact/blobs/{digest}', headers=OH).status_code == 200
+    asyncio.run(storage.stop())
+
+
+def test_resumable_upload_lists_stored_parts(monkeypatch):
+    from app.services import storage
+    monkeypatch.setattr(storage, 'Minio', MultipartMinio)
+    asyncio.run(storage.stop())
+    rid = start_run('resumable')
+    r = client.post('/api/sdk/artifact/uploads', params={'run_id': rid, 'name': 'model.onnx'}, headers=H).json()
+    upload = f"/api/sdk/artifact/uploads/{r['upload_id']}"
+    client.put(f'{upload}/1', content=b'a' * 10, headers=H)
+    client.put(f'{upload}/3', content=b'c' * 5, headers=H)
+    # the connection drops; the client asks what arrived and sends the rest
+    parts = client.get(upload, headers=H).json()['parts']
+    assert [(p['part'], p['size']) for p in parts] == [(1, 10), (3, 5)]
+    client.put(f'{upload}/2', content=b'b' * 10, headers=H)
+    r = client.post(f'{upload}/complete', headers=H).json()
+    data = b'a' * 10 + b'b' * 10 + b'c' * 5
+    assert r['size'] == 25 and r['sha256'] == hashlib.sha256(data).hexdigest()
+    assert storage._client.objects == {r['key']: data}
+    assert client.get(upload[:-1] + '!', headers=H).status_code == 404
+    asyncio.run(storage.stop())
+
+
+def test_upload_handles_are_signed_and_tenant_scoped(monkeypatch):
+    import base64
+    from app.services import auth, storage
+    monkeypatch.setattr(storage, 'Minio', MultipartMinio)
+    asyncio.run(storage.stop())
+    rid = start_run('signed-upload')
+    handle = client.post('/api/sdk/artifact/uploads', params={'run_id': rid, 'name': 'm.pt'}, headers=H).json()['upload_id']
+    # pointing the handle at another object invalidates the signature
+    payload, sig = handle.split('.')
+    fields = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    fields[4] = storage.blob_key('0' * 64)
+    forged = base64.urlsafe_b64encode(json.dumps(fields).encode()).decode().rstrip('=') + '.' + sig
+    assert client.delete(f'/api/sdk/artifact/uploads/{forged}', headers=H).status_code == 404
+    other = {'id': 7, 'name': 'Eve', 'email': 'eve@other', 'role': 'TENANT_ADMIN', 'tenant': 'other'}
+    OH = {'Authorization': 'Bearer ' + auth.issue_token(other, 'api', 60)}
+    assert client.post(f'/api/sdk/artifact/uploads/{handle}/complete', headers=OH).status_code == 403
+    assert client.post('/api/sdk/artifact/uploads', params={'run_id': rid, 'name': 'x'}, headers=OH).status_code == 404
+    assert client.post('/api/sdk/artifact', params={'run_id': rid, 'name': 'x'}, content=b'x', headers=OH).status_code == 404
+    assert client.delete(f'/api/sdk/artifact/uploads/{handle}', headers=H).status_code == 200
+    asyncio.run(storage.stop())
+
+
+def test_artifact_download_ranges_and_cache_on_local_store(monkeypatch, tmp_path):
+    from app.services import artifacts, storage
+    monkeypatch.setattr(storage.settings, 'STORAGE_DIR', str(tmp_path / 'store'))
+    monkeypatch.setattr(storage.settings, 'STORAGE_PART_MB', 1000 / (1 << 20))
+    monkeypatch.setattr(artifacts, 'cache', artifacts.BlobCache(str(tmp_path / 'cache'), 1 << 20))
+    asyncio.run(storage.stop())
+    # one event loop for every request, so the background cache fill keeps running
+    with TestClient(app) as client:
+        rid = client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': 'netron'},
+                          headers=H).json()['run_id']
+        model, graph = bytes(range(256)) * 20, b'{"nodes": []}' * 300
+        for name, data in (('model.onnx', model), ('graph.json', graph)):
+            client.post('/api/sdk/artifact', params={'run_id': rid, 'name': name}, content=data, headers=H)
+        url = f'/api/runs/{rid}/artifacts/model.onnx'
+        r = client.get(url, headers=H)
+        assert r.status_code == 200 and r.content == model
+        assert r.headers['etag'] == f'"{hashlib.sha256(model).hexdigest()}"'
+        assert artifacts.cache.get(hashlib.sha256(model).hexdigest())  # teed into the cache
+        r = client.get(url, headers={**H, 'Range': 'bytes=1000-1099'})
+        assert r.status_code == 206 and r.content == model[1000:1100]
+        assert r.headers['content-range'] == f'bytes 1000-1099/{len(model)}'
+        assert client.get(url, headers={**H, 'Range': 'bytes=-10'}).content == model[-10:]
+        assert client.get(url, headers={**H, 'Range': f'bytes={len(model)}-'}).status_code == 416
+        assert client.get(url, headers={**H, 'If-None-Match': r.headers['etag']}).status_code == 304
+        # a range read of an uncached blob is served from the store and fills the cache behind it
+        r = client.get(f'/api/runs/{rid}/artifacts/graph.json', headers={**H, 'Range': 'bytes=0-12'})
+        assert r.content == b'{"nodes": []}' and r.headers['content-type'] == 'application/json'
+        for _ in range(100):
+            if artifacts.cache.get(hashlib.sha256(graph).hexdigest()):
+                break
+            threading.Event().wait(0.01)
+        assert artifacts.cache.nbytes == len(model) + len(graph)
+        assert client.get(f'/api/runs/{rid}/artifacts/missing.bin', headers=H).status_code == 404
+    asyncio.run(storage.stop())
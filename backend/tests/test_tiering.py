@@ -0,0 +1,102 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.models.memory import RUNS, RUN_LOGS, RUN_METRICS
+from app.services import tiering
+from app.repositories import memory as mem
+from app.services import runs as run_svc
+
+H = {'Authorization': 'Bearer tok-demo'}
+
+
+def fill(rid, points, lines):
+    mem.add_metrics((rid, 'loss', 1.0 / i, i, 0, float(i)) for i in range(1, points + 1))
+    mem.add_logs((rid, 'WARN' if i % 10 == 0 else 'INFO', f'step {i} loss ok', i) for i in range(1, lines + 1))
+
+
+def test_budget_spills_cold_data_and_reads_span_both_tiers(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'TIER_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'TIER_GLOBAL_MB', 1)
+    monkeypatch.setattr(settings, 'TIER_HOT_POINTS', 1000)
+    monkeypatch.setattr(settings, 'TIER_HOT_LINES', 500)
+    rid = asyncio.run(run_svc.create_run('demo', 'long', 'pytorch', {}))
+    fill(rid, 60000, 5000)
+    # Budget only sees this run, so other tests' data stays hot
+    monkeypatch.setattr(tiering, 'RUN_METRICS', {rid: RUN_METRICS[rid]})
+    monkeypatch.setattr(tiering, 'RUN_LOGS', {rid: RUN_LOGS[rid]})
+    assert asyncio.run(tiering.enforce()) > 0
+    s, lg = RUN_METRICS[rid]['loss'], RUN_LOGS[rid]
+    assert s.offset == 59000 and len(s.values) == 1000
+    assert lg.offset == 4500 and len(lg.msgs) == 500
+    assert sum(tiering.run_sizes().values()) <= (1 << 20) * tiering.LOW_WATER
+
+    client = TestClient(app)
+    points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points']
+    assert len(points) == 60000 and points[0] == {'step': 1, 'value': 1.0} and points[-1]['step'] == 60000
+    window = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'from': 58990, 'to': 59010}, headers=H).json()
+    assert [p['step'] for p in window['series'][0]['points']] == list(range(58990, 59011))
+    since = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'since_step': 59998}, headers=H).json()
+    assert [p['step'] for p in since['series'][0]['points']] == [59999, 60000]
+
+    items = client.get(f'/api/runs/{rid}/logs', params={'query': 'step 4499 ', 'level': 'info'}, headers=H).json()['items']
+    assert [x['msg'] for x in items] == ['step 4499 loss ok']
+    body = client.get(f'/api/runs/{rid}/logs', params={'level': 'warn', 'from': 4400, 'to': 4600, 'limit': 15}, headers=H).json()
+    assert [x['ts'] for x in body['items']] == list(range(4400, 4550, 10))
+    RUNS.remove(rid)
+    RUN_METRICS.pop(rid)
+    RUN_LOGS.pop(rid)
+
+
+def test_restart_reopens_spilled_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'WAL_DIR', str(tmp_path / 'wal'))
+    monkeypatch.setattr(settings, 'TIER_DIR', str(tmp_path / 'tier'))
+    monkeypatch.setattr(settings, 'TIER_HOT_POINTS', 10)
+    monkeypatch.setattr(settings, 'TIER_HOT_LINES', 10)
+    with TestClient(app) as client:
+        rid = client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': 'tiered'}, headers=H).json()['run_id']
+        fill(rid, 100, 100)
+        client.portal.call(tiering.spill_run, rid)
+        client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'loss', 'value': 0.005, 'step': 101}, headers=H)
+    RUNS.remove(rid)
+    RUN_METRICS.pop(rid)
+    RUN_LOGS.pop(rid)
+
+    with TestClient(app) as client:
+        s = RUN_METRICS[rid]['loss']
+        assert s.offset == 90 and len(s) == 101
+        points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points']
+        assert [p['step'] for p in points] == list(range(1, 102))
+        logs = client.get(f'/api/runs/{rid}/logs', params={'query': 'step 5 '}, headers=H).json()['items']
+        assert [x['ts'] for x in logs] == [5]
+    RUNS.remove(rid)
+    RUN_METRICS.pop(rid)
+    RUN_LOGS.pop(rid)
+
+
+def test_overflow_spills_at_once_and_windows_read_one_tier(tmp_path, monkeypatch):
+    from app.services import downsample as ds
+    monkeypatch.setattr(settings, 'TIER_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'TIER_HOT_POINTS', 100)
+    monkeypatch.setattr(settings, 'TIER_HOT_LINES', 100)
+    rid = asyncio.run(run_svc.create_run('demo', 'overflow', 'pytorch', {}))
+    fill(rid, 150, 120)
+    asyncio.run(tiering.spill_run(rid))
+    s, lg = RUN_METRICS[rid]['loss'], RUN_LOGS[rid]
+    assert (s.offset, len(s.values), lg.offset, len(lg.msgs)) == (50, 100, 20, 100)
+    # a window inside one tier is a slice of it, nothing is joined
+    joined, concatenate = [], ds.np.concatenate
+    monkeypatch.setattr(ds.np, 'concatenate', lambda arrays: joined.append(1) or concatenate(arrays))
+    client = TestClient(app)
+    for lo, hi in ((10, 20), (120, 130)):
+        for by, params in (('step', {'from': lo, 'to': hi}), ('time', {'by': 'time', 'from': lo, 'to': hi})):
+            body = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', **params}, headers=H).json()
+            assert [p[by] for p in body['series'][0]['points']] == list(range(lo, hi + 1))
+    since = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'since_step': 147}, headers=H).json()
+    assert [p['step'] for p in since['series'][0]['points']] == [148, 149, 150]
+    assert not joined
+    body = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss', 'from': 45, 'to': 55}, headers=H).json()
+    assert [p['step'] for p in body['series'][0]['points']] == list(range(45, 56)) and joined
+    RUNS.remove(rid)
+    RUN_METRICS.pop(rid)
+    RUN_LOGS.pop(rid)
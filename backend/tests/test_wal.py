@@ -0,0 +1,90 @@
+import json
+import os
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.models.memory import RUNS, RUN_ARTIFACTS, RUN_LOGS, RUN_METRICS
+from app.services import persistence, wal
+from app.services.wal import NullJournal, WriteAheadLog
+
+H = {'Authorization': 'Bearer tok-demo'}
+
+
+def forget(rid):
+    RUNS.remove(rid)
+    RUN_METRICS.pop(rid, None)
+    RUN_LOGS.pop(rid, None)
+    RUN_ARTIFACTS.pop(rid, None)
+
+
+def test_restart_restores_runs_from_snapshot_and_wal(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'WAL_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'WAL_FSYNC', 'always')
+    monkeypatch.setattr(settings, 'STORAGE_DIR', str(tmp_path / 'store'))
+    with TestClient(app) as client:
+        rid = client.post('/api/sdk/start', json={'tenant': 'demo', 'project': 'p', 'run_name': 'durable'}, headers=H).json()['run_id']
+        client.post('/api/sdk/metrics:batch', json=[{'run_id': rid, 'name': 'loss', 'value': 1.0 / i, 'step': i} for i in range(1, 101)], headers=H)
+        client.post('/api/sdk/log', json={'run_id': rid, 'msg': 'checkpoint saved'}, headers=H)
+        client.post('/api/sdk/artifact', params={'run_id': rid, 'name': 'config.json'}, content=b'{}', headers=H)
+    forget(rid)
+
+    # Second life: restored from the shutdown snapshot; new writes only reach the
+    # WAL because the process "crashes" instead of snapshotting on shutdown
+    async def crash():
+        w = wal.journal
+        wal.journal = NullJournal()
+        w.close()
+
+    monkeypatch.setattr(persistence, 'stop', crash)
+    with TestClient(app) as client:
+        points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points']
+        assert len(points) == 100 and points[-1] == {'step': 100, 'value': 0.01}
+        client.post('/api/sdk/metric', json={'run_id': rid, 'name': 'loss', 'value': 0.005, 'step': 101}, headers=H)
+        client.post('/api/sdk/artifact', params={'run_id': rid, 'name': 'model.pt'}, content=b'weights', headers=H)
+        client.post('/api/sdk/finish', json={'run_id': rid, 'status': 'success'}, headers=H)
+    forget(rid)
+
+    with TestClient(app) as client:
+        r = client.get(f'/api/runs/{rid}', headers=H).json()
+        assert r['status'] == 'success'
+        points = client.get(f'/api/runs/{rid}/metrics', params={'name': 'loss'}, headers=H).json()['series'][0]['points']
+        assert len(points) == 101
+        logs = client.get(f'/api/runs/{rid}/logs', params={'query': 'checkpoint'}, headers=H).json()['items']
+        assert [x['msg'] for x in logs] == ['checkpoint saved']
+        # one artifact from the snapshot, one from the WAL, and both readable
+        index = client.get(f'/api/runs/{rid}/artifacts', headers=H).json()['artifacts']
+        assert sorted(index) == ['config.json', 'model.pt']
+        assert client.get(f'/api/runs/{rid}/artifacts/model.pt', headers=H).content == b'weights'
+
+
+def test_replay_stops_at_torn_record(tmp_path):
+    w = WriteAheadLog(str(tmp_path), fsync='never', flush_ms=1)
+    w.start(0)
+    for i in range(3):
+        w.append(['logs', [[1, 'INFO', f'm{i}', 1]]])
+    w.close()
+    (_, path), = w.segments()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+    seen = []
+    assert WriteAheadLog(str(tmp_path)).replay(0, lambda kind, body: seen.append(json.loads(body))) == 2
+    assert [r[1][0][2] for r in seen] == ['m0', 'm1']
+
+
+def test_interval_fsync_reaches_the_last_batch(tmp_path, monkeypatch):
+    import threading
+    from types import SimpleNamespace
+    clock, synced = [0.0], []
+    monkeypatch.setattr(wal, 'time', SimpleNamespace(monotonic=lambda: clock[0]))
+    monkeypatch.setattr(wal.os, 'fsync', lambda fd: synced.append(os.fstat(fd).st_size))
+    w = WriteAheadLog(str(tmp_path), fsync='interval', flush_ms=5)
+    w.start(0)
+    w.append(['logs', [[1, 'INFO', 'last words', 1]]])
+    threading.Event().wait(0.05)
+    assert synced == []  # written, but within the interval of the start
+    clock[0] = 1.0
+    threading.Event().wait(0.05)  # no further appends: an idle wakeup syncs it
+    (_, path), = w.segments()
+    assert synced == [os.path.getsize(path)]
+    w.close()
+    assert len(synced) == 1  # nothing left to sync on close
@@ -1,4 +1,6 @@
--- Minimal schema demo (not used by in-memory MVP yet)
+-- Schema of the SQL run repository (backend/app/models/tables.py), used when the
+-- backend runs with DATABASE_URL=postgresql+asyncpg://...; the backend also
+-- creates missing tables itself on startup.
 CREATE TABLE IF NOT EXISTS tenants(
   id SERIAL PRIMARY KEY,
   name TEXT UNIQUE NOT NULL,
@@ -9,8 +11,84 @@ CREATE TABLE IF NOT EXISTS users(
   id SERIAL PRIMARY KEY,
   tenant_id INT REFERENCES tenants(id),
   email TEXT UNIQUE NOT NULL,
+  name TEXT NOT NULL DEFAULT '',
   hash_pwd TEXT NOT NULL,
   role TEXT NOT NULL,
   is_active BOOLEAN DEFAULT TRUE
 );
+-- tenant_id is the tenant name, as in the API's run records
+CREATE TABLE IF NOT EXISTS runs(
+  id BIGINT PRIMARY KEY,
+  tenant_id TEXT NOT NULL,
+  project_id INT,
+  name TEXT NOT NULL,
+  status TEXT NOT NULL,
+  framework TEXT NOT NULL,
+  params_json JSON,
+  start_ts BIGINT,
+  end_ts BIGINT,
+  tags_json JSON
+);
+CREATE INDEX IF NOT EXISTS ix_runs_tenant ON runs(tenant_id, id);
+CREATE INDEX IF NOT EXISTS ix_runs_tenant_status ON runs(tenant_id, status, id);
+CREATE INDEX IF NOT EXISTS ix_runs_tenant_framework ON runs(tenant_id, framework, id);
+CREATE TABLE IF NOT EXISTS run_tags(
+  run_id BIGINT NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+  tenant_id TEXT NOT NULL,
+  key TEXT NOT NULL,
+  value TEXT NOT NULL,
+  PRIMARY KEY (run_id, key)
+);
+CREATE INDEX IF NOT EXISTS ix_run_tags_lookup ON run_tags(tenant_id, key, value, run_id);
+CREATE TABLE IF NOT EXISTS metrics(
+  id BIGSERIAL PRIMARY KEY,
+  run_id BIGINT NOT NULL,
+  name TEXT NOT NULL,
+  step BIGINT NOT NULL,
+  epoch BIGINT NOT NULL,
+  ts DOUBLE PRECISION NOT NULL,
+  value DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_metrics_series ON metrics(run_id, name, id);
+CREATE INDEX IF NOT EXISTS ix_metrics_series_ts ON metrics(run_id, name, ts, id);
+-- Running aggregates per series, updated with each batch of points
+CREATE TABLE IF NOT EXISTS metric_summaries(
+  run_id BIGINT NOT NULL,
+  name TEXT NOT NULL,
+  count BIGINT NOT NULL,
+  last DOUBLE PRECISION NOT NULL,
+  last_step BIGINT NOT NULL,
+  min DOUBLE PRECISION NOT NULL,
+  min_step BIGINT NOT NULL,
+  max DOUBLE PRECISION NOT NULL,
+  max_step BIGINT NOT NULL,
+  mean DOUBLE PRECISION NOT NULL,
+  m2 DOUBLE PRECISION NOT NULL,
+  ema DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS logs(
+  id BIGSERIAL PRIMARY KEY,
+  run_id BIGINT NOT NULL,
+  level TEXT NOT NULL,
+  msg TEXT NOT NULL,
+  ts BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_logs_run ON logs(run_id, id);
+CREATE INDEX IF NOT EXISTS ix_logs_run_ts ON logs(run_id, ts);
+CREATE TABLE IF NOT EXISTS artifacts(
+  id BIGSERIAL PRIMARY KEY,
+  run_id BIGINT NOT NULL,
+  name TEXT,
+  key TEXT NOT NULL,
+  size BIGINT NOT NULL,
+  checksum TEXT,
+  type TEXT,
+  created_at DOUBLE PRECISION NOT NULL
+);
+ALTER TABLE artifacts ADD COLUMN IF NOT EXISTS name TEXT;
+ALTER TABLE artifacts ADD COLUMN IF NOT EXISTS checksum TEXT;
+ALTER TABLE artifacts ADD COLUMN IF NOT EXISTS type TEXT;
+CREATE INDEX IF NOT EXISTS ix_artifacts_run ON artifacts(run_id, id);
+CREATE INDEX IF NOT EXISTS ix_artifacts_checksum ON artifacts(checksum);
 INSERT INTO tenants(name) VALUES('demo') ON CONFLICT DO NOTHING;